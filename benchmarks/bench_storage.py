@@ -0,0 +1,95 @@
+'''
+    Write-behind SQLiteStateStorage against naive per-transition commits.
+
+    python -m benchmarks.bench_storage --entities 1000 --transitions 20000
+'''
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from fsm.FSM import FysomGlobal, FysomGlobalMixin
+from fsm.SQLiteStateStorage import SQLiteStateStorage
+
+
+def _make_model(storage):
+    class Model(FysomGlobalMixin, object):
+        GSM = FysomGlobal(
+            events=[('warn', 'green', 'yellow'),
+                    ('clear', 'yellow', 'green')],
+            initial='green',
+            state_field='state',
+            storage=storage
+        )
+
+        def __init__(self, id):
+            self.id = id
+            self.state = None
+            super(Model, self).__init__()
+
+    return Model
+
+
+def _measure(path, entities, transitions, **storageKwargs):
+    storage = SQLiteStateStorage(path, **storageKwargs)
+    Model = _make_model(storage)
+    models = [Model(i) for i in range(entities)]
+    storage.flush()
+
+    start = time.time()
+    for i in range(transitions):
+        model = models[i % entities]
+        if model.current == 'green':
+            model.warn()
+        else:
+            model.clear()
+    storage.close()
+    elapsed = time.time() - start
+
+    rehydrated = {model.id: model for model in models}
+    for model in models:
+        model.state = None
+    storage = SQLiteStateStorage(path)
+    Model.GSM._storage = storage
+    start = time.time()
+    Model.GSM.rehydrate(rehydrated)
+    loadElapsed = time.time() - start
+    storage.close()
+
+    return {
+        'transitions_per_sec': transitions / elapsed if elapsed else float('inf'),
+        'elapsed': elapsed,
+        'rehydrate_elapsed': loadElapsed,
+    }
+
+
+def run(entities=1000, transitions=20000, flush_interval=50, flush_every=1000):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        return {
+            'naive': _measure(os.path.join(tmpdir, 'naive.db'), entities, transitions,
+                              flush_interval=0, flush_every=1),
+            'batched': _measure(os.path.join(tmpdir, 'batched.db'), entities, transitions,
+                                flush_interval=flush_interval, flush_every=flush_every),
+        }
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--entities', type=int, default=1000)
+    parser.add_argument('--transitions', type=int, default=20000)
+    parser.add_argument('--flush-interval', type=int, default=50, help='ms')
+    parser.add_argument('--flush-every', type=int, default=1000)
+    args = parser.parse_args(argv)
+    results = run(args.entities, args.transitions, args.flush_interval, args.flush_every)
+    json.dump(results, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+'''
+    Uniform adapters over the machine engines for the benchmark suite.
+
+    Every adapter builds a ring machine of "size" states (s0 -> s1 -> ... -> s0
+    on the "next" event) and implements the benchmark scenarios:
+    construct, dispatch, poll, callbacks and teardown.
+'''
+import importlib
+
+
+def _stateName(i):
+    return 's{}'.format(i)
+
+
+def _never():
+    return False
+
+
+class EngineUnavailable(Exception):
+    pass
+
+
+class Engine(object):
+    name = None
+
+    def __init__(self, size):
+        self.size = size
+
+    def build(self):
+        raise NotImplementedError
+
+    def buildWithCallbacks(self, counter):
+        raise NotImplementedError
+
+    def factory(self):
+        '''
+            Returns a callable building machines which share everything the
+            engine can share between instances (used by the memory benchmark).
+        '''
+        return self.build
+
+    def dispatch(self, machine):
+        raise NotImplementedError
+
+    def poll(self, machine):
+        raise EngineUnavailable('{} has no condition polling'.format(self.name))
+
+    def teardown(self, machine):
+        pass
+
+
+class FSMEngine(Engine):
+    name = 'FSM'
+
+    def __init__(self, size):
+        super(FSMEngine, self).__init__(size)
+        from fsm.FSM import FSM, FSMState
+        self.FSM = FSM
+        self.FSMState = FSMState
+        self.transitions = [
+            {'event': 'next', 'src': _stateName(i), 'dst': _stateName((i + 1) % size)}
+            for i in range(size)
+        ]
+        self.transitions.append({'src': '*', 'dst': 'idle', 'condition': 'never'})
+
+    def __config(self, states):
+        return {
+            'initial': {'state': _stateName(0)},
+            'transitions': self.transitions,
+            'conditions': {'never': _never},
+            'states': states,
+        }
+
+    def build(self):
+        return self.FSM(self.__config([]))
+
+    def buildWithCallbacks(self, counter):
+        FSMState = self.FSMState
+
+        class CountingState(FSMState):
+            def enter(self, prevState, eventData):
+                counter[0] += 1
+
+            def leave(self, eventData):
+                counter[0] += 1
+
+        return self.FSM(self.__config([CountingState(_stateName(i)) for i in range(self.size)]))
+
+    def dispatch(self, machine):
+        machine.addEvent('next')
+
+    def poll(self, machine):
+        machine.update(0.0)
+
+    def teardown(self, machine):
+        machine.fini()
+
+
+class FysomEngine(Engine):
+    name = 'Fysom'
+
+    def __init__(self, size):
+        super(FysomEngine, self).__init__(size)
+        from fsm.FSM import Fysom
+        self.Fysom = Fysom
+        self.events = [
+            {'name': 'next', 'src': _stateName(i), 'dst': _stateName((i + 1) % size)}
+            for i in range(size)
+        ]
+
+    def build(self):
+        return self.Fysom({'initial': _stateName(0), 'events': self.events})
+
+    def buildWithCallbacks(self, counter):
+        def callback(e):
+            counter[0] += 1
+
+        return self.Fysom({'initial': _stateName(0), 'events': self.events, 'callbacks': {
+            'onbeforenext': callback,
+            'onchangestate': callback,
+            'onafternext': callback,
+        }})
+
+    def dispatch(self, machine):
+        machine.next()
+
+
+class FysomGlobalEngine(Engine):
+    name = 'FysomGlobal'
+
+    def __init__(self, size):
+        super(FysomGlobalEngine, self).__init__(size)
+        from fsm.FSM import FysomGlobal, FysomGlobalMixin
+        self.FysomGlobal = FysomGlobal
+        self.FysomGlobalMixin = FysomGlobalMixin
+        # FysomGlobal keeps a single transition per event name,
+        # so every state of the ring gets its own "next" event.
+        self.nextEvents = {}
+        self.events = []
+        for i in range(size):
+            event = 'next{}'.format(i)
+            self.nextEvents[_stateName(i)] = event
+            self.events.append({'name': event, 'src': _stateName(i), 'dst': _stateName((i + 1) % size)})
+
+    def __modelClass(self, callbacks):
+        class Model(self.FysomGlobalMixin, object):
+            GSM = self.FysomGlobal(events=self.events, initial=_stateName(0),
+                                   state_field='state', callbacks=callbacks)
+
+            def __init__(self):
+                self.state = None
+                super(Model, self).__init__()
+
+        return Model
+
+    def build(self):
+        return self.__modelClass(None)()
+
+    def factory(self):
+        return self.__modelClass(None)
+
+    def buildWithCallbacks(self, counter):
+        def callback(e):
+            counter[0] += 1
+
+        callbacks = {'onchangestate': callback}
+        for event in self.nextEvents.values():
+            callbacks['onbefore' + event] = callback
+            callbacks['onafter' + event] = callback
+        return self.__modelClass(callbacks)()
+
+    def dispatch(self, machine):
+        machine.GSM.trigger(machine, self.nextEvents[machine.state])
+
+
+class FiniteStateMachineEngine(Engine):
+    name = 'FiniteStateMachine'
+
+    def __init__(self, size):
+        super(FiniteStateMachineEngine, self).__init__(size)
+        module = _import('fsm.FiniteStateMachine')
+        self.module = module
+
+    def __machine(self, callback):
+        module = self.module
+        states = []
+        for i in range(self.size):
+            state = module.FiniteStateMachineState()
+            state.init(stateId=i)
+            states.append(state)
+        machine = module.FiniteStateMachineFactory.create(states[0], *states[1:])
+        if self.size > 1:
+            for i in range(self.size):
+                machine.addTransition(states[i], _never, states[(i + 1) % self.size], callback)
+        return machine
+
+    def build(self):
+        return self.__machine(None)
+
+    def buildWithCallbacks(self, counter):
+        def callback():
+            counter[0] += 1
+
+        return self.__machine(callback)
+
+    def dispatch(self, machine):
+        machine.forceTransitById((machine.currentStateIndex() + 1) % self.size)
+
+    def poll(self, machine):
+        machine.update(0.0)
+
+    def teardown(self, machine):
+        machine.kill()
+
+
+class SfmEngine(Engine):
+    name = 'Sfm'
+
+    def __init__(self, size):
+        super(SfmEngine, self).__init__(size)
+        self.module = _import('fsm._fsm')
+
+    def build(self):
+        return self.module.Sfm({
+            'init_state': _stateName(0),
+            'transitions': [
+                {'source': _stateName(i), 'dest': _stateName((i + 1) % self.size), 'event': 'next'}
+                for i in range(self.size)
+            ],
+        })
+
+    def buildWithCallbacks(self, counter):
+        raise EngineUnavailable('Sfm has no transition callbacks')
+
+    def dispatch(self, machine):
+        machine.addEvent('next')
+
+    def teardown(self, machine):
+        machine.fini()
+
+
+def _import(moduleName):
+    try:
+        return importlib.import_module(moduleName)
+    except Exception as err:
+        raise EngineUnavailable('{}: {}: {}'.format(moduleName, type(err).__name__, err))
+
+
+ENGINES = [FSMEngine, FysomEngine, FysomGlobalEngine, FiniteStateMachineEngine, SfmEngine]
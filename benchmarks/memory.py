@@ -0,0 +1,144 @@
+'''
+    Per-instance memory footprint of the engines.
+
+    python -m benchmarks.memory --output memory.json
+    python -m benchmarks.memory --budgets benchmarks/memory_budgets.json
+
+    Memory is measured with tracemalloc: the bytes still allocated after
+    building "instances" machines (divided by their count) is the cost of one
+    instance; dividing it by the machine size gives the cost per state. Cases
+    allocating less than _MIN_TRACED bytes in total are measured again with
+    more instances, so the fixed allocations of a run (list growth, caches)
+    don't dominate the result of small instances.
+    Budgets map "engine/size" to the allowed bytes per instance; the run
+    fails (exit code 1) if any of them is exceeded.
+'''
+import argparse
+import gc
+import json
+import platform
+import sys
+import tracemalloc
+
+from benchmarks.engines import ENGINES, EngineUnavailable
+
+DEFAULT_SIZES = (5, 50, 500, 5000)
+
+_MIN_TRACED = 1 << 20  # bytes
+_MAX_INSTANCES = 200000
+
+
+def _count(size, instances):
+    # keep the number of allocated states roughly constant
+    return max(2, min(instances, instances * 50 // size))
+
+
+def _traced(factory, count):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        machines = [factory() for _ in range(count)]
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del machines
+    return after - before
+
+
+def measureCase(engineClass, size, instances=1000):
+    engine = engineClass(size)
+    count = _count(size, instances)
+    factory = engine.factory()
+    factory()  # warm up caches and interned strings
+
+    traced = _traced(factory, count)
+    if traced < _MIN_TRACED and count < _MAX_INSTANCES:
+        count = min(_MAX_INSTANCES, count * _MIN_TRACED // max(traced, 1) + 1)
+        traced = _traced(factory, count)
+
+    perInstance = traced / float(count)
+    return {
+        'instances': count,
+        'bytes_per_instance': perInstance,
+        'bytes_per_state': perInstance / size,
+    }
+
+
+def run(engines=None, sizes=DEFAULT_SIZES, instances=1000, log=None):
+    results = {}
+    for engineClass in ENGINES:
+        if engines and engineClass.name not in engines:
+            continue
+        for size in sizes:
+            key = '{}/{}'.format(engineClass.name, size)
+            try:
+                results[key] = measureCase(engineClass, size, instances)
+            except EngineUnavailable as err:
+                results[key] = {'skipped': str(err)}
+            if log is not None:
+                log.write('{:<32} {}\n'.format(key, _format(results[key])))
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+
+def _format(result):
+    if 'skipped' in result:
+        return 'skipped ({})'.format(result['skipped'])
+    return '{:12.0f} B/instance {:10.1f} B/state'.format(result['bytes_per_instance'], result['bytes_per_state'])
+
+
+def checkBudgets(results, budgets):
+    '''
+        Returns a list of (case, budget, measured bytes per instance) of the
+        exceeded budgets.
+    '''
+    exceeded = []
+    for key, budget in sorted(budgets.items()):
+        result = results.get('results', {}).get(key)
+        if result and 'bytes_per_instance' in result and result['bytes_per_instance'] > budget:
+            exceeded.append((key, budget, result['bytes_per_instance']))
+    return exceeded
+
+
+def _csv(value, cast=str):
+    return [cast(item) for item in value.split(',') if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--engines', type=_csv, default=None, help='comma separated engine names')
+    parser.add_argument('--sizes', type=lambda value: _csv(value, int), default=list(DEFAULT_SIZES))
+    parser.add_argument('--instances', type=int, default=1000)
+    parser.add_argument('--output', help='write JSON results to the file')
+    parser.add_argument('--budgets', help='JSON file mapping "engine/size" to bytes per instance')
+    args = parser.parse_args(argv)
+
+    results = run(args.engines, args.sizes, args.instances, log=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(results, fd, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if args.budgets:
+        with open(args.budgets) as fd:
+            budgets = json.load(fd)
+        exceeded = checkBudgets(results, budgets)
+        for key, budget, measured in exceeded:
+            sys.stderr.write('OVER BUDGET {}: {:.0f} > {} bytes per instance\n'.format(key, measured, budget))
+        if exceeded:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
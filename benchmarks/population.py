@@ -0,0 +1,145 @@
+'''
+    Vectorized population update against per-object polling.
+
+    python -m benchmarks.population --sizes 10000,100000,1000000 --output population.json
+
+    Both sides run the same guard expressions: Population.update() evaluates
+    them once per tick over NumPy columns, the per-object side calls
+    FSM.update() of one machine per entity. Per-object polling is skipped
+    above --object-limit entities to bound the memory use.
+'''
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+DEFAULT_SIZES = (10 ** 4, 10 ** 5, 10 ** 6)
+
+CONFIG = {
+    'initial': {'state': 'patrol'},
+    'transitions': [
+        {'src': 'patrol', 'dst': 'chase', 'condition': 'ctx.distance < 10 and ctx.hp >= 30'},
+        {'src': ['patrol', 'chase'], 'dst': 'flee', 'condition': 'ctx.hp < 30', 'priority': 1},
+        {'src': 'chase', 'dst': 'patrol', 'condition': 'ctx.distance > 20'},
+        {'src': 'flee', 'dst': 'patrol', 'condition': 'ctx.hp > 80'},
+    ],
+}
+
+
+class _Context(object):
+    __slots__ = ('hp', 'distance')
+
+
+def _columns(numpy, size, seed):
+    rng = numpy.random.RandomState(seed)
+    return {'hp': rng.randint(0, 100, size), 'distance': rng.uniform(0, 30, size)}
+
+
+def _best(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = _clock()
+        fn()
+        elapsed = _clock() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def measurePopulation(numpy, size, ticks, repeat, seed=0):
+    from fsm.Population import Population
+
+    population = Population(CONFIG, _columns(numpy, size, seed))
+
+    def fn():
+        for _ in range(ticks):
+            population.update()
+    return _best(fn, repeat) / (ticks * size) * 1e9
+
+
+def measureObjects(numpy, size, ticks, repeat, seed=0):
+    from fsm.FSM import FSM
+
+    columns = _columns(numpy, size, seed)
+    machines = []
+    for hp, distance in zip(columns['hp'].tolist(), columns['distance'].tolist()):
+        ctx = _Context()
+        ctx.hp, ctx.distance = hp, distance
+        machines.append(FSM(dict(CONFIG, context=ctx)))
+
+    def fn():
+        for _ in range(ticks):
+            for fsm in machines:
+                fsm.update(0)
+    return _best(fn, repeat) / (ticks * size) * 1e9
+
+
+def run(sizes=DEFAULT_SIZES, ticks=5, repeat=3, objectLimit=10 ** 5, log=None):
+    try:
+        import numpy
+    except ImportError:
+        return {'skipped': 'numpy is not installed'}
+
+    results = {}
+    for size in sizes:
+        result = {'population_ns_per_entity': measurePopulation(numpy, size, ticks, repeat)}
+        if size <= objectLimit:
+            result['objects_ns_per_entity'] = measureObjects(numpy, size, ticks, repeat)
+            result['speedup'] = result['objects_ns_per_entity'] / result['population_ns_per_entity']
+        else:
+            result['objects_ns_per_entity'] = None
+        results[str(size)] = result
+        if log is not None:
+            log.write('{:>8} {}\n'.format(size, _format(result)))
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'numpy': numpy.__version__,
+            'ticks': ticks,
+        },
+        'results': results,
+    }
+
+
+def _format(result):
+    line = 'population {:8.1f} ns/entity'.format(result['population_ns_per_entity'])
+    if result['objects_ns_per_entity'] is None:
+        return line + '  objects skipped'
+    return line + '  objects {:8.1f} ns/entity  x{:.1f}'.format(result['objects_ns_per_entity'], result['speedup'])
+
+
+def _csv(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=_csv, default=list(DEFAULT_SIZES))
+    parser.add_argument('--ticks', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--object-limit', type=int, default=10 ** 5,
+                        help='largest population measured with per-object polling')
+    parser.add_argument('--output', help='write JSON results to the file')
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.ticks, args.repeat, args.object_limit, log=sys.stderr)
+    if 'skipped' in results:
+        sys.stderr.write('skipped: {}\n'.format(results['skipped']))
+        return 0
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(results, fd, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+'''
+    Cross-engine benchmark suite.
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --baseline results.json --threshold 10
+
+    Every (engine, scenario, size) case reports nanoseconds per operation.
+    With --baseline the run fails (exit code 1) if any case became more than
+    --threshold percent slower than in the baseline file.
+'''
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+
+from benchmarks.engines import ENGINES, EngineUnavailable
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+DEFAULT_SIZES = (5, 50, 500, 5000, 50000)
+SCENARIOS = ('construct', 'dispatch', 'poll', 'callbacks', 'teardown')
+
+
+def _best(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = _clock()
+        fn()
+        elapsed = _clock() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def _construct(engine, ops):
+    def fn():
+        for _ in range(ops):
+            engine.build()
+    return fn
+
+
+def _dispatch(engine, ops):
+    machine = engine.build()
+
+    def fn():
+        dispatch = engine.dispatch
+        for _ in range(ops):
+            dispatch(machine)
+    return fn
+
+
+def _poll(engine, ops):
+    machine = engine.build()
+    engine.poll(machine)
+
+    def fn():
+        poll = engine.poll
+        for _ in range(ops):
+            poll(machine)
+    return fn
+
+
+def _callbacks(engine, ops):
+    counter = [0]
+    machine = engine.buildWithCallbacks(counter)
+
+    def fn():
+        dispatch = engine.dispatch
+        for _ in range(ops):
+            dispatch(machine)
+    return fn
+
+
+def _teardown(engine, ops):
+    machines = []
+
+    def fn():
+        teardown = engine.teardown
+        for machine in machines:
+            teardown(machine)
+        del machines[:]
+
+    def prepare():
+        machines.extend(engine.build() for _ in range(ops))
+
+    return prepare, fn
+
+
+def _ops(scenario, size, ops):
+    if scenario in ('construct', 'teardown'):
+        # construction cost grows with the machine size
+        return max(1, min(ops, ops * 50 // size))
+    return ops
+
+
+def runCase(engineClass, scenario, size, ops=2000, repeat=3):
+    engine = engineClass(size)
+    count = _ops(scenario, size, ops)
+    if scenario == 'teardown':
+        prepare, fn = _teardown(engine, count)
+        best = None
+        for _ in range(repeat):
+            prepare()
+            elapsed = _best(fn, 1)
+            best = elapsed if best is None else min(best, elapsed)
+    else:
+        factory = {'construct': _construct, 'dispatch': _dispatch, 'poll': _poll, 'callbacks': _callbacks}[scenario]
+        best = _best(factory(engine, count), repeat)
+    return {'ops': count, 'ns_per_op': best * 1e9 / count}
+
+
+def run(engines=None, scenarios=SCENARIOS, sizes=DEFAULT_SIZES, ops=2000, repeat=3, log=None):
+    results = {}
+    for engineClass in ENGINES:
+        if engines and engineClass.name not in engines:
+            continue
+        for scenario in scenarios:
+            for size in sizes:
+                key = '{}/{}/{}'.format(engineClass.name, scenario, size)
+                try:
+                    results[key] = runCase(engineClass, scenario, size, ops, repeat)
+                except EngineUnavailable as err:
+                    results[key] = {'skipped': str(err)}
+                if log is not None:
+                    log.write('{:<40} {}\n'.format(key, _format(results[key])))
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'timestamp': time.time(),
+        },
+        'results': results,
+    }
+
+
+def _format(result):
+    if 'skipped' in result:
+        return 'skipped ({})'.format(result['skipped'])
+    return '{:12.1f} ns/op'.format(result['ns_per_op'])
+
+
+def compare(current, baseline, threshold):
+    '''
+        Returns a list of (case, baseline ns/op, current ns/op, change %)
+        of cases which are slower than the baseline by more than threshold
+        percent.
+    '''
+    regressions = []
+    baselineResults = baseline.get('results', {})
+    for key, result in sorted(current.get('results', {}).items()):
+        old = baselineResults.get(key)
+        if not old or 'ns_per_op' not in old or 'ns_per_op' not in result:
+            continue
+        change = (result['ns_per_op'] - old['ns_per_op']) * 100.0 / old['ns_per_op']
+        if change > threshold:
+            regressions.append((key, old['ns_per_op'], result['ns_per_op'], change))
+    return regressions
+
+
+def _csv(value, cast=str):
+    return [cast(item) for item in value.split(',') if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--engines', type=_csv, default=None, help='comma separated engine names')
+    parser.add_argument('--scenarios', type=_csv, default=list(SCENARIOS))
+    parser.add_argument('--sizes', type=lambda value: _csv(value, int), default=list(DEFAULT_SIZES))
+    parser.add_argument('--ops', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write JSON results to the file')
+    parser.add_argument('--baseline', help='JSON results of a previous run')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed slowdown, percent')
+    args = parser.parse_args(argv)
+
+    results = run(args.engines, args.scenarios, args.sizes, args.ops, args.repeat, log=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(results, fd, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)
+        regressions = compare(results, baseline, args.threshold)
+        for key, old, new, change in regressions:
+            sys.stderr.write('REGRESSION {}: {:.1f} -> {:.1f} ns/op (+{:.1f}%)\n'.format(key, old, new, change))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
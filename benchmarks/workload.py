@@ -0,0 +1,241 @@
+'''
+    Synthetic FSM configs and event streams for load tests and benchmarks.
+
+    python -m benchmarks.workload --states 1000 --events 40 --wildcard 0.05 \\
+        --conditions 0.2 --fan-out 3 --config config.json \\
+        --stream zipf --count 100000 --stream-output events.json
+
+    Generation is deterministic for a given seed. Condition transitions refer
+    to condition names (cond0, cond1, ...); makeConditions() builds matching
+    callables, since JSON configs can't hold them. Cascade streams expect
+    conditions which always hold: makeConditions(config, probability=1).
+'''
+import argparse
+import bisect
+import json
+import random
+import sys
+
+DISTRIBUTIONS = ('uniform', 'zipf', 'cascade')
+
+
+def _stateName(i):
+    return 's{}'.format(i)
+
+
+def _eventName(i):
+    return 'ev{}'.format(i)
+
+
+def generateConfig(states, events, wildcardFraction=0.0, conditionFraction=0.0, fanOut=2, seed=0):
+    '''
+        Returns a JSON-serializable FSM config with the given number of states
+        and events. Every state gets up to fanOut outgoing transitions (the
+        first one links the states into a ring, so all of them are reachable);
+        conditionFraction of them are condition transitions. wildcardFraction
+        of the events are "*" transitions available in every state.
+    '''
+    if states < 2:
+        raise ValueError('At least 2 states required')
+    if events < 1:
+        raise ValueError('At least 1 event required')
+
+    rng = random.Random(seed)
+    stateNames = [_stateName(i) for i in range(states)]
+    eventNames = [_eventName(i) for i in range(events)]
+
+    wildcardCount = min(int(round(events * wildcardFraction)), events - 1)
+    wildcardEvents = eventNames[events - wildcardCount:]
+    localEvents = eventNames[:events - wildcardCount]
+    # Wildcard transitions expand to every state, so local transitions avoid
+    # their destinations to keep (src, dst) pairs unique.
+    wildcardDsts = [rng.choice(stateNames[1:]) for _ in wildcardEvents]
+    localDsts = [name for name in stateNames if name not in set(wildcardDsts)] or stateNames
+    fanOut = max(1, min(fanOut, len(localEvents) + 1, len(localDsts)))
+
+    transitions = []
+    conditionCount = 0
+    for i, src in enumerate(stateNames):
+        ring = stateNames[(i + 1) % states]
+        dsts = [ring] if ring in localDsts else []
+        while len(dsts) < fanOut:
+            dst = rng.choice(localDsts)
+            if dst != src and dst not in dsts:
+                dsts.append(dst)
+            elif len(localDsts) <= fanOut + 1:
+                break
+
+        srcEvents = rng.sample(localEvents, min(len(localEvents), len(dsts)))
+        for n, dst in enumerate(dsts):
+            if n >= len(srcEvents) or (n and rng.random() < conditionFraction):
+                transitions.append({'src': src, 'dst': dst, 'condition': 'cond{}'.format(conditionCount)})
+                conditionCount += 1
+            else:
+                transitions.append({'src': src, 'dst': dst, 'event': srcEvents[n]})
+
+    for event, dst in zip(wildcardEvents, wildcardDsts):
+        transitions.append({'src': '*', 'dst': dst, 'event': event})
+
+    return {
+        'initial': {'state': stateNames[0]},
+        'transitions': transitions,
+    }
+
+
+def conditionNames(config):
+    return sorted({transition['condition'] for transition in config['transitions'] if 'condition' in transition})
+
+
+def makeConditions(config, probability=0.0, seed=0):
+    '''
+        Returns callables for the condition names of the config, each of
+        them returns True with the given probability.
+    '''
+    rng = random.Random(seed)
+
+    def makeCondition():
+        return lambda: rng.random() < probability
+
+    return {name: makeCondition() for name in conditionNames(config)}
+
+
+def _eventMap(config):
+    '''
+        Returns {src: [(event, dst), ...]} for the event transitions,
+        wildcards expanded.
+    '''
+    states = set()
+    local = {}
+    wildcards = []
+    for transition in config['transitions']:
+        states.add(transition['dst'])
+        if transition['src'] != '*':
+            states.add(transition['src'])
+        if 'event' not in transition:
+            continue
+        if transition['src'] == '*':
+            wildcards.append((transition['event'], transition['dst']))
+        else:
+            local.setdefault(transition['src'], []).append((transition['event'], transition['dst']))
+    return {state: local.get(state, []) + wildcards for state in states}
+
+
+def _conditionMap(config):
+    '''
+        Returns {src: dst} of the first condition transition of every state,
+        the one a machine takes when all conditions hold.
+    '''
+    conditions = {}
+    for transition in config['transitions']:
+        if 'event' not in transition and 'condition' in transition:
+            conditions.setdefault(transition['src'], transition['dst'])
+    conditions.pop(config.get('final'), None)  # a finished machine doesn't poll
+    return conditions
+
+
+def _cascade(conditionMap, state):
+    '''
+        Returns the states a tick passes through from the state when all
+        conditions hold; like FSM.update() it stops at the first repeated
+        state.
+    '''
+    path = [state]
+    while state in conditionMap:
+        state = conditionMap[state]
+        path.append(state)
+        if state in path[:-1]:
+            break
+    return path
+
+
+def generateEvents(config, count, distribution='uniform', seed=0, zipfExponent=1.1):
+    '''
+        Returns a list of event names which can be replayed against a fresh
+        machine built from the config without rejections:
+
+        uniform  every event available in the current state is equally likely
+        zipf     events are weighted by a Zipf law over their global rank
+        cascade  always takes the event to the state which starts the longest
+                 condition cascade; replay it with makeConditions(config,
+                 probability=1) and an update() after every event
+
+        uniform and zipf streams expect conditions which never hold.
+    '''
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError("Unknown distribution '{}'".format(distribution))
+
+    rng = random.Random(seed)
+    eventMap = _eventMap(config)
+    ranks = {}
+    for transitions in eventMap.values():
+        for event, _ in transitions:
+            ranks.setdefault(event, len(ranks) + 1)
+    ranked = sorted(ranks, key=lambda event: ranks[event])
+    rng.shuffle(ranked)
+    weights = {event: 1.0 / (rank + 1) ** zipfExponent for rank, event in enumerate(ranked)}
+
+    conditionMap = _conditionMap(config)
+    state = config['initial']['state']
+    stream = []
+    for _ in range(count):
+        transitions = eventMap.get(state)
+        if not transitions:
+            break
+        if distribution == 'uniform':
+            event, dst = rng.choice(transitions)
+        elif distribution == 'zipf':
+            event, dst = _weightedChoice(rng, transitions, [weights[event] for event, _ in transitions])
+        else:
+            cascades = [(event, _cascade(conditionMap, dst)) for event, dst in transitions]
+            best = max(len(path) for _, path in cascades)
+            event, path = rng.choice([item for item in cascades if len(item[1]) == best])
+            dst = path[-1]
+        stream.append(event)
+        state = dst
+    return stream
+
+
+def _weightedChoice(rng, items, weights):
+    cumulative = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    return items[bisect.bisect_right(cumulative, rng.random() * total)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--states', type=int, default=100)
+    parser.add_argument('--events', type=int, default=10)
+    parser.add_argument('--wildcard', type=float, default=0.0, help='fraction of wildcard events')
+    parser.add_argument('--conditions', type=float, default=0.0, help='fraction of condition transitions')
+    parser.add_argument('--fan-out', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--config', help='config output file (stdout by default)')
+    parser.add_argument('--stream', choices=DISTRIBUTIONS)
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--stream-output', help='event stream output file')
+    args = parser.parse_args(argv)
+
+    config = generateConfig(args.states, args.events, args.wildcard, args.conditions, args.fan_out, args.seed)
+    if args.config:
+        with open(args.config, 'w') as fd:
+            json.dump(config, fd, indent=2)
+    else:
+        json.dump(config, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    if args.stream:
+        stream = generateEvents(config, args.count, args.stream, args.seed)
+        if args.stream_output:
+            with open(args.stream_output, 'w') as fd:
+                json.dump(stream, fd)
+        else:
+            json.dump(stream, sys.stdout)
+            sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue
+
+from fsm.HookProfiler import LatencyHistogram
+
+_clock = getattr(time, 'perf_counter', time.time)
+_DEFAULT_BATCH_SIZE = 16
+_STOP = None
+
+_logger = logging.getLogger(__name__)
+
+
+def isFreeThreaded():
+    '''
+        Returns if the interpreter runs without the GIL (free-threaded build).
+    '''
+    isGilEnabled = getattr(sys, '_is_gil_enabled', None)
+    return isGilEnabled is not None and not isGilEnabled()
+
+
+def _defaultWorkers():
+    cpus = os.cpu_count() if hasattr(os, 'cpu_count') else 4
+    # with the GIL threads only help while hooks release it (I/O, NumPy)
+    return (cpus or 4) if isFreeThreaded() else min(4, cpus or 4)
+
+
+def logError(fsm, eventName, error):
+    '''
+        Default onError handler of ActorRuntime.
+    '''
+    _logger.error('Event %s failed in %r', eventName, fsm, exc_info=error)
+
+
+class Mailbox(object):
+    def __init__(self, fsm):
+        self.fsm = fsm
+        self.messages = collections.deque()
+        self.lock = threading.Lock()
+        self.scheduled = False
+
+
+class ActorRuntime(object):
+    '''
+        Actor-style runtime: every registered FSM gets a mailbox and a fixed
+        pool of threads drains the mailboxes. A machine is processed by one
+        thread at a time and its messages are handled in FIFO order; after
+        batchSize messages the machine goes back to the end of the run queue,
+        so busy machines can't starve the others.
+
+        runtime = ActorRuntime(workers=8)
+        mailbox = runtime.register(fsm)
+        runtime.send(mailbox, 'evAttack')  # from any thread
+        runtime.join()
+        runtime.stop()
+
+        Exceptions raised while a machine handles a message are passed to
+        onError(fsm, eventName, error), by default logged with logError().
+    '''
+
+    def __init__(self, workers=None, batchSize=_DEFAULT_BATCH_SIZE, onError=logError):
+        if batchSize < 1:
+            raise ValueError('batchSize must be positive')
+        self.batchSize = batchSize
+        self.onError = onError
+        self.runQueueLatency = LatencyHistogram()  # ns between scheduling and pickup
+        self.__latencyLock = threading.Lock()
+        self.__runQueue = queue.Queue()
+        self.__mailboxes = []
+        self.__mailboxesLock = threading.Lock()
+        self.__threads = []
+        for i in range(workers or _defaultWorkers()):
+            thread = threading.Thread(target=self.__work, name='fsm-actor-{}'.format(i))
+            thread.daemon = True
+            thread.start()
+            self.__threads.append(thread)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def register(self, fsm):
+        mailbox = Mailbox(fsm)
+        with self.__mailboxesLock:
+            self.__mailboxes.append(mailbox)
+        return mailbox
+
+    def unregister(self, mailbox):
+        with self.__mailboxesLock:
+            self.__mailboxes.remove(mailbox)
+
+    def send(self, mailbox, eventName, eventData=None):
+        '''
+            Posts an event to the machine. Thread-safe.
+        '''
+        with mailbox.lock:
+            mailbox.messages.append((eventName, eventData))
+            if mailbox.scheduled:
+                return
+            mailbox.scheduled = True
+        self.__runQueue.put((mailbox, _clock()))
+
+    def queueDepths(self):
+        with self.__mailboxesLock:
+            mailboxes = list(self.__mailboxes)
+        return [(mailbox.fsm, len(mailbox.messages)) for mailbox in mailboxes]
+
+    @property
+    def runQueueDepth(self):
+        return self.__runQueue.qsize()
+
+    def join(self):
+        '''
+            Blocks until all mailboxes are drained.
+        '''
+        self.__runQueue.join()
+
+    def stop(self):
+        for _ in self.__threads:
+            self.__runQueue.put(_STOP)
+        for thread in self.__threads:
+            thread.join()
+        del self.__threads[:]
+
+    def __work(self):
+        runQueue = self.__runQueue
+        while True:
+            item = runQueue.get()
+            if item is _STOP:
+                runQueue.task_done()
+                return
+            mailbox, scheduledAt = item
+            latency = int((_clock() - scheduledAt) * 1e9)
+            with self.__latencyLock:
+                self.runQueueLatency.record(latency)
+            try:
+                self.__runTurn(mailbox)
+            finally:
+                runQueue.task_done()
+
+    def __runTurn(self, mailbox):
+        messages = mailbox.messages
+        for _ in range(self.batchSize):
+            with mailbox.lock:
+                if not messages:
+                    break
+                eventName, eventData = messages.popleft()
+            try:
+                mailbox.fsm.addEvent(eventName, eventData)
+            except Exception as err:
+                # a failing hook must not kill the worker thread
+                if self.onError is not None:
+                    self.onError(mailbox.fsm, eventName, err)
+
+        with mailbox.lock:
+            if not messages:
+                mailbox.scheduled = False
+                return
+        self.__runQueue.put((mailbox, _clock()))
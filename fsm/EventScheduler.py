@@ -0,0 +1,120 @@
+import heapq
+import itertools
+
+_COMPACT_MIN = 64
+
+
+class TimerHandle(object):
+    '''
+        A scheduled call. cancel() is O(1); cancelled timers are dropped from
+        the heap lazily.
+    '''
+    __slots__ = ('due', 'callback', 'args', 'cancelled', 'scheduler', '__weakref__')
+
+    def __init__(self, scheduler, due, callback, args):
+        self.scheduler = scheduler
+        self.due = due
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def __repr__(self):
+        return '<TimerHandle due={} {}>'.format(self.due, 'cancelled' if self.cancelled else 'active')
+
+    def cancel(self):
+        if self.cancelled:
+            return
+        self.cancelled = True
+        self.callback = self.args = None
+        if self.scheduler is not None:
+            self.scheduler._timerCancelled()
+            self.scheduler = None
+
+
+class EventScheduler(object):
+    '''
+        Timer heap driven by simulation time instead of the wall clock.
+        One scheduler may be shared by many machines:
+
+        scheduler = EventScheduler()
+        fsm = FSM(dict(cfg, scheduler=scheduler))
+        handle = fsm.addEventAfter(2.5, 'evReloaded')
+        ...
+        scheduler.advance(dt)  # once per tick
+    '''
+
+    def __init__(self, now=0.0):
+        self.now = now
+        self.__heap = []
+        self.__counter = itertools.count()
+        self.__cancelled = 0
+        self.__advancing = False
+
+    def __len__(self):
+        return len(self.__heap) - self.__cancelled
+
+    @property
+    def nextDue(self):
+        '''
+            Due time of the earliest active timer or None.
+        '''
+        heap = self.__heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+            self.__cancelled -= 1
+        return heap[0][0] if heap else None
+
+    def callAt(self, when, callback, *args):
+        handle = TimerHandle(self, when, callback, args)
+        heapq.heappush(self.__heap, (when, next(self.__counter), handle))
+        return handle
+
+    def callLater(self, delay, callback, *args):
+        if delay < 0:
+            raise ValueError('delay must not be negative')
+        return self.callAt(self.now + delay, callback, *args)
+
+    def advance(self, dt):
+        '''
+            Moves the clock forward and runs the timers which became due, in
+            due order. Timers scheduled by the callbacks run on the next call
+            at the earliest. Returns the number of fired timers.
+        '''
+        self.now += dt
+        now = self.now
+        heap = self.__heap
+        last = next(self.__counter)
+        fired = 0
+        # callbacks may cancel timers, the heap is compacted after the loop
+        self.__advancing = True
+        try:
+            while heap and heap[0][0] <= now and heap[0][1] < last:
+                _, _, handle = heapq.heappop(heap)
+                if handle.cancelled:
+                    self.__cancelled -= 1
+                    continue
+                callback, args = handle.callback, handle.args
+                handle.scheduler = handle.callback = handle.args = None
+                fired += 1
+                callback(*args)
+        finally:
+            self.__advancing = False
+            self.__compact()
+        return fired
+
+    def clear(self):
+        for _, _, handle in self.__heap:
+            handle.cancel()
+        del self.__heap[:]
+        self.__cancelled = 0
+
+    def _timerCancelled(self):
+        self.__cancelled += 1
+        if not self.__advancing:
+            self.__compact()
+
+    def __compact(self):
+        if self.__cancelled > _COMPACT_MIN and self.__cancelled * 2 > len(self.__heap):
+            self.__heap = [item for item in self.__heap if not item[2].cancelled]
+            heapq.heapify(self.__heap)
+            self.__cancelled = 0
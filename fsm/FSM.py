@@ -1,7 +1,11 @@
+import collections
 import functools
 import json
+import logging
 import os.path
+import threading
 import weakref
+import time
 import types
 import sys
 from collections.abc import Callable
@@ -11,8 +15,12 @@ from typing import Tuple
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
-    from typing import Optional, Type
+    from typing import Iterable, Optional, Type
     from FSM import Config
+    from fsm.TransitionMetrics import TransitionMetrics
+    from fsm.HookProfiler import HookProfiler
+    from concurrent.futures import Future
+    from fsm.EventScheduler import TimerHandle
 
     PY3 = sys.version_info[0] >= 3
 
@@ -21,6 +29,8 @@ try:
 except ImportError:
     from collections import Mapping
 
+from fsm.EventScheduler import EventScheduler
+
 __author__ = 'Igor Belov'
 __copyright__ = 'Wargaming'
 __credits__ = ['Mansour Behabadi', 'Jake Gordon']
@@ -33,14 +43,72 @@ _ALL_STATES = '*'
 _SAME_DST = '='
 _INIT_STATE = '__default_root_state'
 _INIT_EVENT_NAME = '__default_root_setup_event'
-_UPDATE_EVENT = '__update_event'
-_MAX_TRANSITIONS = 100
+_NO_STATES = frozenset()
+_NO_EVENTS = frozenset()
+
+COALESCE_KEEP_FIRST = 'keep-first'
+COALESCE_KEEP_LATEST = 'keep-latest'
+COALESCE_MERGE = 'merge'
+_COALESCE_POLICIES = (COALESCE_KEEP_FIRST, COALESCE_KEEP_LATEST, COALESCE_MERGE)
+
+PRIORITY_LANES = ('high', 'normal', 'low')  # drained in this order
+_NORMAL_LANE = PRIORITY_LANES.index('normal')
+_STARVATION_LIMIT = 16
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+_logger = logging.getLogger(__name__)
+
+_ADAPTIVE_INTERVAL = 1000
+
+LIVELOCK_STOP = 'stop'
+LIVELOCK_RAISE = 'raise'
+LIVELOCK_FREEZE = 'freeze'
+_LIVELOCK_POLICIES = (LIVELOCK_STOP, LIVELOCK_RAISE, LIVELOCK_FREEZE)
+
+class EventHandle(int):
+    '''
+        Integer id of an event name, the index of the event within its
+        definition (see FSM.event), or any opcode when built directly.
+        Engines accept it wherever an event name is accepted and resolve it
+        with an attribute read, so callers holding numeric opcodes don't have
+        to build strings.
+    '''
+
+    def __new__(cls, index, name):
+        handle = super(EventHandle, cls).__new__(cls, index)
+        handle.name = name  # type: str
+        return handle
+
+    def __repr__(self):
+        return 'EventHandle({}, {!r})'.format(int(self), self.name)
+
+    def __reduce__(self):
+        return EventHandle, (int(self), self.name)
+
+
+
+STATE_EVENT_ONLY = 'event-only'
+STATE_POLLING = 'polling'
+STATE_FINAL = 'final'
 
 
 class FSMError(Exception):
     pass
 
 
+class FSMLivelockError(FSMError):
+    '''
+        Condition transitions of one update() returned to an already visited
+        state. "diagnostic" holds the machine name, the cycle and the policy.
+    '''
+
+    def __init__(self, diagnostic):
+        super(FSMLivelockError, self).__init__(
+            'Livelock in {machine}: {cycle}'.format(machine=diagnostic['machine'], cycle=' -> '.join(diagnostic['cycle'])))
+        self.diagnostic = diagnostic
+
+
 class FSMConfigError(Exception):
     pass
 
@@ -97,6 +165,30 @@ def _weak_callback(func):
         return func
 
 
+def _instrumented_event(machine, definition, state, event, fn, args, kwargs):
+    '''
+        Runs an event handler under the machine's profiler while tracking
+        the cascade depth of events triggered from callbacks.
+    '''
+    if kwargs:
+        fn = functools.partial(fn, **kwargs)
+    profiler = machine.profiler
+    if profiler is not None:
+        fn = functools.partial(profiler.event, definition, state, event, None, fn)
+
+    metrics = machine.metrics
+    if metrics is None:
+        return fn(*args)
+
+    metrics.enter()
+    try:
+        result = fn(*args)
+    finally:
+        metrics.leave()
+    metrics.eventProcessed()
+    return result
+
+
 def _is_base_string(obj):  # pragma: no cover
     '''
         Returns if the object is an instance of basestring.
@@ -107,7 +199,275 @@ def _is_base_string(obj):  # pragma: no cover
         return isinstance(obj, str)
 
 
+class StateIndex(object):
+    '''
+        Live state -> entities index. Engines update it incrementally at the
+        point where the state changes, so members() and count() don't have to
+        iterate over the whole population. Entities are referenced weakly.
+    '''
+
+    def __init__(self):
+        self.__members = {}  # type: Dict[str, weakref.WeakSet]
+
+    def move(self, entity, src, dst):
+        if src is not None:
+            members = self.__members.get(src)
+            if members is not None:
+                members.discard(entity)
+        if dst is not None:
+            members = self.__members.get(dst)
+            if members is None:
+                members = self.__members[dst] = weakref.WeakSet()
+            members.add(entity)
+
+    def discard(self, entity, state):
+        self.move(entity, state, None)
+
+    def members(self, state):
+        members = self.__members.get(state)
+        return frozenset(members) if members else frozenset()
+
+    def count(self, state):
+        members = self.__members.get(state)
+        return len(members) if members else 0
+
+    def states(self):
+        return [state for state, members in self.__members.items() if members]
+
+
+class ConditionMemo(object):
+    '''
+        Results of conditions which don't change during a tick. Every machine
+        with 'tickConditions' has a private memo cleared by its update(); a
+        memo passed as 'conditionMemo' is shared by the machines and has to be
+        cleared by its owner once per tick.
+    '''
+
+    def __init__(self):
+        self.results = {}  # type: Dict[Callable[[], bool], bool]
+
+    def clear(self):
+        self.results.clear()
+
+    def wrap(self, condition):
+        results = self.results
+
+        def memoized():
+            result = results.get(condition)
+            if result is None:
+                result = results[condition] = bool(condition())
+            return result
+        return memoized
+
+
+class _PriorityLanes(object):
+    '''
+        Event queue split into PRIORITY_LANES. Lanes are drained in priority
+        order, but at most starvationLimit events overtake the head of a
+        lower lane.
+    '''
+    __slots__ = ('priorities', 'queues', 'bypassed', 'starvationLimit')
+
+    def __init__(self, priorities, starvationLimit):
+        self.priorities = priorities  # type: Dict[str, int]
+        self.queues = [collections.deque() for _ in PRIORITY_LANES]
+        self.bypassed = [0] * len(PRIORITY_LANES)
+        self.starvationLimit = starvationLimit
+
+    def push(self, eventName, entry):
+        '''
+            Appends [eventName, eventData, context] with the lane and enqueue
+            time, returns the lane.
+        '''
+        lane = self.priorities.get(eventName, _NORMAL_LANE)
+        entry.append(lane)
+        entry.append(_clock())
+        self.queues[lane].append(entry)
+        return lane
+
+    def pop(self):
+        queues = self.queues
+        bypassed = self.bypassed
+        index = None
+        for lane in range(len(queues)):
+            if not queues[lane]:
+                continue
+            if index is None:
+                index = lane
+                continue
+            bypassed[lane] += 1
+            if bypassed[lane] > self.starvationLimit:
+                index = lane
+        if index is None:
+            return None
+        bypassed[index] = 0
+        return queues[index].popleft()
+
+    def depth(self, lane):
+        return len(self.queues[lane])
+
+    def clear(self):
+        for queue in self.queues:
+            queue.clear()
+
+
+class _StateActions(object):
+    '''
+        Actions of the states overriding FSMState.runAction. Completions are
+        collected from the executor threads and posted by FSM.pollActions();
+        leaving the state bumps the epoch, so late completions are dropped.
+    '''
+    __slots__ = ('executor', 'states', 'future', 'epoch', 'completed')
+
+    def __init__(self, executor, states):
+        self.executor = executor
+        self.states = states  # type: frozenset
+        self.future = None  # type: Optional[Future]
+        self.epoch = 0
+        self.completed = collections.deque()
+
+    def start(self, state, eventData):
+        self.epoch += 1
+        epoch = self.epoch
+        completed = self.completed  # deque.append is thread-safe
+        self.future = self.executor.submit(state.runAction, eventData)
+        self.future.add_done_callback(lambda future: completed.append((epoch, future)))
+
+    def cancel(self):
+        self.epoch += 1
+        if self.future is not None:
+            self.future.cancel()
+            self.future = None
+
+    def clear(self):
+        self.cancel()
+        self.completed.clear()
+
+
+class _Definition(object):
+    '''
+        Compiled tables shared by the machines built from one definition:
+        the bit of each state in the per-tick visited-state sets, the event
+        handles and the events accepted in each state.
+    '''
+    __slots__ = ('bits', 'handles', 'availableEvents', '__weakref__')
+
+    def __init__(self, states, events, availableEvents):
+        self.bits = {name: 1 << index for index, name in enumerate(states)}  # type: Dict[str, int]
+        self.handles = {name: EventHandle(index, name) for index, name in enumerate(events)}  # type: Dict[str, EventHandle]
+        sets = {}  # states accepting the same events share the set
+        self.availableEvents = {
+            state: sets.setdefault(accepted, accepted) for state, accepted in availableEvents}  # type: Dict[str, frozenset]
+
+
+# Definitions in use, dropped with their last machine.
+_definitions = weakref.WeakValueDictionary()  # type: weakref.WeakValueDictionary
+_definitionsLock = threading.Lock()
+
+
+def _shared(cls, *key):
+    with _definitionsLock:
+        definition = _definitions.get((cls,) + key)
+        if definition is None:
+            definition = _definitions[(cls,) + key] = cls(*key)
+    return definition
+
+
+def _compileDefinition(states, events, availableEvents):
+    # type: (Iterable[str], Iterable[str], Dict[str, frozenset]) -> _Definition
+    return _shared(_Definition, tuple(states), tuple(sorted(event for event in events if event is not None)),
+                   frozenset(availableEvents.items()))
+
+
+class _EventSets(object):
+    '''
+        Events accepted in each state of a Fysom definition; states without
+        transitions of their own accept the wildcard events.
+    '''
+    __slots__ = ('available', 'anyEvents', '__weakref__')
+
+    def __init__(self, srcsByEvent):
+        self.anyEvents = frozenset(event for event, srcs in srcsByEvent if _ALL_STATES in srcs)
+        available = {}
+        for event, srcs in srcsByEvent:
+            for state in srcs:
+                if state != _ALL_STATES:
+                    available.setdefault(state, set(self.anyEvents)).add(event)
+        sets = {}
+        self.available = {state: sets.setdefault(frozenset(events), frozenset(events))
+                          for state, events in available.items()}  # type: Dict[str, frozenset]
+
+
+def _compileEventSets(srcsByEvent):  # type: (Dict[str, Iterable[str]]) -> _EventSets
+    return _shared(_EventSets, frozenset((event, frozenset(srcs)) for event, srcs in srcsByEvent.items()))
+
+
+class _AdaptiveChain(object):
+    '''
+        Condition chain of mutually exclusive transitions, reordered by the
+        observed hit rate every "interval" polls. The order of exclusive
+        conditions doesn't change the result, only the number of calls.
+    '''
+    __slots__ = ('entries', 'interval', 'polls')
+
+    def __init__(self, chain, interval):
+        self.entries = [[condition, dst, 0, 0] for condition, dst in chain]  # evaluations, hits
+        self.interval = interval
+        self.polls = 0
+
+    def poll(self):
+        found = None
+        for entry in self.entries:
+            entry[2] += 1
+            if entry[0]():
+                entry[3] += 1
+                found = entry[1]
+                break
+        self.polls += 1
+        if self.polls >= self.interval:
+            self.reorder()
+        return found
+
+    def reorder(self):
+        self.polls = 0
+        self.entries.sort(key=lambda entry: -float(entry[3]) / entry[2] if entry[2] else 0.0)
+
+    def stats(self):
+        return [(dst, evaluations, hits) for _, dst, evaluations, hits in self.entries]
+
+
+class _EdgeListeners(dict):
+    '''
+        Transition listeners of one source state: dst -> callbacks, missing
+        dsts resolve to the "src -> any" listeners.
+    '''
+    __slots__ = ('fallback',)
+
+    def __init__(self, fallback):
+        dict.__init__(self)
+        self.fallback = fallback
+
+    def __missing__(self, dst):
+        return self.fallback
+
+
+class _Listeners(object):
+    '''
+        Transition listeners of a machine: the registrations by
+        (src, dst) names and the tables compiled from them per source state.
+    '''
+    __slots__ = ('registry', 'tables')
+
+    def __init__(self):
+        self.registry = {}  # type: Dict[Tuple[str, str], List[Callable]]
+        self.tables = {}  # type: Dict[str, _EdgeListeners]
+
+
 class FSMState(object):
+    # Events posted when runAction() finishes or raises, see FSM 'executor'
+    actionDoneEvent = None  # type: Optional[str]
+    actionFailedEvent = None  # type: Optional[str]
+
     def __init__(self, name):  # type: (str) -> None
         self.__name = name
         self.__fsm = None  # type: Optional[FSM]
@@ -147,11 +507,34 @@ class FSMState(object):
     def update(self, dt):
         pass
 
+    def runAction(self, eventData):
+        '''
+            Slow work of the state. When overridden, it runs on the machine's
+            executor after enter(); its result (eventData['result']) or
+            exception (eventData['error']) is posted back as actionDoneEvent
+            or actionFailedEvent, unless the state was left in the meantime.
+            Called in an executor thread, so it must not touch the machine.
+        '''
+        pass
+
+    def getSnapshot(self):
+        '''
+            Returns picklable data of the state which has to survive moving
+            the machine to another process, or None.
+        '''
+        return None
+
+    def restoreSnapshot(self, data):
+        pass
+
     def addEvent(self, eventName, eventData=None):
         self.__fsm.addEvent(eventName, eventData)
 
 
 class FSM(object):
+    metrics = None  # type: Optional[TransitionMetrics]
+    profiler = None  # type: Optional[HookProfiler]
+
     def __init__(self, cfg):  # type: (Config) -> None
         initial = cfg.get('initial')
         if initial is None:
@@ -167,6 +550,7 @@ class FSM(object):
         for condName, cond in conditions.items():
             if not callable(cond):
                 raise FSMConfigError("Condition '{}' is not callable".format(condName))
+        conditions = self.__addGuardExpressions(transitions, conditions, cfg.get('context'))
 
         customStates = cfg.get('states', [])
         for state in customStates:
@@ -231,8 +615,16 @@ class FSM(object):
         for state in statesMap.values():
             state.sync(self)
 
+        actionStates = frozenset(
+            name for name, state in statesMap.items() if type(state).runAction is not FSMState.runAction) or _NO_STATES
+        executor = cfg.get('executor')
+        if actionStates and executor is None:
+            raise FSMConfigError("States {} have actions but config doesn't have 'executor'".format(sorted(actionStates)))
+
         transactionMap = {}
         eventTransitionMap = {}
+        conditionPriorities = {}
+        orderedStates = set()
         self.__addTransaction(statesMap[_INIT_STATE], statesMap[initialState], initialEvent, None, transactionMap, eventTransitionMap)
         for transition in transitions:
             src = transition.get('src', _ALL_STATES)
@@ -245,185 +637,848 @@ class FSM(object):
                 conditionName = transition.get('condition')
                 condition = conditions.get(conditionName)
                 self.__addTransaction(statesMap[src], statesMap[dstState], event, condition, transactionMap, eventTransitionMap)
-
+                if event is None:
+                    conditionPriorities[(src, dstState)] = transition.get('priority', 0)
+                    if not transition.get('exclusive', False):
+                        orderedStates.add(src)
+        conditionChains = self.__compileConditionChains(transactionMap, conditionPriorities)
+        conditionChains.pop(cfg.get('final'), None)  # a finished machine doesn't poll
+
+        availableEvents = {}
+        for eventName, srcs in eventTransitionMap.items():
+            if eventName is not None:
+                for src in srcs:
+                    if src != final:
+                        availableEvents.setdefault(src, set()).add(eventName)
+        availableEvents = {src: frozenset(events) for src, events in availableEvents.items()}
+
+        conditionMemo = cfg.get('conditionMemo')
+        ownsConditionMemo = conditionMemo is None
+        tickConditions = cfg.get('tickConditions', ())
+        if tickConditions:
+            for conditionName in tickConditions:
+                if conditionName not in conditions:
+                    raise FSMConfigError("Tick condition '{}' doesn't exist".format(conditionName))
+            if ownsConditionMemo:
+                conditionMemo = ConditionMemo()
+            memoized = {}
+            for conditionName in tickConditions:
+                condition = conditions[conditionName]
+                memoized[condition] = conditionMemo.wrap(condition)
+            conditionChains = {src: tuple((memoized.get(condition, condition), dst) for condition, dst in chain)
+                               for src, chain in conditionChains.items()}
+        elif ownsConditionMemo:
+            conditionMemo = None
+
+        adaptiveChains = None
+        adaptiveInterval = cfg.get('adaptiveConditions')
+        if adaptiveInterval:
+            interval = _ADAPTIVE_INTERVAL if adaptiveInterval is True else adaptiveInterval
+            # Only states whose condition transitions are all exclusive can be reordered.
+            adaptiveChains = {src: _AdaptiveChain(chain, interval)
+                              for src, chain in conditionChains.items()
+                              if src not in orderedStates and len(chain) > 1} or None
+
+        coalesce = {}
+        for eventName, policy in cfg.get('coalesce', {}).items():
+            if policy not in _COALESCE_POLICIES:
+                raise FSMConfigError("Unknown coalescing policy '{}' of event '{}'".format(policy, eventName))
+            if eventName not in eventTransitionMap:
+                raise FSMConfigError("Coalesced event '{}' doesn't exist".format(eventName))
+            coalesce[eventName] = policy
+
+        deferrable = {}
+        for stateName, events in cfg.get('deferred', {}).items():
+            stateNames = allActiveStates if stateName == _ALL_STATES else [stateName]
+            for name in stateNames:
+                if name not in statesMap:
+                    raise FSMConfigError("State '{}' with deferred events doesn't exist".format(name))
+                for eventName in events:
+                    if eventName not in eventTransitionMap:
+                        raise FSMConfigError("Deferred event '{}' doesn't exist".format(eventName))
+                deferrable[name] = deferrable.get(name, frozenset()) | frozenset(events)
+
+        livelockPolicy = cfg.get('livelock', LIVELOCK_STOP)
+        if livelockPolicy not in _LIVELOCK_POLICIES:
+            raise FSMConfigError("Unknown livelock policy '{}'".format(livelockPolicy))
+
+        priorities = {}
+        for eventName, lane in cfg.get('priorities', {}).items():
+            if lane not in PRIORITY_LANES:
+                raise FSMConfigError("Unknown priority '{}' of event '{}'".format(lane, eventName))
+            if eventName not in eventTransitionMap:
+                raise FSMConfigError("Prioritized event '{}' doesn't exist".format(eventName))
+            priorities[eventName] = PRIORITY_LANES.index(lane)
+
+        self.__name = cfg.get('name', type(self).__name__)  # type: str
         self.__statesMap = statesMap  # type: Dict[str, FSMState]
+        self.__definition = _compileDefinition(statesMap, eventTransitionMap, availableEvents)  # type: _Definition
         self.__transactionMap = transactionMap  # type: Dict[str, Dict[str, Tuple[str, Callable[[], bool]]]]
         self.__eventTransitionMap = eventTransitionMap  # type: Dict[str, Dict[str, Tuple[str, Callable[[], bool]]]]
+        # Polled by update(): event-only and final states aren't in the map.
+        self.__conditionChains = conditionChains  # type: Dict[str, Tuple[Tuple[Callable[[], bool], str], ...]]
+        self.__adaptiveChains = adaptiveChains  # type: Optional[Dict[str, _AdaptiveChain]]
+        # States overriding update(), only they keep a machine busy between events.
+        self.__updatingStates = frozenset(
+            name for name, state in statesMap.items() if type(state).update is not FSMState.update) or _NO_STATES
+        # Only a private memo is cleared by update().
+        self.__tickMemo = conditionMemo if ownsConditionMemo else None  # type: Optional[ConditionMemo]
         self.__currentStateId = _INIT_STATE  # type: str
         self.__final = final  # type: str
-        self.__newEvents = []  # type: List[Tuple[str, Any]]
+        self.__newEvents = []  # type: List[List]
+        self.__coalesce = coalesce  # type: Dict[str, str]
+        self.__pendingByName = {}  # type: Dict[str, List]
+        self.__deferrable = deferrable  # type: Dict[str, frozenset]
+        self.__deferredEvents = []  # type: List[Tuple[str, Any]]
+        # Without priorities all events share one FIFO queue (__newEvents).
+        self.__lanes = _PriorityLanes(
+            priorities, cfg.get('starvationLimit', _STARVATION_LIMIT)) if priorities else None  # type: Optional[_PriorityLanes]
         self.__isRunning = False
         self.__isDestroyed = False
-        self.__transitionsCount = 0
-        self.__callbacks = {}
+        self.__livelockPolicy = livelockPolicy  # type: str
+        self.__lastLivelock = None  # type: Optional[Dict[str, Any]]
+        self.__isFrozen = False
+        self.__callbacks = None  # type: Optional[_Listeners]
+        self.__index = None  # type: Optional[StateIndex]
+        self.__actions = _StateActions(executor, actionStates) if actionStates else None  # type: Optional[_StateActions]
+        # A shared scheduler is advanced by its owner, a private one is
+        # created on demand and advanced by update().
+        self.__scheduler = cfg.get('scheduler')  # type: Optional[EventScheduler]
+        self.__ownsScheduler = self.__scheduler is None
+        self.__timers = None  # type: Optional[weakref.WeakSet]
 
         isCustomInitialEvent = 'event' in initial
         if not isCustomInitialEvent:
             self.addEvent(_INIT_EVENT_NAME)
 
     @classmethod
-    def makeSFMFromJSON(cls, json_file, states):  # type: (str, List[FSMState]) -> FSM
+    def makeSFMFromJSON(cls, json_file, states, context=None):  # type: (str, List[FSMState], Any) -> FSM
         if not os.path.exists(json_file):
             raise FSMConfigError("File '{}' doesn't exist".format(json_file))
 
         with open(json_file, 'r') as fd:
             cfg = json.load(fd)
             cfg['states'] = states
+            if context is not None:
+                cfg['context'] = context
             return cls(cfg)
 
     def fini(self):
+        if self.__index is not None:
+            self.__index.discard(self, self.__currentStateId)
+            self.__index = None
         for name in self.__statesMap:
             self.__statesMap[name].fini()
         self.__statesMap.clear()
         self.__transactionMap.clear()
-        self.__callbacks.clear()
+        self.__conditionChains.clear()
+        self.__adaptiveChains = None
+        self.__tickMemo = None
+        self.__callbacks = None
         del self.__newEvents[:]
+        if self.__lanes is not None:
+            self.__lanes.clear()
+        self.__pendingByName.clear()
+        del self.__deferredEvents[:]
+        if self.__actions is not None:
+            self.__actions.clear()
+        self.__cancelTimers()
+        self.__scheduler = None
         self.__isRunning = False
         self.__isDestroyed = True
 
+    def setIndex(self, index):  # type: (Optional[StateIndex]) -> None
+        '''
+            Registers the machine in the shared state index.
+        '''
+        if self.__index is not None:
+            self.__index.discard(self, self.__currentStateId)
+        self.__index = index
+        if index is not None:
+            index.move(self, None, self.__currentStateId)
+
     def addCallback(self, fromState, toState, callback):
-        callbacks = self.__callbacks.get((fromState, toState), [])
+        '''
+            Calls callback(fromState, toState) with the state names after
+            every transition between the states; either of them may be '*'
+            for any state. Listeners of an edge run before the "* -> dst",
+            "src -> *" and "* -> *" ones.
+        '''
+        key = (self.__listenerState(fromState), self.__listenerState(toState))
+        if self.__callbacks is None:
+            self.__callbacks = _Listeners()
+        callbacks = self.__callbacks.registry.setdefault(key, [])
         if callback not in callbacks:
             callbacks.append(callback)
+            self.__compileListeners(key[0])
 
     def removeCallback(self, fromState, toState, callback):
-        callbacks = self.__callbacks.get((fromState, toState), [])
-        if callback in callbacks:
+        key = (self.__listenerState(fromState), self.__listenerState(toState))
+        if self.__callbacks is None:
+            return
+        callbacks = self.__callbacks.registry.get(key)
+        if callbacks is not None and callback in callbacks:
             callbacks.remove(callback)
+            if not callbacks:
+                del self.__callbacks.registry[key]
+            self.__compileListeners(key[0])
+
+    def __listenerState(self, state):
+        name = state.name if isinstance(state, FSMState) else state
+        if name != _ALL_STATES and name not in self.__statesMap:
+            raise FSMError("state {} doesn't exist".format(name))
+        return name
+
+    def __compileListeners(self, fromState):
+        # Listeners are merged per source state, so a transition costs one
+        # lookup and states without listeners have no table.
+        registry = self.__callbacks.registry
+        tables = self.__callbacks.tables
+        anyFallback = tuple(registry.get((_ALL_STATES, _ALL_STATES), ()))
+        srcs = self.__statesMap if fromState == _ALL_STATES else (fromState,)
+        for src in srcs:
+            fallback = tuple(registry.get((src, _ALL_STATES), ())) + anyFallback
+            listeners = _EdgeListeners(fallback)
+            for owner, dst in registry:
+                if owner in (src, _ALL_STATES) and dst != _ALL_STATES and dst not in listeners:
+                    listeners[dst] = (tuple(registry.get((src, dst), ())) +
+                                      tuple(registry.get((_ALL_STATES, dst), ())) + fallback)
+            if listeners or fallback:
+                tables[src] = listeners
+            else:
+                tables.pop(src, None)
 
-    def __callCallbacks(self, fromState, toState):
-        callbacks = self.__callbacks.get((fromState, toState), [])
-        for callback in callbacks:
-            callback(fromState, toState)
+    def event(self, eventName):  # type: (str) -> EventHandle
+        '''
+            Returns the handle of the event, see EventHandle.
+        '''
+        handle = self.__definition.handles.get(eventName)
+        if handle is None:
+            raise FSMError("event {} doesn't exist".format(eventName))
+        return handle
 
     def addEvent(self, eventName, eventData=None):
-        self.__newEvents.append((eventName, eventData))
+        if eventName.__class__ is EventHandle:
+            eventName = eventName.name
+        policy = self.__coalesce.get(eventName)
+        if policy is not None:
+            pending = self.__pendingByName.get(eventName)
+            if pending is not None:
+                self.__coalesceEvent(pending, policy, eventData)
+                return
+        # The only check of metrics and profiler on the way of an event, an
+        # instrumented machine takes a separate path.
+        instrumented = self.metrics is not None or self.profiler is not None
+        if not instrumented:
+            entry = [eventName, eventData, None]
+            if self.__lanes is None:
+                self.__newEvents.append(entry)
+            else:
+                self.__lanes.push(eventName, entry)
+        else:
+            entry = self.__queueInstrumented(eventName, eventData)
+        if policy is not None:
+            self.__pendingByName[eventName] = entry
 
         if self.__isRunning:
             return
 
         self.__isRunning = True
         try:
-            self.__run()
+            if self.__lanes is not None:
+                self.__runLanes(instrumented)
+            elif instrumented:
+                self.__runInstrumented()
+            else:
+                self.__run()
         finally:
             self.__isRunning = False
 
+    def __queueInstrumented(self, eventName, eventData):
+        context = None if self.profiler is None else self.profiler.context()
+        entry = [eventName, eventData, context]
+        if self.__lanes is None:
+            self.__newEvents.append(entry)
+            if self.metrics is not None:
+                self.metrics.queue(len(self.__newEvents))
+        else:
+            lane = self.__lanes.push(eventName, entry)
+            if self.metrics is not None:
+                self.metrics.laneQueue(PRIORITY_LANES[lane], self.__lanes.depth(lane))
+        return entry
+
     def can(self, event):
         '''
             Returns if the given event be fired in the current machine state.
         '''
-        eventTransition = self.__eventTransitionMap.get(event)
-        if not eventTransition:
-            return False
+        if event.__class__ is EventHandle:
+            event = event.name
+        return not self.__isDestroyed and event in self.__definition.availableEvents.get(self.__currentStateId, _NO_EVENTS)
 
-        dst = eventTransition.get(self.__currentStateId)
-        transition = self.__transactionMap.get(self.__currentStateId)
-        return not self.isFinished() and transition and dst in transition
+    def availableEvents(self):  # type: () -> frozenset
+        '''
+            Returns the events which can be fired in the current state.
+        '''
+        if self.__isDestroyed:
+            return _NO_EVENTS
+        return self.__definition.availableEvents.get(self.__currentStateId, _NO_EVENTS)
 
     def getCurrentState(self):
         return self.__currentStateId
 
+    def addEventAfter(self, delay, eventName, eventData=None):  # type: (float, str, Any) -> TimerHandle
+        '''
+            Posts the event after delay units of update() time. Returns a
+            handle with cancel().
+        '''
+        if delay < 0:
+            raise ValueError('delay must not be negative')
+        return self.addEventAt(self.__getScheduler().now + delay, eventName, eventData)
+
+    def addEventAt(self, when, eventName, eventData=None):  # type: (float, str, Any) -> TimerHandle
+        '''
+            Posts the event when the scheduler clock reaches the given time.
+        '''
+        if self.__isDestroyed:
+            raise FSMError("Machine is destroyed")
+        if eventName.__class__ is EventHandle:
+            eventName = eventName.name
+        if eventName not in self.__eventTransitionMap:
+            raise FSMError("event {} doesn't exist".format(eventName))
+        if self.__timers is None:
+            self.__timers = weakref.WeakSet()
+        handle = self.__getScheduler().callAt(when, self.__addScheduledEvent, eventName, eventData)
+        self.__timers.add(handle)
+        return handle
+
+    def __addScheduledEvent(self, eventName, eventData):
+        # The machine may have left the states accepting the event since it
+        # was scheduled. It's dropped as rejected: raising would stop the
+        # scheduler loop for every machine sharing it.
+        if not self.__isRunning and not self.can(eventName):
+            deferrable = self.__deferrable.get(self.__currentStateId)
+            if deferrable is None or eventName not in deferrable:
+                if self.metrics is not None:
+                    self.metrics.eventRejected()
+                return
+        self.addEvent(eventName, eventData)
+
+    def cancelScheduledEvents(self):
+        '''
+            Cancels all pending scheduled events of the machine.
+        '''
+        self.__cancelTimers()
+
+    def getSnapshot(self):
+        '''
+            Returns a compact picklable snapshot of the machine: the current
+            state, data of the states which provide it and, when present,
+            deferred events, pending scheduled events (as delays) and the
+            livelock state. Running state actions can't be moved, so a
+            machine with one raises FSMError.
+        '''
+        if self.__isRunning:
+            raise FSMError("Machine {} is processing events".format(self.__name))
+        actions = self.__actions
+        if actions is not None and (actions.future is not None or actions.completed):
+            raise FSMError("Machine {} has a pending state action".format(self.__name))
+
+        statesData = {}
+        for name, state in self.__statesMap.items():
+            data = state.getSnapshot()
+            if data is not None:
+                statesData[name] = data
+
+        pending = {}
+        if self.__deferredEvents:
+            pending['deferred'] = list(self.__deferredEvents)
+        if self.__timers:
+            now = self.__scheduler.now
+            # fired handles kept alive by the caller have no args
+            timers = sorted((handle for handle in self.__timers if handle.args is not None), key=lambda handle: handle.due)
+            if timers:
+                pending['timers'] = [(max(handle.due - now, 0),) + tuple(handle.args) for handle in timers]
+        if self.__isFrozen:
+            pending['frozen'] = True
+        if self.__lastLivelock is not None:
+            pending['livelock'] = self.__lastLivelock
+        if pending:
+            return (self.__currentStateId, statesData, pending)
+        return (self.__currentStateId, statesData)
+
+    def restoreSnapshot(self, snapshot):
+        '''
+            Restores a snapshot taken from a machine of the same definition.
+            No hooks are called; scheduled events are rescheduled on this
+            machine's scheduler.
+        '''
+        stateId, statesData = snapshot[:2]
+        pending = snapshot[2] if len(snapshot) > 2 else {}
+        if stateId not in self.__statesMap:
+            raise FSMError("state {} doesn't exist".format(stateId))
+        for name, data in statesData.items():
+            self.__statesMap[name].restoreSnapshot(data)
+        if self.__index is not None:
+            self.__index.move(self, self.__currentStateId, stateId)
+        self.__currentStateId = stateId
+
+        self.__deferredEvents = list(pending.get('deferred', ()))
+        self.__isFrozen = pending.get('frozen', False)
+        self.__lastLivelock = pending.get('livelock')
+        self.__cancelTimers()
+        for delay, eventName, eventData in pending.get('timers', ()):
+            self.addEventAfter(delay, eventName, eventData)
+
+    @property
+    def name(self):
+        return self.__name
+
+    def conditionStats(self):
+        '''
+            Returns the hit counters of the adaptive condition chains as
+            [{'src', 'dst', 'evaluations', 'hits'}, ...] in the current
+            evaluation order.
+        '''
+        stats = []
+        for src, chain in sorted((self.__adaptiveChains or {}).items()):
+            for dst, evaluations, hits in chain.stats():
+                stats.append({'src': src, 'dst': dst, 'evaluations': evaluations, 'hits': hits})
+        return stats
+
+    @property
+    def deferredEvents(self):
+        '''
+            Names of the parked events, in arrival order.
+        '''
+        return [eventName for eventName, _ in self.__deferredEvents]
+
+    def getStateKind(self, state=None):
+        '''
+            Returns STATE_FINAL, STATE_POLLING (has condition transitions) or
+            STATE_EVENT_ONLY of the state (the current one by default).
+        '''
+        state = self.__currentStateId if state is None else state
+        if state not in self.__statesMap:
+            raise FSMError("state {} doesn't exist".format(state))
+        if state == self.__final:
+            return STATE_FINAL
+        if state in self.__conditionChains:
+            return STATE_POLLING
+        return STATE_EVENT_ONLY
+
+    def isQuiescent(self):
+        '''
+            Returns if update() would do nothing now: the current state doesn't
+            poll conditions and has no update hook, and no state action or
+            scheduled event of a private scheduler is pending. Such machines
+            can be skipped by the caller until they receive an event.
+        '''
+        if self.__isDestroyed:
+            return True
+        stateId = self.__currentStateId
+        if stateId in self.__conditionChains and not self.__isFrozen:
+            return False
+        if stateId in self.__updatingStates:
+            return False
+        actions = self.__actions
+        if actions is not None and (actions.future is not None or actions.completed):
+            return False
+        return not (self.__ownsScheduler and self.__scheduler is not None and len(self.__scheduler))
+
+    @property
+    def lastLivelock(self):
+        '''
+            Diagnostic of the last detected livelock or None.
+        '''
+        return self.__lastLivelock
+
+    def isFrozen(self):
+        '''
+            Returns if condition polling was stopped by the 'freeze' livelock policy.
+        '''
+        return self.__isFrozen
+
+    def unfreeze(self):
+        self.__isFrozen = False
+
     def isFinished(self):
         '''
             Returns if the state machine is in its final state.
         '''
         return self.__final and (self.__currentStateId == self.__final)
 
+    def pollActions(self):
+        '''
+            Posts completion events of finished state actions.
+            Called automatically by update().
+        '''
+        actions = self.__actions
+        if actions is None:
+            return
+        completed = actions.completed
+        while completed:
+            epoch, future = completed.popleft()
+            if epoch != actions.epoch or future.cancelled():
+                continue  # the state was left before the action finished
+            actions.future = None
+            state = self.__currentState
+            error = future.exception()
+            if error is None:
+                eventName, eventData = state.actionDoneEvent, {'result': future.result()}
+            else:
+                eventName, eventData = state.actionFailedEvent, {'error': error}
+            if eventName is not None:
+                self.addEvent(eventName, eventData)
+
     def update(self, dt):  # type: (float) -> None
+        if self.__tickMemo is not None:
+            self.__tickMemo.clear()
+        if self.__actions is not None and self.__actions.completed:
+            self.pollActions()
+        if self.__ownsScheduler and self.__scheduler is not None:
+            self.__scheduler.advance(dt)
+            if self.__isDestroyed:
+                return
+
+        # States visited by this tick's cascade as a bitset, so a condition
+        # ping-pong stops at the first repeated state.
         transitionCount = 0
-        while True:
+        visited = 0
+        path = None
+        bits = self.__definition.bits
+        while self.__currentStateId in self.__conditionChains and not self.__isFrozen:
+            srcId = self.__currentStateId
             transited = self.__updateTransitions()
             if not transited or self.__isDestroyed:
                 break
 
             transitionCount += 1
-            if transitionCount > _MAX_TRANSITIONS:
-                print("Finite state machine has exceeded the maximum amount of transitions per tick")
+            if self.metrics is not None:
+                self.metrics.cascade(transitionCount)
+            if path is None:
+                visited = bits[srcId]
+                path = [srcId]
+            dstId = self.__currentStateId
+            bit = bits[dstId]
+            if visited & bit:
+                self.__onLivelock(path[path.index(dstId):] + [dstId])
                 break
+            visited |= bit
+            path.append(dstId)
 
         if not self.__isDestroyed:
-            self.__currentState.update(dt)
+            if self.profiler is None:
+                self.__currentState.update(dt)
+            else:
+                self.__callHook(self.__currentState, 'update', dt)
 
     def __updateTransitions(self):
         """
         Attempts to transit to the next state. Transition can only happen if the current state is ready for it and if
         conditions are satisfied for transition to another state. If conditions for multiple transitions are satisfied
-        then state machine will transit to the first valid state it encounters in self.__transitions.
+        then state machine will transit to the one with the highest priority (the first one in the config if
+        priorities are equal).
 
-        :param args: arguments to condition checking method
         :return: True if transition was successful, False otherwise
         """
-        if not self.isFinished() and self.__currentState.canTransit() and self.__currentStateId in self.__transactionMap:
-            for dst, info in self.__transactionMap[self.__currentStateId].items():
-                event, condition = info
-                if condition and condition():
-                    self.__performTransition(dst, callback=None)
-                    return True
+        chain = self.__conditionChains.get(self.__currentStateId)
+        if chain is None or self.isFinished() or not self.__currentState.canTransit():
+            return False
+        if self.__adaptiveChains is not None:
+            adaptiveChain = self.__adaptiveChains.get(self.__currentStateId)
+            if adaptiveChain is not None:
+                dst = adaptiveChain.poll()
+                if dst is None:
+                    return False
+                self.__performTransition(dst, callback=None)
+                return True
+        for condition, dst in chain:
+            if condition():
+                self.__performTransition(dst, callback=None)
+                return True
         return False
 
     def __performTransition(self, dst, callback, forced=False):
         previousStateId = self.__currentStateId
-        if forced:
+        if self.__actions is not None:
+            self.__actions.cancel()
+        if self.profiler is not None:
+            self.__callHook(self.__currentState, 'interrupt' if forced else 'leave', {})
+        elif forced:
             self.__currentState.interrupt({})
         else:
             self.__currentState.leave({})
 
         self.__currentStateId = dst
-        self.__currentState.enter(self.__statesMap[previousStateId], {})
+        if self.__index is not None:
+            self.__index.move(self, previousStateId, dst)
+        previousState = self.__statesMap[previousStateId]
+        if self.profiler is None:
+            self.__currentState.enter(previousState, {})
+        else:
+            self.__callHook(self.__currentState, 'enter', previousState, {})
+        if self.__actions is not None and dst in self.__actions.states:
+            self.__actions.start(self.__currentState, {})
+        if self.metrics is not None:
+            self.metrics.transition(previousStateId, dst)
 
         if callback:
             callback()
         # state machine might have been destroyed during new state activation
         if not self.__isDestroyed:
-            self.__callCallbacks(previousStateId, self.__currentStateId)
+            if self.__callbacks is not None:
+                listeners = self.__callbacks.tables.get(previousStateId)
+                if listeners is not None:
+                    for listener in listeners[dst]:
+                        listener(previousStateId, dst)
+            if self.__timers and self.isFinished():
+                self.__cancelTimers()
+            if self.__deferredEvents:
+                self.__recallDeferred()
 
     @property
     def __currentState(self):
         return self.__statesMap[self.__currentStateId]
 
-    def __addUpdateEvent(self):
-        if self.__transitionsCount > _MAX_TRANSITIONS:
-            print("Finite state machine has exceeded the maximum amount of transitions per tick")
-            return
-
-        self.addEvent(_UPDATE_EVENT)
-        self.__transitionsCount += 1
-
     def __run(self):
         while self.__newEvents:
             events = list(self.__newEvents)
             del self.__newEvents[:]
-            for eventName, eventData in events:
+            self.__pendingByName.clear()
+            for eventName, eventData, _ in events:
+                self.__processEvent(eventName, eventData)
+
+    def __runInstrumented(self):
+        cascadeDepth = 0
+        while self.__newEvents:
+            events = list(self.__newEvents)
+            del self.__newEvents[:]
+            self.__pendingByName.clear()
+            if self.metrics is not None:
+                cascadeDepth += 1
+                self.metrics.cascade(cascadeDepth)
+                self.metrics.queue(0)
+            for eventName, eventData, context in events:
+                self.__processInstrumented(eventName, eventData, context)
+
+    def __runLanes(self, instrumented):
+        while True:
+            entry = self.__lanes.pop()
+            if entry is None:
+                return
+            eventName, eventData, context, lane, enqueuedAt = entry
+            if self.__pendingByName.get(eventName) is entry:
+                del self.__pendingByName[eventName]
+            if not instrumented:
                 self.__processEvent(eventName, eventData)
+                continue
+            if self.metrics is not None:
+                self.metrics.laneWait(PRIORITY_LANES[lane], _clock() - enqueuedAt, self.__lanes.depth(lane))
+            self.__processInstrumented(eventName, eventData, context)
+
+    def __processInstrumented(self, eventName, eventData, context):
+        if self.profiler is None:
+            self.__processEventInstrumented(eventName, eventData)
+        else:
+            self.profiler.event(self.__name, self.__currentStateId, eventName, context,
+                                self.__processEventInstrumented, eventName, eventData)
 
     def __processEvent(self, eventName, eventData):
         if eventData is None:
             eventData = {}
+        srcId = self.__currentStateId
+        dst = self.__acceptEvent(eventName, eventData)
+        if dst is None:
+            return
 
+        prevState = self.__statesMap[srcId]
+        if srcId != dst:
+            if self.__actions is not None:
+                self.__actions.cancel()
+            prevState.leave(eventData)
+            self.__currentStateId = dst
+            if self.__index is not None:
+                self.__index.move(self, srcId, dst)
+            currentState = self.__statesMap[dst]
+            currentState.enter(prevState, eventData)
+            # nothing else to do for a machine without actions, listeners, timers and deferred events
+            if self.__actions is not None or self.__callbacks is not None or self.__timers or self.__deferredEvents:
+                self.__entered(srcId, dst, currentState, eventData)
+        else:
+            prevState.reenter(eventData)
+
+    def __processEventInstrumented(self, eventName, eventData):
+        # __processEvent with the hooks run under the profiler and counted
+        if eventData is None:
+            eventData = {}
+        srcId = self.__currentStateId
+        dst = self.__acceptEvent(eventName, eventData)
+        if dst is None:
+            return
+
+        prevState = self.__statesMap[srcId]
+        if srcId != dst:
+            if self.__actions is not None:
+                self.__actions.cancel()
+            self.__runHook(prevState, 'leave', eventData)
+            currentState = self.__moveTo(srcId, dst)
+            self.__runHook(currentState, 'enter', prevState, eventData)
+            self.__entered(srcId, dst, currentState, eventData)
+        else:
+            self.__runHook(prevState, 'reenter', eventData)
+
+        if self.metrics is not None:
+            self.metrics.eventProcessed()
+            self.metrics.transition(srcId, dst)
+
+    def __acceptEvent(self, eventName, eventData):
+        '''
+            Returns the destination of the event in the current state, or
+            None when the event is deferred or its condition doesn't hold.
+        '''
         if not self.can(eventName):
+            deferrable = self.__deferrable.get(self.__currentStateId)
+            if deferrable is not None and eventName in deferrable:
+                self.__deferredEvents.append((eventName, eventData))
+                if self.metrics is not None:
+                    self.metrics.eventDeferred()
+                return None
+            if self.metrics is not None:
+                self.metrics.eventRejected()
             raise FSMError("event {} inappropriate in current state {}".format(eventName, self.__currentStateId))
 
         # Finds the destination state, after this event is completed.
-        dst = self.__eventTransitionMap[eventName][self.__currentStateId]
-        info = self.__transactionMap[self.__currentStateId][dst]
-
-        event, cond = info
-        if cond is not None:
-            if not cond():
-                return
+        srcId = self.__currentStateId
+        dst = self.__eventTransitionMap[eventName][srcId]
+        _, cond = self.__transactionMap[srcId][dst]
+        if cond is not None and not cond():
+            if self.metrics is not None:
+                self.metrics.eventCanceled()
+            return None
+        return dst
+
+    def __moveTo(self, srcId, dst):
+        self.__currentStateId = dst
+        if self.__index is not None:
+            self.__index.move(self, srcId, dst)
+        return self.__statesMap[dst]
+
+    def __entered(self, srcId, dst, currentState, eventData):
+        if self.__actions is not None and dst in self.__actions.states:
+            self.__actions.start(currentState, eventData)
+        if self.__callbacks is not None:
+            listeners = self.__callbacks.tables.get(srcId)
+            if listeners is not None:
+                for listener in listeners[dst]:
+                    listener(srcId, dst)
+        if self.__timers and self.isFinished():
+            self.__cancelTimers()
+        if self.__deferredEvents and not self.__isDestroyed:
+            self.__recallDeferred()
+
+    def __onLivelock(self, cycle):
+        previous = self.__lastLivelock
+        diagnostic = {
+            'machine': self.__name,
+            'state': self.__currentStateId,
+            'cycle': cycle,
+            'policy': self.__livelockPolicy,
+        }
+        self.__lastLivelock = diagnostic
+        if self.metrics is not None:
+            self.metrics.livelock()
+        if self.__livelockPolicy == LIVELOCK_RAISE:
+            raise FSMLivelockError(diagnostic)
+        if self.__livelockPolicy == LIVELOCK_FREEZE:
+            self.__isFrozen = True
+        # a ping-pong repeats every tick, only a new cycle is logged
+        if previous is None or previous['cycle'] != cycle:
+            _logger.warning('Finite state machine livelock: %s', diagnostic)
+
+    def __recallDeferred(self):
+        '''
+            Re-queues the parked events after a state change, in their
+            original order. Events still deferrable in the new state are
+            parked again.
+        '''
+        events = self.__deferredEvents
+        self.__deferredEvents = []
+        for eventName, eventData in events:
+            self.addEvent(eventName, eventData)
 
-        if self.__currentStateId != dst:
-            prevState = self.__statesMap[self.__currentStateId]
-            prevState.leave(eventData)
+    def __coalesceEvent(self, pending, policy, eventData):
+        '''
+            Applies the coalescing policy to an event which is already queued;
+            the queued entry keeps its position.
+        '''
+        if policy == COALESCE_KEEP_LATEST:
+            pending[1] = eventData
+        elif policy == COALESCE_MERGE:
+            if isinstance(pending[1], Mapping) and isinstance(eventData, Mapping):
+                merged = dict(pending[1])
+                merged.update(eventData)
+                pending[1] = merged
+            elif eventData is not None:
+                pending[1] = eventData
+        if self.metrics is not None:
+            self.metrics.eventCoalesced()
+
+    def __getScheduler(self):
+        if self.__scheduler is None:
+            self.__scheduler = EventScheduler()
+        return self.__scheduler
+
+    def __cancelTimers(self):
+        if self.__timers:
+            for handle in list(self.__timers):
+                handle.cancel()
+        self.__timers = None
+
+    def __callHook(self, state, hook, *args):
+        return self.profiler.call(self.__name, state.name, hook, getattr(state, hook), *args)
+
+    def __runHook(self, state, hook, *args):
+        if self.profiler is None:
+            return getattr(state, hook)(*args)
+        return self.__callHook(state, hook, *args)
 
-            self.__currentStateId = dst
-            currentState = self.__statesMap[self.__currentStateId]
-            currentState.enter(prevState, eventData)
+    @staticmethod
+    def __addGuardExpressions(transitions, conditions, context):
+        '''
+            Returns the conditions extended by the guard expressions of the
+            transitions ("ctx.hp < 10") bound to the context.
+        '''
+        expressions = [transition['condition'] for transition in transitions
+                       if _is_base_string(transition.get('condition')) and transition['condition'] not in conditions]
+        if not expressions:
+            return conditions
+        from fsm.GuardExpression import isExpression, makeGuard
+        expressions = [expression for expression in expressions if isExpression(expression)]
+        if not expressions:
+            return conditions
+        if context is None:
+            raise FSMConfigError("Config has guard expressions but doesn't have 'context'")
+        conditions = dict(conditions)
+        for expression in expressions:
+            conditions[expression] = makeGuard(expression, context)
+        return conditions
 
-            self.__callCallbacks(prevState, currentState)
-        else:
-            currentState = self.__statesMap[self.__currentStateId]
-            currentState.reenter(eventData)
+    @staticmethod
+    def __compileConditionChains(transactionMap, priorities):
+        '''
+            Returns {state: ((condition, dst), ...)} of the transitions without
+            an event, ordered by descending priority (stable).
+        '''
+        chains = {}
+        interned = {}  # e.g. wildcard condition transitions give every state the same chain
+        for src, transitions in transactionMap.items():
+            chain = [(condition, dst) for dst, (event, condition) in transitions.items()
+                     if event is None and condition is not None]
+            if chain:
+                chain.sort(key=lambda item: -priorities.get((src, item[1]), 0))
+                chain = tuple(chain)
+                chains[src] = interned.setdefault(chain, chain)
+        return chains
 
     def __addTransaction(self, src, dst, event, condition, transactionMap, eventTransitionMap):
         transitions = transactionMap.setdefault(src.name, {})
@@ -437,6 +1492,8 @@ class Fysom(object):
     '''
         Wraps the complete finite state machine operations.
     '''
+    metrics = None  # TransitionMetrics instance, see fsm.TransitionMetrics
+    profiler = None  # HookProfiler instance, see fsm.HookProfiler
 
     def __init__(self, cfg=None, initial=None, events=None, callbacks=None,
                  final=None, **kwargs):
@@ -513,10 +1570,18 @@ class Fysom(object):
         '''
             Returns if the given event be fired in the current machine state.
         '''
-        return (
-                event in self.__map and
-                ((self.current in self.__map[event]) or _ALL_STATES in self.__map[event]) and not
-                hasattr(self, 'transition'))
+        if event.__class__ is EventHandle:
+            event = event.name
+        return (event in self.__eventSets.available.get(self.current, self.__eventSets.anyEvents) and
+                not hasattr(self, 'transition'))
+
+    def available_events(self):
+        '''
+            Returns the events which can be fired in the current state.
+        '''
+        if hasattr(self, 'transition'):
+            return _NO_EVENTS
+        return self.__eventSets.available.get(self.current, self.__eventSets.anyEvents)
 
     def cannot(self, event):
         '''
@@ -542,6 +1607,7 @@ class Fysom(object):
             init = {'state': init}
 
         self.__final = cfg['final'] if 'final' in cfg else None
+        self.__name = cfg.get('name', type(self).__name__)
 
         events = cfg['events'] if 'events' in cfg else []
         callbacks = cfg['callbacks'] if 'callbacks' in cfg else {}
@@ -571,6 +1637,7 @@ class Fysom(object):
 
         for e in events:
             add(e)
+        self.__eventSets = _compileEventSets(tmap)
 
         # For all the events as present in machine map, construct the event
         # handler.
@@ -596,59 +1663,10 @@ class Fysom(object):
         '''
 
         def fn(*args, **kwargs):
-
-            if hasattr(self, 'transition'):
-                raise FysomError(
-                    "event %s inappropriate because previous transition did not complete" % event)
-
-            # Check if this event can be triggered in the current state.
-            if not self.can(event):
-                raise FysomError(
-                    "event %s inappropriate in current state %s" % (event, self.current))
-
-            # On event occurence, source will always be the current state.
-            src = self.current
-            # Finds the destination state, after this event is completed.
-            dst = ((src in self.__map[event] and self.__map[event][src]) or
-                   _ALL_STATES in self.__map[event] and self.__map[event][_ALL_STATES])
-            if dst == _SAME_DST:
-                dst = src
-
-            # Prepares the object with all the meta data to be passed to
-            # callbacks.
-            class _e_obj(object):
-                pass
-
-            e = _e_obj()
-            e.fsm, e.event, e.src, e.dst = self, event, src, dst
-            for k in kwargs:
-                setattr(e, k, kwargs[k])
-
-            setattr(e, 'args', args)
-
-            # Try to trigger the before event, unless it gets canceled.
-            if self.__before_event(e) is False:
-                raise Canceled(
-                    "Cannot trigger event {0} because the onbefore{0} handler returns False".format(e.event))
-
-            # Wraps the activities that must constitute a single successful
-            # transaction.
-            if self.current != dst:
-                def _tran():
-                    delattr(self, 'transition')
-                    self.current = dst
-                    self.__enter_state(e)
-                    self.__change_state(e)
-                    self.__after_event(e)
-
-                self.transition = _tran
-
-                # Hook to perform asynchronous transition.
-                if self.__leave_state(e) is not False:
-                    self.transition()
-            else:
-                self.__reenter_state(e)
-                self.__after_event(e)
+            if self.metrics is None and self.profiler is None:
+                return self.__fire(event, None, args, kwargs)
+            return _instrumented_event(self, self.__name, self.current, event, self.__fire,
+                                       (event, self.metrics, args, kwargs), {})
 
         fn.__name__ = str(event)
         fn.__doc__ = ("Event handler for an {event} event. This event can be " +
@@ -657,13 +1675,81 @@ class Fysom(object):
 
         return fn
 
+    def __fire(self, event, metrics, args, kwargs):
+        '''
+            Triggers the event; metrics is None unless the machine is
+            instrumented.
+        '''
+        if hasattr(self, 'transition'):
+            if metrics is not None:
+                metrics.eventRejected()
+            raise FysomError(
+                "event %s inappropriate because previous transition did not complete" % event)
+
+        # Check if this event can be triggered in the current state.
+        if not self.can(event):
+            if metrics is not None:
+                metrics.eventRejected()
+            raise FysomError(
+                "event %s inappropriate in current state %s" % (event, self.current))
+
+        # On event occurence, source will always be the current state.
+        src = self.current
+        # Finds the destination state, after this event is completed.
+        dst = ((src in self.__map[event] and self.__map[event][src]) or
+               _ALL_STATES in self.__map[event] and self.__map[event][_ALL_STATES])
+        if dst == _SAME_DST:
+            dst = src
+
+        # Prepares the object with all the meta data to be passed to
+        # callbacks.
+        class _e_obj(object):
+            pass
+
+        e = _e_obj()
+        e.fsm, e.event, e.src, e.dst = self, event, src, dst
+        for k in kwargs:
+            setattr(e, k, kwargs[k])
+
+        setattr(e, 'args', args)
+
+        # Try to trigger the before event, unless it gets canceled.
+        if self.__before_event(e) is False:
+            if metrics is not None:
+                metrics.eventCanceled()
+            raise Canceled(
+                "Cannot trigger event {0} because the onbefore{0} handler returns False".format(e.event))
+
+        # Wraps the activities that must constitute a single successful
+        # transaction.
+        if self.current != dst:
+            def _tran():
+                delattr(self, 'transition')
+                self.current = dst
+                if metrics is not None:
+                    metrics.transition(src, dst)
+                self.__enter_state(e)
+                self.__change_state(e)
+                self.__after_event(e)
+
+            self.transition = _tran
+
+            # Hook to perform asynchronous transition.
+            if self.__leave_state(e) is not False:
+                self.transition()
+        else:
+            if metrics is not None:
+                metrics.transition(src, dst)
+            self.__reenter_state(e)
+            self.__after_event(e)
+
     def __before_event(self, e):
         '''
             Checks to see if the callback is registered before this event can be triggered.
         '''
         for fnname in ['onbefore' + e.event, 'on_before_' + e.event]:
             if hasattr(self, fnname):
-                return getattr(self, fnname)(e)
+                return self.__callback(fnname, e.src, e)
 
     def __after_event(self, e):
         '''
@@ -672,7 +1758,7 @@ class Fysom(object):
         for fnname in ['onafter' + e.event, 'on' + e.event,
                        'on_after_' + e.event, 'on_' + e.event]:
             if hasattr(self, fnname):
-                return getattr(self, fnname)(e)
+                return self.__callback(fnname, e.dst, e)
 
     def __leave_state(self, e):
         '''
@@ -682,7 +1768,7 @@ class Fysom(object):
         '''
         for fnname in ['onleave' + e.src, 'on_leave_' + e.src]:
             if hasattr(self, fnname):
-                return getattr(self, fnname)(e)
+                return self.__callback(fnname, e.src, e)
 
     def __enter_state(self, e):
         '''
@@ -691,7 +1777,7 @@ class Fysom(object):
         for fnname in ['onenter' + e.dst, 'on' + e.dst,
                        'on_enter_' + e.dst, 'on_' + e.dst]:
             if hasattr(self, fnname):
-                return getattr(self, fnname)(e)
+                return self.__callback(fnname, e.dst, e)
 
     def __reenter_state(self, e):
         '''
@@ -700,7 +1786,7 @@ class Fysom(object):
         '''
         for fnname in ['onreenter' + e.dst, 'on_reenter_' + e.dst]:
             if hasattr(self, fnname):
-                return getattr(self, fnname)(e)
+                return self.__callback(fnname, e.dst, e)
 
     def __change_state(self, e):
         '''
@@ -708,7 +1794,12 @@ class Fysom(object):
         '''
         for fnname in ['onchangestate', 'on_change_state']:
             if hasattr(self, fnname):
-                return getattr(self, fnname)(e)
+                return self.__callback(fnname, e.dst, e)
+
+    def __callback(self, fnname, state, e):
+        if self.profiler is None:
+            return getattr(self, fnname)(e)
+        return self.profiler.call(self.__name, state, fnname, getattr(self, fnname), e)
 
     def __is_base_string(self, object):  # pragma: no cover
         '''
@@ -724,8 +1815,10 @@ class Fysom(object):
             Triggers the given event.
             The event can be triggered by calling the event handler directly, for ex: fsm.eat()
             but this method will come in handy if the event is determined dynamically and you have
-            the event name to trigger as a string.
+            the event name to trigger as a string or an EventHandle.
         '''
+        if event.__class__ is EventHandle:
+            event = event.name
         if not hasattr(self, event):
             raise FysomError(
                 "There isn't any event registered as %s" % event)
@@ -764,22 +1857,32 @@ class FysomGlobalMixin(object):
 
     @current.setter
     def current(self, state):
-        setattr(self, self.GSM.state_field, state)
+        self.GSM._set_state(self, state)
 
 
 class FysomGlobal(object):
     '''
         Target to be used as global machine.
     '''
+    metrics = None  # TransitionMetrics instance, see fsm.TransitionMetrics
+    profiler = None  # HookProfiler instance, see fsm.HookProfiler
 
     def __init__(self, cfg={}, initial=None, events=None, callbacks=None,
-                 final=None, state_field=None, **kwargs):
+                 final=None, state_field=None, storage=None, index=False,
+                 **kwargs):
         '''
         Construct a Global Finite State Machine.
 
         Takes same arguments as Fysom and an additional state_field
         to specify which field holds the state to be processed.
 
+        Optional storage (e.g. SQLiteStateStorage) receives every state
+        change via storage.write(obj, state), so models don't have to be
+        saved as a whole after each transition.
+
+        With index (True or a shared StateIndex) the machine maintains a live
+        state -> objects index, see members() and count().
+
         Difference with Fysom:
 
         1.  Initial state will only be automatically triggered for class
@@ -841,6 +1944,10 @@ class FysomGlobal(object):
         if not state_field:
             raise FysomError('state_field required for global machine')
         self.state_field = state_field
+        self._storage = storage
+        if index is True:
+            index = StateIndex()
+        self._index = index or None
 
         if "events" not in cfg:
             cfg["events"] = []
@@ -864,6 +1971,7 @@ class FysomGlobal(object):
                 events_dicts.append({"name": name, "src": src, "dst": dst})
         cfg["events"] = events_dicts
 
+        self._name = cfg.get('name', type(self).__name__)
         self._map = {}  # different with Fysom's _map attribute
         self._callbacks = {}
         self._initial = None
@@ -911,66 +2019,17 @@ class FysomGlobal(object):
         for event in self._map:
             setattr(self, event, self._build_event(event))
 
+        self._eventSets = _compileEventSets({event: e['src'] for event, e in self._map.items()})
+
         for name, callback in cfg['callbacks'].items():
             self._callbacks[name] = _weak_callback(callback)
 
     def _build_event(self, event):
         def fn(obj, *args, **kwargs):
-            if not self.can(obj, event):
-                raise FysomError(
-                    'event %s inappropriate in current state %s'
-                    % (event, self.current(obj)))
-
-            # Prepare the event object with all the meta data to pas through.
-            # On event occurrence, source will always be the current state.
-            e = self._e_obj()
-            e.fsm, e.obj, e.event, e.src, e.dst = (
-                self, obj, event, self.current(obj), self._map[event]['dst'])
-            setattr(e, 'args', args)
-            setattr(e, 'kwargs', kwargs)
-            for k, v in kwargs.items():
-                setattr(e, k, v)
-
-            # check conditions first, event dst may change during
-            # checking conditions
-            for c in self._map[event].get('cond', ()):
-                target = True in c
-                cond = c[target]
-                _c_r = self._check_condition(obj, cond, target, e)
-                if not _c_r:
-                    if 'else' in c:
-                        e.dst = c['else']
-                        break
-                    else:
-                        raise Canceled(
-                            'Cannot trigger event {0} because the {1} '
-                            'condition not returns {2}'.format(
-                                event, cond, target), e
-                        )
-
-            # try to trigger the before event, unless it gets cancelled.
-            if self._before_event(obj, e) is False:
-                raise Canceled(
-                    'Cannot trigger event {0} because the onbefore{0} '
-                    'handler returns False'.format(event), e)
-
-            # wraps the activities that must constitute a single transaction
-            if self.current(obj) != e.dst:
-                def _trans():
-                    delattr(obj, 'transition')
-                    setattr(obj, self.state_field, e.dst)
-                    self._enter_state(obj, e)
-                    self._change_state(obj, e)
-                    self._after_event(obj, e)
-
-                obj.transition = _trans
-
-                # Hook to perform asynchronous transition
-                if self._leave_state(obj, e) is not False:
-                    obj.transition()
-            else:
-                self._reenter_state(obj, e)
-                self._after_event(obj, e)
+            if self.metrics is None and self.profiler is None:
+                return self._fire(obj, event, None, args, kwargs)
+            return _instrumented_event(self, self._name, self.current(obj), event, self._fire,
+                                       (obj, event, self.metrics, args, kwargs), {})
 
         fn.__name__ = str(event)
         fn.__doc__ = (
@@ -980,6 +2039,77 @@ class FysomGlobal(object):
 
         return fn
 
+    def _fire(self, obj, event, metrics, args, kwargs):
+        '''
+            Triggers the event on obj; metrics is None unless the machine is
+            instrumented.
+        '''
+        if not self.can(obj, event):
+            if metrics is not None:
+                metrics.eventRejected()
+            raise FysomError(
+                'event %s inappropriate in current state %s'
+                % (event, self.current(obj)))
+
+        # Prepare the event object with all the meta data to pas through.
+        # On event occurrence, source will always be the current state.
+        e = self._e_obj()
+        e.fsm, e.obj, e.event, e.src, e.dst = (
+            self, obj, event, self.current(obj), self._map[event]['dst'])
+        setattr(e, 'args', args)
+        setattr(e, 'kwargs', kwargs)
+        for k, v in kwargs.items():
+            setattr(e, k, v)
+
+        # check conditions first, event dst may change during
+        # checking conditions
+        for c in self._map[event].get('cond', ()):
+            target = True in c
+            cond = c[target]
+            _c_r = self._check_condition(obj, cond, target, e)
+            if not _c_r:
+                if 'else' in c:
+                    e.dst = c['else']
+                    break
+                else:
+                    if metrics is not None:
+                        metrics.eventCanceled()
+                    raise Canceled(
+                        'Cannot trigger event {0} because the {1} '
+                        'condition not returns {2}'.format(
+                            event, cond, target), e
+                    )
+
+        # try to trigger the before event, unless it gets cancelled.
+        if self._before_event(obj, e) is False:
+            if metrics is not None:
+                metrics.eventCanceled()
+            raise Canceled(
+                'Cannot trigger event {0} because the onbefore{0} '
+                'handler returns False'.format(event), e)
+
+        # wraps the activities that must constitute a single transaction
+        if self.current(obj) != e.dst:
+            def _trans():
+                delattr(obj, 'transition')
+                if metrics is not None:
+                    metrics.transition(e.src, e.dst)
+                self._set_state(obj, e.dst)
+                self._enter_state(obj, e)
+                self._change_state(obj, e)
+                self._after_event(obj, e)
+
+            obj.transition = _trans
+
+            # Hook to perform asynchronous transition
+            if self._leave_state(obj, e) is not False:
+                obj.transition()
+        else:
+            if metrics is not None:
+                metrics.transition(e.src, e.dst)
+            self._reenter_state(obj, e)
+            self._after_event(obj, e)
+
     class _e_obj(object):
         pass
 
@@ -993,9 +2123,15 @@ class FysomGlobal(object):
     def _do_callbacks(self, obj, callbacks, *args, **kwargs):
         for cb in callbacks:
             if cb in self._callbacks:
-                return self._callbacks[cb](*args, **kwargs)
-            if hasattr(obj, cb):
-                return getattr(obj, cb)(*args, **kwargs)
+                fn = self._callbacks[cb]
+            elif hasattr(obj, cb):
+                fn = getattr(obj, cb)
+            else:
+                continue
+            if self.profiler is None:
+                return fn(*args, **kwargs)
+            return self.profiler.call(
+                self._name, self.current(obj), cb, functools.partial(fn, **kwargs), *args)
 
     def _check_condition(self, obj, func, target, e):
         if callable(func):
@@ -1028,19 +2164,79 @@ class FysomGlobal(object):
         callbacks = ['onchangestate', 'on_change_state']
         return self._do_callbacks(obj, callbacks, e)
 
+    def _set_state(self, obj, state):
+        self._restore_state(obj, state)
+        if self._storage is not None:
+            self._storage.write(obj, state)
+
+    def _restore_state(self, obj, state):
+        if self._index is not None:
+            self._index.move(obj, getattr(obj, self.state_field, None), state)
+        setattr(obj, self.state_field, state)
+
     def current(self, obj):
         return getattr(obj, self.state_field) or 'none'
 
+    def members(self, state):
+        '''
+            Returns all indexed objects currently in the given state.
+        '''
+        if self._index is None:
+            raise FysomError('index required for state queries')
+        return self._index.members(state)
+
+    def count(self, state):
+        '''
+            Returns the number of indexed objects currently in the given state.
+        '''
+        if self._index is None:
+            raise FysomError('index required for state queries')
+        return self._index.count(state)
+
+    def forget(self, obj):
+        '''
+            Removes the object from the state index.
+        '''
+        if self._index is not None:
+            self._index.discard(obj, getattr(obj, self.state_field, None))
+
+    def rehydrate(self, objects):
+        '''
+            Restores states of the given objects (a mapping of storage key to
+            object) from the storage. No callbacks are triggered.
+            Returns the number of restored objects.
+        '''
+        if self._storage is None:
+            raise FysomError('storage required for rehydration')
+        count = 0
+        for key, state in self._storage.load():
+            obj = objects.get(key)
+            if obj is not None:
+                self._restore_state(obj, state)
+                count += 1
+        return count
+
     def isstate(self, obj, state):
         return self.current(obj) == state
 
     is_state = isstate
 
     def can(self, obj, event):
-        if event not in self._map or hasattr(obj, 'transition'):
+        if event.__class__ is EventHandle:
+            event = event.name
+        if hasattr(obj, 'transition'):
             return False
-        src = self._map[event]['src']
-        return self.current(obj) in src or _ALL_STATES in src
+        eventSets = self._eventSets
+        return event in eventSets.available.get(self.current(obj), eventSets.anyEvents)
+
+    def available_events(self, obj):
+        '''
+            Returns the events which can be fired in the current state of obj.
+        '''
+        if hasattr(obj, 'transition'):
+            return _NO_EVENTS
+        eventSets = self._eventSets
+        return eventSets.available.get(self.current(obj), eventSets.anyEvents)
 
     def cannot(self, obj, event):
         return not self.can(obj, event)
@@ -1049,6 +2245,8 @@ class FysomGlobal(object):
         return self._final and (self.current(obj) == self._final)
 
     def trigger(self, obj, event, *args, **kwargs):
+        if event.__class__ is EventHandle:
+            event = event.name
         if not hasattr(self, event):
             raise FysomError(
                 "There isn't any event registered as %s" % event)
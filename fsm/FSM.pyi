@@ -1,5 +1,7 @@
-from typing import TypedDict, List, Union, Literal, Optional, Dict, Callable
-from .FSM import FSMState
+from concurrent.futures import Executor
+from typing import TypedDict, List, Union, Literal, Optional, Dict, Callable, Any
+from .FSM import FSMState, ConditionMemo
+from .EventScheduler import EventScheduler
 
 
 
@@ -13,10 +15,24 @@ class Transition(TypedDict):
     dst: str
     event: str
     condition: Optional[str]
+    priority: Optional[int]
+    exclusive: Optional[bool]
 
 
 class Config(TypedDict):
+    name: Optional[str]
     initial: Initial
     transitions: List[Transition]
     states: Optional[List[FSMState]]
     conditions: Optional[Dict[str, Callable[[], bool]]]
+    context: Optional[Any]
+    executor: Optional[Executor]
+    scheduler: Optional[EventScheduler]
+    coalesce: Optional[Dict[str, Literal["keep-first", "keep-latest", "merge"]]]
+    deferred: Optional[Dict[Union[str, Literal["*"]], List[str]]]
+    priorities: Optional[Dict[str, Literal["high", "normal", "low"]]]
+    starvationLimit: Optional[int]
+    adaptiveConditions: Optional[Union[bool, int]]
+    livelock: Optional[Literal["stop", "raise", "freeze"]]
+    tickConditions: Optional[List[str]]
+    conditionMemo: Optional[ConditionMemo]
@@ -1,7 +1,18 @@
 # -*- coding: utf-8 -*-
 from LogUtils import LOG_ERROR
 
-MAX_TRANSITIONS = 100
+LIVELOCK_STOP = 'stop'
+LIVELOCK_RAISE = 'raise'
+LIVELOCK_FREEZE = 'freeze'
+
+
+class LivelockError(Exception):
+	"""
+	Condition transitions of one update() returned to an already visited state.
+	"""
+	def __init__(self, diagnostic):
+		super(LivelockError, self).__init__("Livelock in finite state machine, cycle: %s" % (diagnostic['cycle'],))
+		self.diagnostic = diagnostic
 
 
 class ConstantsEnum:
@@ -88,6 +99,9 @@ class TimedState(FiniteStateMachineState):
 
 
 class FiniteStateMachine(object):
+	metrics = None  # TransitionMetrics instance, see fsm.TransitionMetrics
+	livelockPolicy = LIVELOCK_STOP
+
 	def __init__(self):
 		self.__stateMap = {}
 		self.__states = []
@@ -95,6 +109,8 @@ class FiniteStateMachine(object):
 		self.__currentStateIndex = 0
 		self.evStateChanged = Event()
 		self.isDestroyed = False
+		self.isFrozen = False
+		self.lastLivelock = None
 
 	def init(self, defaultState, *states):
 		"""
@@ -174,21 +190,50 @@ class FiniteStateMachine(object):
 		self.addCallback(self.__stateMap[fromStateId], self.__stateMap[toStateId], callback)
 
 	def update(self, dt):
+		# state indices visited during this tick as a bitset, the cascade stops at the first repeated state
 		transitionCount = 0
-		while True:
+		visited = 0
+		path = None
+		while not self.isFrozen:
+			fromStateIndex = self.__currentStateIndex
 			transited = self.updateTransitions()
 			if not transited or self.isDestroyed:
 				break
 
 			transitionCount += 1
-			if transitionCount > MAX_TRANSITIONS:
-				LOG_ERROR("FiniteStateMachine",
-						  "Finite state machine has exceeded the maximum amount of transitions per tick")
+			if self.metrics is not None:
+				self.metrics.cascade(transitionCount)
+			if path is None:
+				visited = 1 << fromStateIndex
+				path = [fromStateIndex]
+			toStateIndex = self.__currentStateIndex
+			if visited & (1 << toStateIndex):
+				self.__onLivelock(path[path.index(toStateIndex):] + [toStateIndex])
 				break
+			visited |= 1 << toStateIndex
+			path.append(toStateIndex)
 
 		if not self.isDestroyed:
 			self.currentState().update(dt)
 
+	def __onLivelock(self, cycle):
+		previous = self.lastLivelock
+		diagnostic = {
+			'cycle': [self.__states[index].stateId for index in cycle],
+			'state': self.currentState().stateId,
+			'policy': self.livelockPolicy,
+		}
+		self.lastLivelock = diagnostic
+		if self.metrics is not None:
+			self.metrics.livelock()
+		if self.livelockPolicy == LIVELOCK_RAISE:
+			raise LivelockError(diagnostic)
+		if self.livelockPolicy == LIVELOCK_FREEZE:
+			self.isFrozen = True
+		# a ping-pong repeats every tick, only a new cycle is logged
+		if previous is None or previous['cycle'] != diagnostic['cycle']:
+			LOG_ERROR("FiniteStateMachine", "Finite state machine livelock: %s" % (diagnostic,))
+
 	def updateTransitions(self):
 		"""
 		Attempts to transit to the next state. Transition can only happen if the current state is ready for it and if
@@ -199,7 +244,7 @@ class FiniteStateMachine(object):
 		:return: True if transition was successful, False otherwise
 		"""
 		if self.currentState().canTransit() and self.__currentStateIndex in self.__transitions:
-			for toStateIndex, transition in self.__transitions[self.__currentStateIndex].iteritems():
+			for toStateIndex, transition in self.__transitions[self.__currentStateIndex].items():
 				condition, callback = transition
 				if condition is None or condition():
 					self.__performTransition(toStateIndex, callback)
@@ -247,6 +292,8 @@ class FiniteStateMachine(object):
 
 		newState = self.currentState()
 		newState.activate()
+		if self.metrics is not None:
+			self.metrics.transition(previousState.stateId, newState.stateId)
 
 		if callback:
 			callback()
@@ -259,6 +306,7 @@ class FiniteStateMachine(object):
 		for state in self.__states:
 			state.reset()
 		self.__currentStateIndex = 0
+		self.isFrozen = False
 		self.currentState().activate()
 
 	def kill(self):
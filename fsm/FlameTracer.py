@@ -0,0 +1,82 @@
+import time
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class FlameTracer(object):
+    '''
+        Records nested machine activity as collapsed stacks
+        ("machine;state;event;hook count") ready for flamegraph tooling.
+        It implements the same protocol as HookProfiler, so it is enabled by
+        assigning an instance to the "profiler" attribute of FSM, Fysom or
+        FysomGlobal. Events posted from a hook are recorded under the stack of
+        that hook even when the machine processes them later from its queue.
+
+        tracer = FlameTracer()
+        FSM.profiler = tracer
+        ...
+        tracer.write('fsm.folded')  # flamegraph.pl fsm.folded > fsm.svg
+    '''
+
+    def __init__(self):
+        self.__stack = []
+        self.__children = [0.0]
+        self.__counts = {}
+        self.__times = {}
+
+    def context(self):
+        '''
+            Returns the current stack, stored with events posted to a queue.
+        '''
+        return tuple(self.__stack) if self.__stack else None
+
+    def event(self, definition, state, eventName, context, fn, *args):
+        stack = self.__stack
+        if context is not None:
+            self.__stack = list(context)
+        try:
+            return self.__frame((definition, state, eventName), fn, args)
+        finally:
+            self.__stack = stack
+
+    def call(self, definition, state, hook, fn, *args):
+        frames = (hook,) if self.__stack else (definition, state, hook)
+        return self.__frame(frames, fn, args)
+
+    def __frame(self, frames, fn, args):
+        stack = self.__stack
+        stack.extend(frames)
+        self.__children.append(0.0)
+        start = _clock()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = _clock() - start
+            children = self.__children.pop()
+            self.__children[-1] += elapsed
+            key = ';'.join(stack)
+            self.__counts[key] = self.__counts.get(key, 0) + 1
+            self.__times[key] = self.__times.get(key, 0.0) + max(elapsed - children, 0.0)
+            del stack[-len(frames):]
+
+    def clear(self):
+        self.__counts.clear()
+        self.__times.clear()
+
+    def collapsed(self, weight='count'):
+        '''
+            Returns collapsed stack lines. weight is "count" (number of
+            invocations) or "time" (self time in microseconds).
+        '''
+        if weight == 'count':
+            values = self.__counts
+        elif weight == 'time':
+            values = {key: int(value * 1e6) for key, value in self.__times.items()}
+        else:
+            raise ValueError("Unknown weight '{}'".format(weight))
+        return ['{} {}'.format(key, value) for key, value in sorted(values.items())]
+
+    def write(self, path, weight='count'):
+        with open(path, 'w') as fd:
+            for line in self.collapsed(weight):
+                fd.write(line + '\n')
@@ -0,0 +1,144 @@
+'''
+    String guard expressions for JSON configs:
+
+    {"src": "attack", "dst": "flee", "condition": "ctx.hp < 10 and ctx.ammo > 0"}
+
+    Expressions may only read attributes and items of "ctx", compare them and
+    do arithmetic. They are validated with ast and compiled once per process
+    into a "lambda ctx: lambda: ..." factory; binding the context of a
+    machine creates a closure, so a call costs as much as a hand-written
+    lambda.
+'''
+import ast
+import functools
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from fsm.FSM import FSMConfigError
+
+CONTEXT_NAME = 'ctx'
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.Compare, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq, ast.In, ast.NotIn, ast.Is, ast.IsNot,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+    ast.Name, ast.Load, ast.Attribute, ast.Subscript,
+    ast.Constant, ast.Tuple, ast.List,
+)
+_CONSTANT_NAMES = ('True', 'False', 'None')
+
+_guards = {}  # type: dict
+_guardFactories = {}  # type: dict
+_vectorGuards = {}  # type: dict
+
+
+def isExpression(condition):
+    '''
+        Returns if the condition name of a transition is a guard expression
+        rather than a key of the 'conditions' map.
+    '''
+    return not condition.isidentifier()
+
+
+def _parse(expression):
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except SyntaxError as err:
+        raise FSMConfigError("Invalid guard expression '{}': {}".format(expression, err))
+
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise FSMConfigError("'{}' isn't allowed in guard expression '{}'".format(
+                type(node).__name__, expression))
+        if isinstance(node, ast.Name) and node.id not in _CONSTANT_NAMES and node.id != CONTEXT_NAME:
+            raise FSMConfigError("Unknown name '{}' in guard expression '{}'".format(node.id, expression))
+        if isinstance(node, ast.Attribute) and node.attr.startswith('_'):
+            raise FSMConfigError("Private attribute '{}' in guard expression '{}'".format(node.attr, expression))
+    return tree
+
+
+def _lambda(body, *args):
+    return ast.Lambda(
+        args=ast.arguments(posonlyargs=[], args=[ast.arg(arg=arg) for arg in args], kwonlyargs=[],
+                           kw_defaults=[], defaults=[]),
+        body=body,
+    )
+
+
+def _compile(tree, bound=False, names=None):
+    body = _lambda(tree.body) if bound else tree.body
+    function = ast.Expression(body=_lambda(body, CONTEXT_NAME))
+    ast.fix_missing_locations(function)
+    return eval(compile(function, '<guard>', 'eval'), dict(names or {}, __builtins__={}))
+
+
+def _call(name, *args):
+    return ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=list(args), keywords=[])
+
+
+class _Vectorize(ast.NodeTransformer):
+    '''
+        Rewrites boolean logic into element-wise NumPy logic for array columns:
+        "a and b" -> "logical_and(a, b)", "not a" -> "logical_not(a)",
+        "a < b < c" -> "logical_and(a < b, b < c)". Operands are tested for
+        truth like in the scalar guard, so "not ctx.hp" is "ctx.hp == 0".
+    '''
+    names = ('logical_and', 'logical_or', 'logical_not')
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        name = 'logical_and' if isinstance(node.op, ast.And) else 'logical_or'
+        return functools.reduce(lambda left, right: _call(name, left, right), node.values)
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return _call('logical_not', node.operand)
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        operands = [node.left] + node.comparators
+        comparisons = [ast.Compare(left=operands[i], ops=[op], comparators=[operands[i + 1]])
+                       for i, op in enumerate(node.ops)]
+        return functools.reduce(lambda left, right: _call('logical_and', left, right), comparisons)
+
+
+def compileGuard(expression):
+    '''
+        Returns the cached function(ctx) -> bool of the expression.
+    '''
+    guard = _guards.get(expression)
+    if guard is None:
+        guard = _guards[expression] = _compile(_parse(expression))
+    return guard
+
+
+def compileVectorGuard(expression):
+    '''
+        Returns the cached function(columns) -> mask of the expression, where
+        ctx attributes are NumPy columns and the boolean operators are applied
+        element-wise with the meaning they have in compileGuard.
+    '''
+    guard = _vectorGuards.get(expression)
+    if guard is None:
+        if numpy is None:
+            raise ImportError('Vector guards require numpy')
+        names = {name: getattr(numpy, name) for name in _Vectorize.names}
+        guard = _vectorGuards[expression] = _compile(_Vectorize().visit(_parse(expression)), names=names)
+    return guard
+
+
+def makeGuard(expression, context):
+    '''
+        Returns a condition callable of the expression bound to the context.
+    '''
+    factory = _guardFactories.get(expression)
+    if factory is None:
+        factory = _guardFactories[expression] = _compile(_parse(expression), bound=True)
+    return factory(context)
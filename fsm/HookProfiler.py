@@ -0,0 +1,157 @@
+import random
+import time
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+# Log-linear buckets (as in HdrHistogram): every power of two of nanoseconds is
+# split into _SUB_BUCKETS linear buckets, which bounds the relative error.
+_SUB_BUCKET_BITS = 4
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+
+
+def _bucket(value):
+    magnitude = value.bit_length() - _SUB_BUCKET_BITS - 1
+    if magnitude <= 0:
+        return value
+    return (magnitude << _SUB_BUCKET_BITS) + (value >> magnitude)
+
+
+def _bucketValue(bucket):
+    '''
+        Returns the highest value which falls into the bucket.
+    '''
+    magnitude = (bucket >> _SUB_BUCKET_BITS) - 1
+    if magnitude <= 0:
+        return bucket
+    return (((bucket & (_SUB_BUCKETS - 1)) | _SUB_BUCKETS) + 1 << magnitude) - 1
+
+
+class LatencyHistogram(object):
+    '''
+        Latency histogram with log-linear nanosecond buckets.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.__buckets = {}
+
+    def record(self, value):  # type: (int) -> None
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        bucket = _bucket(value)
+        self.__buckets[bucket] = self.__buckets.get(bucket, 0) + 1
+
+    def percentile(self, percent):  # type: (float) -> int
+        if not self.count:
+            return 0
+        threshold = self.count * percent / 100.0
+        seen = 0
+        for bucket in sorted(self.__buckets):
+            seen += self.__buckets[bucket]
+            if seen >= threshold:
+                return min(_bucketValue(bucket), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / float(self.count) if self.count else 0.0
+
+
+class HookProfiler(object):
+    '''
+        Opt-in profiler of state hooks and callbacks. Assign an instance to the
+        "profiler" attribute of FSM, Fysom or FysomGlobal (one instance may be
+        shared by many machines). Hook timings are aggregated per (machine
+        definition, state, hook).
+
+        With sampleEvery > 1 about one in sampleEvery events is sampled at
+        random and every hook it runs is timed; hooks called outside of an
+        event (e.g. update()) are sampled one by one. Random sampling doesn't
+        alias with the fixed leave/enter/update order of the hooks.
+
+        profiler = HookProfiler(sampleEvery=10)
+        FSM.profiler = profiler
+        ...
+        print(profiler.report())
+    '''
+
+    def __init__(self, sampleEvery=1, seed=None):
+        if sampleEvery < 1:
+            raise ValueError('sampleEvery must be positive')
+        self.sampleEvery = sampleEvery
+        self.__random = random.Random(seed).random
+        self.__sampled = None  # decision of the running event
+        self.__histograms = {}
+
+    def context(self):
+        return None
+
+    def __sample(self):
+        return self.sampleEvery == 1 or self.__random() * self.sampleEvery < 1.0
+
+    def event(self, definition, state, eventName, context, fn, *args):
+        outer = self.__sampled
+        if outer is None:  # nested events follow the outermost one
+            self.__sampled = self.__sample()
+        try:
+            return fn(*args)
+        finally:
+            self.__sampled = outer
+
+    def call(self, definition, state, hook, fn, *args):
+        sampled = self.__sampled
+        if sampled is None:
+            sampled = self.__sample()
+        if not sampled:
+            return fn(*args)
+
+        start = _clock()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = int((_clock() - start) * 1e9)
+            key = (definition, state, hook)
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = self.__histograms[key] = LatencyHistogram()
+            histogram.record(elapsed)
+
+    def histogram(self, definition, state, hook):  # type: (str, str, str) -> LatencyHistogram
+        return self.__histograms.get((definition, state, hook))
+
+    def clear(self):
+        self.__histograms.clear()
+
+    def top(self, count=10, by='total'):
+        '''
+            Returns the slowest hooks. "by" is one of: total, max, mean, p50, p99.
+            Times are in nanoseconds; totals are extrapolated by sampleEvery.
+        '''
+        rows = []
+        for (definition, state, hook), histogram in self.__histograms.items():
+            rows.append({
+                'definition': definition,
+                'state': state,
+                'hook': hook,
+                'samples': histogram.count,
+                'total': histogram.total * self.sampleEvery,
+                'mean': histogram.mean,
+                'max': histogram.max,
+                'p50': histogram.percentile(50),
+                'p99': histogram.percentile(99),
+            })
+        rows.sort(key=lambda row: row[by], reverse=True)
+        return rows[:count]
+
+    def report(self, count=10, by='total'):
+        lines = ['{:<24} {:<24} {:<24} {:>8} {:>12} {:>10} {:>10} {:>10}'.format(
+            'definition', 'state', 'hook', 'samples', 'total,us', 'p50,us', 'p99,us', 'max,us')]
+        for row in self.top(count, by):
+            lines.append('{:<24} {:<24} {:<24} {:>8} {:>12.1f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                row['definition'], row['state'], row['hook'], row['samples'],
+                row['total'] / 1e3, row['p50'] / 1e3, row['p99'] / 1e3, row['max'] / 1e3))
+        return '\n'.join(lines)
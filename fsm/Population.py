@@ -0,0 +1,193 @@
+import types
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from fsm.FSM import FSMConfigError, FSMError, _ALL_STATES, _SAME_DST, _is_base_string
+from fsm.GuardExpression import compileVectorGuard, isExpression
+
+_NO_TRANSITION = -1
+
+
+class Population(object):
+    '''
+        Many entities of one machine definition as NumPy columns. The state
+        of every entity is an int in "state"; context is a set of equally
+        sized columns available to guards as "ctx":
+
+        population = Population({
+            'initial': {'state': 'patrol'},
+            'transitions': [
+                {'src': 'patrol', 'dst': 'flee', 'condition': 'ctx.hp < 10'},
+                {'src': 'flee', 'dst': 'patrol', 'event': 'evHealed'},
+            ],
+        }, {'hp': hp})
+        population.update()
+
+        Condition transitions are guard expressions (see fsm.GuardExpression)
+        or batch conditions from the 'conditions' config: callables taking the
+        columns and returning a boolean mask. update() evaluates every distinct
+        guard once per tick for the whole population and applies all the
+        transitions at once; states don't have per-entity hooks.
+
+        Unlike FSM.update(), which follows condition transitions until the
+        machine settles, update() makes one step: an entity moves at most
+        once per tick and the conditions of its new state are evaluated by
+        the next update(). Configs whose condition transitions can fire in a
+        row (a -> b -> c in one tick) therefore take one tick per step.
+    '''
+
+    def __init__(self, cfg, columns):
+        if numpy is None:
+            raise ImportError('Population requires numpy')
+
+        sizes = set(len(column) for column in columns.values())
+        if len(sizes) > 1:
+            raise FSMConfigError('Context columns have different lengths {}'.format(sorted(sizes)))
+        self.size = sizes.pop() if sizes else 0
+        self.ctx = types.SimpleNamespace(**{name: numpy.asarray(column) for name, column in columns.items()})
+
+        initial = cfg.get('initial')
+        if initial is None:
+            raise FSMConfigError("Config doesn't have 'initial' {}".format(cfg))
+        transitions = cfg.get('transitions')
+        if transitions is None:
+            raise FSMConfigError("Config doesn't have 'transitions' {}".format(cfg))
+
+        states = [initial['state']]
+        for transition in transitions:
+            src = transition.get('src', _ALL_STATES)
+            for name in ([src] if _is_base_string(src) else src) + [transition['dst']]:
+                if name not in (_ALL_STATES, _SAME_DST) and name not in states:
+                    states.append(name)
+        stateIds = {name: i for i, name in enumerate(states)}
+
+        conditions = cfg.get('conditions', {})
+        guards = {}
+        chains = {}
+        events = {}
+        for order, transition in enumerate(transitions):
+            src = transition.get('src', _ALL_STATES)
+            srcs = states if src == _ALL_STATES else [src] if _is_base_string(src) else src
+            event = transition.get('event')
+            condition = transition.get('condition')
+            if event is not None and condition is not None:
+                raise FSMConfigError("Guarded event transitions aren't supported by Population")
+            if event is None and condition is None:
+                raise FSMConfigError('Transition {} has neither event nor condition'.format(transition))
+            if condition is not None and condition not in guards:
+                if condition in conditions:
+                    guards[condition] = conditions[condition]
+                elif isExpression(condition):
+                    guards[condition] = compileVectorGuard(condition)
+                else:
+                    raise FSMConfigError("Condition '{}' doesn't exist".format(condition))
+
+            for name in srcs:
+                dst = name if transition['dst'] == _SAME_DST else transition['dst']
+                if event is not None:
+                    table = events.get(event)
+                    if table is None:
+                        table = events[event] = numpy.full(len(states), _NO_TRANSITION, dtype=numpy.int32)
+                    table[stateIds[name]] = stateIds[dst]
+                else:
+                    chains.setdefault(stateIds[name], []).append(
+                        (-transition.get('priority', 0), order, condition, stateIds[dst]))
+
+        final = cfg.get('final')
+        if final is not None and final not in stateIds:
+            raise FSMConfigError("Final state '{}' doesn't exist".format(final))
+        finalId = stateIds.get(final)
+
+        self.__states = states
+        self.__stateIds = stateIds
+        self.__guards = guards
+        self.__events = events
+        self.__chains = [
+            (src, tuple((condition, dst) for _, _, condition, dst in sorted(chain)))
+            for src, chain in sorted(chains.items()) if src != finalId
+        ]
+        self.__lastTransitions = []
+        self.state = numpy.full(self.size, stateIds[initial['state']], dtype=numpy.int32)
+
+    @property
+    def states(self):
+        return list(self.__states)
+
+    def stateId(self, name):
+        return self.__stateIds[name]
+
+    def getState(self, index):
+        return self.__states[self.state[index]]
+
+    def members(self, state):
+        '''
+            Returns the indices of the entities in the state.
+        '''
+        return numpy.flatnonzero(self.state == self.__stateIds[state])
+
+    def count(self, state):
+        return int(numpy.count_nonzero(self.state == self.__stateIds[state]))
+
+    def lastTransitions(self):
+        '''
+            Returns (src, dst, indices) of the transitions made by the last
+            update().
+        '''
+        return [(self.__states[src], self.__states[dst], indices) for src, dst, indices in self.__lastTransitions]
+
+    def addEvent(self, eventName, indices=None):
+        '''
+            Fires the event for the given entities (all by default); entities
+            in states without the event are skipped. Returns the number of
+            transitions.
+        '''
+        table = self.__events.get(eventName)
+        if table is None:
+            raise FSMError("event {} doesn't exist".format(eventName))
+        if indices is None:
+            dsts = table[self.state]
+            applied = dsts != _NO_TRANSITION
+            self.state[applied] = dsts[applied]
+        else:
+            indices = numpy.asarray(indices)
+            dsts = table[self.state[indices]]
+            applied = dsts != _NO_TRANSITION
+            self.state[indices[applied]] = dsts[applied]
+        return int(numpy.count_nonzero(applied))
+
+    def update(self):
+        '''
+            Evaluates the condition transitions of all entities against the
+            current states and applies them together; every entity makes at
+            most one transition. Returns the number of transitions.
+        '''
+        state = self.state
+        newState = None
+        masks = {}
+        transitions = []
+        for src, chain in self.__chains:
+            pending = state == src
+            if not pending.any():
+                continue
+            for condition, dst in chain:
+                mask = masks.get(condition)
+                if mask is None:
+                    mask = masks[condition] = numpy.broadcast_to(
+                        numpy.asarray(self.__guards[condition](self.ctx), dtype=bool), (self.size,))
+                fired = pending & mask
+                if fired.any():
+                    if newState is None:
+                        newState = state.copy()
+                    newState[fired] = dst
+                    transitions.append((src, dst, numpy.flatnonzero(fired)))
+                    pending &= ~mask
+                    if not pending.any():
+                        break
+
+        self.__lastTransitions = transitions
+        if newState is not None:
+            self.state = newState
+        return sum(len(indices) for _, _, indices in transitions)
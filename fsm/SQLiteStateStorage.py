@@ -0,0 +1,140 @@
+import re
+import sqlite3
+import time
+
+_DEFAULT_TABLE = 'fsm_state'
+_DEFAULT_FLUSH_INTERVAL = 50  # ms
+_DEFAULT_FLUSH_EVERY = 1000  # transitions
+_DEFAULT_LOAD_BATCH = 10000
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+_clock = getattr(time, 'monotonic', time.time)
+
+
+class SQLiteStateStorage(object):
+    '''
+        Write-behind storage of FysomGlobal states in a local SQLite table.
+
+        State changes are buffered in memory (only the latest state of every
+        entity is kept) and flushed in a single transaction once
+        flush_every changes are pending or flush_interval milliseconds have
+        passed since the previous flush. The database runs in WAL mode, so a
+        crash loses at most the not yet flushed buffer.
+
+        The thresholds are only checked by write(); there is no background
+        timer, so an idle buffer stays in memory until the next write. Call
+        flush() periodically (e.g. once per tick) when writes may stop.
+
+        Example:
+
+        storage = SQLiteStateStorage('states.db', key_field='id')
+        GSM = FysomGlobal(events=..., state_field='state', storage=storage)
+        ...
+        GSM.rehydrate({model.id: model for model in models})
+        ...
+        storage.close()
+    '''
+
+    def __init__(self, path, key_field='id', table=_DEFAULT_TABLE,
+                 flush_interval=_DEFAULT_FLUSH_INTERVAL,
+                 flush_every=_DEFAULT_FLUSH_EVERY):
+        if not _IDENTIFIER.match(table):
+            raise ValueError("Incorrect table name '{}'".format(table))
+
+        self.key_field = key_field
+        self.table = table
+        self.flush_interval = flush_interval / 1000.0
+        self.flush_every = flush_every
+
+        self._pending = {}
+        self._last_flush = _clock()
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS {} (key PRIMARY KEY, state TEXT NOT NULL)'.format(table))
+        self._conn.commit()
+        self._upsert = 'INSERT OR REPLACE INTO {} (key, state) VALUES (?, ?)'.format(table)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def pending(self):
+        '''
+            Number of entities whose state is not flushed yet.
+        '''
+        return len(self._pending)
+
+    def write(self, obj, state):
+        '''
+            Buffers the new state of the entity and flushes the buffer
+            if one of the flush thresholds is reached.
+        '''
+        self._check_open()
+        pending = self._pending
+        pending[getattr(obj, self.key_field)] = state
+        if len(pending) >= self.flush_every or _clock() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        '''
+            Writes all buffered states in one transaction.
+        '''
+        self._check_open()
+        self._last_flush = _clock()
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+        with self._conn:
+            self._conn.executemany(self._upsert, pending.items())
+
+    def load(self, batch_size=_DEFAULT_LOAD_BATCH):
+        '''
+            Yields (key, state) pairs of all stored entities. The table is read
+            in chunks of batch_size rows, so millions of entities can be
+            rehydrated without materializing the whole table.
+        '''
+        self.flush()
+        cursor = self._conn.execute('SELECT key, state FROM {}'.format(self.table))
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            cursor.close()
+
+    def get(self, key):
+        '''
+            Returns the stored state of the entity or None.
+        '''
+        self._check_open()
+        if key in self._pending:
+            return self._pending[key]
+        row = self._conn.execute(
+            'SELECT state FROM {} WHERE key = ?'.format(self.table), (key,)).fetchone()
+        return row[0] if row else None
+
+    def delete(self, key):
+        self._check_open()
+        self._pending.pop(key, None)
+        with self._conn:
+            self._conn.execute('DELETE FROM {} WHERE key = ?'.format(self.table), (key,))
+
+    def close(self):
+        if self._conn is None:
+            return
+        self.flush()
+        self._conn.close()
+        self._conn = None
+
+    def _check_open(self):
+        if self._conn is None:
+            raise ValueError('Storage {} is closed'.format(self.table))
@@ -0,0 +1,330 @@
+import bisect
+import hashlib
+import multiprocessing
+import queue
+import threading
+
+from fsm.FSM import FSMError
+
+_DEFAULT_REPLICAS = 64
+_DEFAULT_BATCH_SIZE = 256
+
+# messages to workers
+_SPAWN = 'spawn'
+_EVENTS = 'events'
+_UPDATE = 'update'
+_SNAPSHOT = 'snapshot'
+_RESTORE = 'restore'
+_STOP = 'stop'
+
+# messages from workers
+_CHANGES = 'changes'
+_SNAPSHOTS = 'snapshots'
+_DONE = 'done'
+
+
+def _hash(value):
+    return int(hashlib.md5(str(value).encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    '''
+        Consistent hashing of entity keys to nodes. Adding a node moves only
+        about 1/len(nodes) of the keys.
+    '''
+
+    def __init__(self, nodes=(), replicas=_DEFAULT_REPLICAS):
+        self.__replicas = replicas
+        self.__points = []
+        self.__owners = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        for i in range(self.__replicas):
+            point = _hash('{}:{}'.format(node, i))
+            index = bisect.bisect(self.__points, point)
+            self.__points.insert(index, point)
+            self.__owners.insert(index, node)
+
+    def remove(self, node):
+        keep = [(point, owner) for point, owner in zip(self.__points, self.__owners) if owner != node]
+        self.__points = [point for point, _ in keep]
+        self.__owners = [owner for _, owner in keep]
+
+    def nodeFor(self, key):
+        if not self.__points:
+            raise FSMError('Hash ring is empty')
+        index = bisect.bisect(self.__points, _hash(key)) % len(self.__points)
+        return self.__owners[index]
+
+
+def _describe(error):
+    if isinstance(error, FSMError):
+        return str(error)
+    return '{}: {}'.format(type(error).__name__, error)
+
+
+def _worker(conn, factory):
+    '''
+        Worker process loop. Machines are built by factory(key); the
+        definition (conditions, state classes) is loaded once per process.
+        Exceptions of the machines are reported to the parent as errors,
+        the worker keeps running.
+    '''
+    machines = {}
+    while True:
+        message = conn.recv()
+        kind = message[0]
+        changes = []
+        errors = []
+        if kind == _SPAWN:
+            for key in message[1]:
+                try:
+                    machines[key] = factory(key)
+                except Exception as err:
+                    errors.append((key, None, _describe(err)))
+        elif kind == _EVENTS:
+            for key, eventName, eventData in message[1]:
+                fsm = machines.get(key)
+                if fsm is None:
+                    errors.append((key, eventName, 'unknown machine'))
+                    continue
+                src = fsm.getCurrentState()
+                try:
+                    fsm.addEvent(eventName, eventData)
+                except Exception as err:
+                    errors.append((key, eventName, _describe(err)))
+                dst = fsm.getCurrentState()
+                if src != dst:
+                    changes.append((key, src, dst))
+        elif kind == _UPDATE:
+            for key, fsm in machines.items():
+                src = fsm.getCurrentState()
+                try:
+                    fsm.update(message[1])
+                except Exception as err:
+                    errors.append((key, None, _describe(err)))
+                dst = fsm.getCurrentState()
+                if src != dst:
+                    changes.append((key, src, dst))
+        elif kind == _SNAPSHOT:
+            snapshots = []
+            for key in message[1]:
+                fsm = machines.get(key)
+                if fsm is None:
+                    continue
+                try:
+                    snapshot = fsm.getSnapshot()
+                except Exception as err:
+                    # the machine stays on this worker
+                    errors.append((key, None, _describe(err)))
+                    continue
+                del machines[key]
+                snapshots.append((key, snapshot))
+                fsm.fini()
+            conn.send((_SNAPSHOTS, snapshots, errors))
+            continue
+        elif kind == _RESTORE:
+            for key, snapshot in message[1]:
+                try:
+                    fsm = factory(key)
+                    fsm.restoreSnapshot(snapshot)
+                except Exception as err:
+                    errors.append((key, None, _describe(err)))
+                else:
+                    machines[key] = fsm
+        elif kind == _STOP:
+            for fsm in machines.values():
+                fsm.fini()
+            conn.send((_DONE,))
+            conn.close()
+            return
+        if changes or errors:
+            conn.send((_CHANGES, changes, errors))
+
+
+class _Worker(object):
+    def __init__(self, name, factory, context, received):
+        self.name = name
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker, args=(child, factory), name=name)
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+        self.events = []
+        self.replies = queue.Queue()
+        # Replies are read on a thread: a worker blocked on a full reply pipe
+        # stops reading, so the parent must never wait for poll() to drain it.
+        self.reader = threading.Thread(target=self.__read, args=(received,), name=name + '-reader')
+        self.reader.daemon = True
+        self.reader.start()
+
+    def __read(self, received):
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                self.replies.put(None)
+                return
+            if message[0] == _CHANGES:
+                received(message[1], message[2])
+                continue
+            self.replies.put(message)
+            if message[0] == _DONE:
+                return
+
+
+class ShardedRuntime(object):
+    '''
+        Runs FSM instances in worker processes. Instances are partitioned by
+        entity key with consistent hashing, events are routed to the owning
+        worker in batches and state changes are streamed back.
+
+        factory(key) must be a picklable (module level) callable returning
+        a new FSM for the key.
+
+        runtime = ShardedRuntime(makeSquad, workers=4)
+        runtime.spawn(squadIds)
+        runtime.addEvent(squadId, 'evAttack')
+        runtime.update(dt)
+        for key, src, dst in runtime.poll():
+            ...
+        runtime.stop()
+    '''
+
+    def __init__(self, factory, workers=None, batchSize=_DEFAULT_BATCH_SIZE,
+                 replicas=_DEFAULT_REPLICAS, context=None):
+        self.__factory = factory
+        self.__context = context or multiprocessing.get_context()
+        self.__batchSize = batchSize
+        self.__ring = HashRing(replicas=replicas)
+        self.__workers = {}  # type: dict
+        self.__owners = {}  # type: dict
+        self.__changes = []
+        self.__errors = []
+        self.__receivedLock = threading.Lock()
+        self.__counter = 0
+        for _ in range(workers or multiprocessing.cpu_count()):
+            self.__startWorker()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def workers(self):
+        return sorted(self.__workers)
+
+    def ownerOf(self, key):
+        return self.__owners.get(key)
+
+    def __startWorker(self):
+        name = 'fsm-worker-{}'.format(self.__counter)
+        self.__counter += 1
+        self.__workers[name] = _Worker(name, self.__factory, self.__context, self.__received)
+        self.__ring.add(name)
+        return name
+
+    def spawn(self, keys):
+        '''
+            Creates machines for the given entity keys on their workers.
+        '''
+        byWorker = {}
+        for key in keys:
+            if key in self.__owners:
+                continue
+            name = self.__ring.nodeFor(key)
+            self.__owners[key] = name
+            byWorker.setdefault(name, []).append(key)
+        for name, workerKeys in byWorker.items():
+            self.__workers[name].conn.send((_SPAWN, workerKeys))
+
+    def addEvent(self, key, eventName, eventData=None):
+        name = self.__owners.get(key)
+        if name is None:
+            raise FSMError("Machine '{}' doesn't exist".format(key))
+        worker = self.__workers[name]
+        worker.events.append((key, eventName, eventData))
+        if len(worker.events) >= self.__batchSize:
+            self.__flushWorker(worker)
+
+    def flush(self):
+        for worker in self.__workers.values():
+            self.__flushWorker(worker)
+
+    def __flushWorker(self, worker):
+        if worker.events:
+            worker.conn.send((_EVENTS, worker.events))
+            worker.events = []
+
+    def update(self, dt):
+        self.flush()
+        for worker in self.__workers.values():
+            worker.conn.send((_UPDATE, dt))
+
+    def poll(self):
+        '''
+            Returns (key, src, dst) state changes received so far.
+        '''
+        with self.__receivedLock:
+            changes, self.__changes = self.__changes, []
+        return changes
+
+    def errors(self):
+        '''
+            Returns (key, event, message) of events rejected by the machines
+            and of exceptions raised by them; event is None for exceptions
+            outside of events (update, spawn, migration).
+        '''
+        with self.__receivedLock:
+            errors, self.__errors = self.__errors, []
+        return errors
+
+    def __received(self, changes, errors):
+        # called on the reader threads
+        with self.__receivedLock:
+            self.__changes.extend(changes)
+            self.__errors.extend(errors)
+
+    def __request(self, worker, message):
+        worker.conn.send(message)
+        reply = worker.replies.get()
+        if reply is None:
+            raise FSMError("Worker '{}' exited".format(worker.name))
+        return reply
+
+    def addWorker(self):
+        '''
+            Starts a new worker and moves the machines it now owns from the
+            other workers as snapshots. Returns the number of moved machines.
+        '''
+        self.flush()
+        name = self.__startWorker()
+        moved = {}
+        for key, owner in self.__owners.items():
+            if self.__ring.nodeFor(key) == name:
+                moved.setdefault(owner, []).append(key)
+
+        snapshots = []
+        for owner, keys in moved.items():
+            _, ownerSnapshots, errors = self.__request(self.__workers[owner], (_SNAPSHOT, keys))
+            snapshots.extend(ownerSnapshots)
+            self.__received((), errors)
+        for key, _ in snapshots:
+            self.__owners[key] = name
+        if snapshots:
+            self.__workers[name].conn.send((_RESTORE, snapshots))
+        return len(snapshots)
+
+    def stop(self):
+        self.flush()
+        for worker in self.__workers.values():
+            self.__request(worker, (_STOP,))
+            worker.process.join()
+            worker.reader.join()
+            worker.conn.close()
+        self.__workers.clear()
+        self.__owners.clear()
@@ -0,0 +1,171 @@
+import os
+
+from fsm.HookProfiler import LatencyHistogram
+
+_RESULTS = ('processed', 'rejected', 'canceled', 'coalesced', 'deferred')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class TransitionMetrics(object):
+    '''
+        Counters of machine activity. Assign an instance to the "metrics"
+        attribute of any engine (FSM, Fysom, FysomGlobal, FiniteStateMachine);
+        one instance may be shared by many machines. When the attribute is None
+        engines skip instrumentation after a single attribute check.
+    '''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.processed = 0
+        self.rejected = 0
+        self.canceled = 0
+        self.coalesced = 0
+        self.deferred = 0
+        self.livelocks = 0
+        self.transitions = {}  # type: dict
+        self.queueDepth = 0
+        self.maxQueueDepth = 0
+        self.maxCascadeDepth = 0
+        self.lanes = {}  # type: dict
+        self.__depth = 0
+
+    def eventProcessed(self):
+        self.processed += 1
+
+    def eventRejected(self):
+        self.rejected += 1
+
+    def eventCanceled(self):
+        self.canceled += 1
+
+    def eventCoalesced(self):
+        self.coalesced += 1
+
+    def eventDeferred(self):
+        self.deferred += 1
+
+    def livelock(self):
+        self.livelocks += 1
+
+    def transition(self, src, dst):
+        key = (src, dst)
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+
+    def queue(self, depth):
+        self.queueDepth = depth
+        if depth > self.maxQueueDepth:
+            self.maxQueueDepth = depth
+
+    def __lane(self, lane):
+        stats = self.lanes.get(lane)
+        if stats is None:
+            stats = self.lanes[lane] = {'depth': 0, 'maxDepth': 0, 'wait': LatencyHistogram()}
+        return stats
+
+    def laneQueue(self, lane, depth):
+        stats = self.__lane(lane)
+        stats['depth'] = depth
+        if depth > stats['maxDepth']:
+            stats['maxDepth'] = depth
+
+    def laneWait(self, lane, wait, depth):
+        '''
+            Records the time (seconds) an event spent in the priority lane.
+        '''
+        stats = self.__lane(lane)
+        stats['depth'] = depth
+        stats['wait'].record(int(wait * 1e9))
+
+    def cascade(self, depth):
+        if depth > self.maxCascadeDepth:
+            self.maxCascadeDepth = depth
+
+    def enter(self):
+        '''
+            Marks the start of a (possibly nested) event handler.
+        '''
+        self.__depth += 1
+        if self.__depth > self.maxCascadeDepth:
+            self.maxCascadeDepth = self.__depth
+
+    def leave(self):
+        self.__depth -= 1
+
+    def asDict(self):
+        return {
+            'events': {
+                'processed': self.processed,
+                'rejected': self.rejected,
+                'canceled': self.canceled,
+                'coalesced': self.coalesced,
+                'deferred': self.deferred,
+            },
+            'transitions': [
+                {'src': src, 'dst': dst, 'count': count}
+                for (src, dst), count in sorted(self.transitions.items(), key=lambda item: str(item[0]))
+            ],
+            'queue_depth': self.queueDepth,
+            'max_queue_depth': self.maxQueueDepth,
+            'max_cascade_depth': self.maxCascadeDepth,
+            'livelocks': self.livelocks,
+            'lanes': {
+                lane: {
+                    'depth': stats['depth'],
+                    'max_depth': stats['maxDepth'],
+                    'events': stats['wait'].count,
+                    'wait_mean_ns': stats['wait'].mean,
+                    'wait_p99_ns': stats['wait'].percentile(99),
+                    'wait_max_ns': stats['wait'].max,
+                }
+                for lane, stats in self.lanes.items()
+            },
+        }
+
+    def toOpenMetrics(self, prefix='fsm'):
+        '''
+            Returns the counters in OpenMetrics text exposition format.
+        '''
+        lines = ['# TYPE {}_events counter'.format(prefix)]
+        for result in _RESULTS:
+            lines.append('{}_events_total{{result="{}"}} {}'.format(prefix, result, getattr(self, result)))
+
+        lines.append('# TYPE {}_transitions counter'.format(prefix))
+        for (src, dst), count in sorted(self.transitions.items(), key=lambda item: str(item[0])):
+            lines.append('{}_transitions_total{{src="{}",dst="{}"}} {}'.format(
+                prefix, _escape(src), _escape(dst), count))
+
+        lines.append('# TYPE {}_livelocks counter'.format(prefix))
+        lines.append('{}_livelocks_total {}'.format(prefix, self.livelocks))
+
+        for name, value in (('queue_depth', self.queueDepth),
+                            ('max_queue_depth', self.maxQueueDepth),
+                            ('max_cascade_depth', self.maxCascadeDepth)):
+            lines.append('# TYPE {}_{} gauge'.format(prefix, name))
+            lines.append('{}_{} {}'.format(prefix, name, value))
+
+        if self.lanes:
+            lanes = sorted(self.lanes.items())
+            for name, getter in (('lane_depth', lambda stats: stats['depth']),
+                                 ('lane_max_depth', lambda stats: stats['maxDepth']),
+                                 ('lane_wait_p99_seconds', lambda stats: stats['wait'].percentile(99) / 1e9)):
+                lines.append('# TYPE {}_{} gauge'.format(prefix, name))
+                for lane, stats in lanes:
+                    lines.append('{}_{}{{lane="{}"}} {}'.format(prefix, name, _escape(lane), getter(stats)))
+
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def writeOpenMetrics(self, path, prefix='fsm'):
+        '''
+            Atomically writes the OpenMetrics text file (e.g. for the node
+            exporter textfile collector).
+        '''
+        tmpPath = path + '.tmp'
+        with open(tmpPath, 'w') as fd:
+            fd.write(self.toOpenMetrics(prefix))
+        getattr(os, 'replace', os.rename)(tmpPath, path)
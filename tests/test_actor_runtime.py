@@ -0,0 +1,77 @@
+# coding=utf-8
+import threading
+
+from fsm.ActorRuntime import ActorRuntime
+from fsm.FSM import FSM, FSMError, FSMState
+
+
+class Counter(FSMState):
+    def __init__(self, name):
+        super(Counter, self).__init__(name)
+        self.active = 0
+        self.maxActive = 0
+        self.reentered = []
+        self.lock = threading.Lock()
+
+    def reenter(self, eventData):
+        with self.lock:
+            self.active += 1
+            self.maxActive = max(self.maxActive, self.active)
+        self.reentered.append(eventData)
+        with self.lock:
+            self.active -= 1
+
+
+CONFIG = {
+    'initial': {'state': 'idle'},
+    'transitions': [
+        {'event': 'tick', 'src': 'idle', 'dst': '='},
+    ],
+}
+
+
+def test_messages_are_serialized_and_fifo_per_machine():
+    errors = []
+    with ActorRuntime(workers=4, batchSize=3, onError=lambda fsm, event, err: errors.append(err)) as runtime:
+        counters = [Counter('idle') for _ in range(5)]
+        mailboxes = [runtime.register(FSM(dict(CONFIG, states=[counter]))) for counter in counters]
+
+        def sender(senderId):
+            for i in range(50):
+                for mailbox in mailboxes:
+                    runtime.send(mailbox, 'tick', (senderId, i))
+
+        threads = [threading.Thread(target=sender, args=(n,)) for n in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        runtime.join()
+
+        for state in counters:
+            assert state.maxActive == 1
+            assert len(state.reentered) == 150
+            for senderId in range(3):
+                sequence = [i for sid, i in state.reentered if sid == senderId]
+                assert sequence == list(range(50))
+        assert runtime.runQueueLatency.count > 0
+        assert all(depth == 0 for _, depth in runtime.queueDepths())
+    assert errors == []
+
+
+def test_errors_are_reported():
+    errors = []
+    with ActorRuntime(workers=1, onError=lambda fsm, event, err: errors.append((event, type(err)))) as runtime:
+        mailbox = runtime.register(FSM(CONFIG))
+        runtime.send(mailbox, 'unknown')
+        runtime.send(mailbox, 'tick')
+        runtime.join()
+    assert errors == [('unknown', FSMError)]
+
+
+def test_errors_are_logged_by_default(caplog):
+    with ActorRuntime(workers=1) as runtime:
+        mailbox = runtime.register(FSM(CONFIG))
+        runtime.send(mailbox, 'unknown')
+        runtime.join()
+    assert any(record.exc_info and record.exc_info[0] is FSMError for record in caplog.records)
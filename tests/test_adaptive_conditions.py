@@ -0,0 +1,81 @@
+# coding=utf-8
+import pytest
+
+from fsm.FSM import FSM
+
+
+class Counter(object):
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.result
+
+
+CONFIG = {
+    'initial': {'state': 'idle'},
+    'transitions': [
+        {'src': 'idle', 'dst': 'alarm', 'condition': 'rare', 'exclusive': True},
+        {'src': 'idle', 'dst': 'work', 'condition': 'common', 'exclusive': True},
+        {'src': ['alarm', 'work'], 'dst': 'idle', 'event': 'evDone'},
+    ],
+    'adaptiveConditions': 4,
+}
+
+
+@pytest.fixture()
+def rare():
+    return Counter(False)
+
+
+@pytest.fixture()
+def common():
+    return Counter(True)
+
+
+@pytest.fixture()
+def conditions(rare, common):
+    return {'rare': rare, 'common': common}
+
+
+def run(fsm, ticks):
+    for _ in range(ticks):
+        fsm.update(0)
+        fsm.addEvent('evDone')
+
+
+def test_likely_condition_moves_first(conditions, rare, common):
+    fsm = FSM(dict(CONFIG, conditions=conditions))
+    run(fsm, 4)
+    assert rare.calls == 4
+    assert [item['dst'] for item in fsm.conditionStats()] == ['work', 'alarm']
+
+    run(fsm, 10)
+    assert rare.calls == 4
+    assert common.calls == 14
+
+
+def test_condition_stats(conditions):
+    fsm = FSM(dict(CONFIG, conditions=conditions, adaptiveConditions=100))
+    run(fsm, 3)
+    assert fsm.conditionStats() == [
+        {'src': 'idle', 'dst': 'alarm', 'evaluations': 3, 'hits': 0},
+        {'src': 'idle', 'dst': 'work', 'evaluations': 3, 'hits': 3},
+    ]
+
+
+def test_not_exclusive_chain_keeps_order(conditions, rare):
+    transitions = [dict(transition, exclusive=False) for transition in CONFIG['transitions']]
+    fsm = FSM(dict(CONFIG, conditions=conditions, transitions=transitions))
+    run(fsm, 10)
+    assert rare.calls == 10
+    assert fsm.conditionStats() == []
+
+
+def test_disabled_by_default(conditions, rare):
+    fsm = FSM(dict(CONFIG, conditions=conditions, adaptiveConditions=None))
+    run(fsm, 10)
+    assert rare.calls == 10
+    assert fsm.conditionStats() == []
@@ -0,0 +1,113 @@
+# coding=utf-8
+import pytest
+
+from fsm.FSM import FSM, FSMError, FSMState, Fysom, FysomGlobal
+
+CONFIG = {
+    'initial': {'state': 'prepare'},
+    'final': 'dead',
+    'transitions': [
+        {'src': 'prepare', 'dst': 'fly', 'event': 'evFly'},
+        {'src': 'fly', 'dst': 'attack', 'event': 'evAttack'},
+        {'src': 'attack', 'dst': 'fly', 'event': 'evFly'},
+        {'src': ['fly', 'attack'], 'dst': 'dead', 'event': 'evDie'},
+    ],
+}
+
+
+def test_fsm_available_events():
+    fsm = FSM(CONFIG)
+    assert fsm.availableEvents() == frozenset(['evFly'])
+    fsm.addEvent('evFly')
+    assert fsm.availableEvents() == frozenset(['evAttack', 'evDie'])
+    assert fsm.can('evDie') and not fsm.can('evFly')
+    fsm.addEvent('evDie')
+    assert fsm.availableEvents() == frozenset()
+    assert not fsm.can('evDie')
+
+
+def test_fsm_sets_are_shared():
+    first, second = FSM(CONFIG), FSM(CONFIG)
+    assert first.availableEvents() is second.availableEvents()
+    first.addEvent('evFly')
+    assert first.availableEvents() is not second.availableEvents()
+    second.addEvent('evFly')
+    assert first.availableEvents() is second.availableEvents()
+
+
+def test_fsm_shared_state_objects():
+    shared = FSMState('x')
+    first = FSM({
+        'initial': {'state': 'x'},
+        'states': [shared, FSMState('y')],
+        'transitions': [{'src': 'x', 'dst': 'y', 'event': 'go'}],
+    })
+    second = FSM({'initial': {'state': 'x'}, 'states': [shared], 'transitions': []})
+    assert first.can('go')
+    assert not second.can('go')
+    assert second.availableEvents() == frozenset()
+    with pytest.raises(FSMError):
+        second.addEvent('go')
+
+
+def test_fsm_destroyed():
+    fsm = FSM(CONFIG)
+    fsm.fini()
+    assert not fsm.can('evFly')
+    assert fsm.availableEvents() == frozenset()
+
+
+def test_fysom_available_events():
+    fsm = Fysom({
+        'initial': 'green',
+        'events': [
+            {'name': 'warn', 'src': 'green', 'dst': 'yellow'},
+            {'name': 'clear', 'src': 'yellow', 'dst': 'green'},
+            {'name': 'panic', 'src': '*', 'dst': 'red'},
+        ],
+    })
+    assert fsm.available_events() == frozenset(['warn', 'panic'])
+    assert fsm.can('panic') and not fsm.can('clear')
+    fsm.warn()
+    assert fsm.available_events() == frozenset(['clear', 'panic'])
+    fsm.panic()
+    assert fsm.available_events() == frozenset(['panic'])
+
+
+def test_fysom_sets_are_shared():
+    config = {
+        'initial': 'green',
+        'events': [
+            {'name': 'warn', 'src': 'green', 'dst': 'yellow'},
+            {'name': 'panic', 'src': '*', 'dst': 'red'},
+        ],
+    }
+    first, second = Fysom(config), Fysom(config)
+    assert first.available_events() is second.available_events()
+    first.panic()
+    second.panic()
+    assert first.available_events() is second.available_events()
+
+
+def test_fysom_global_available_events():
+    class Light(object):
+        def __init__(self):
+            self.state = None
+
+    light = FysomGlobal(
+        initial='green',
+        state_field='state',
+        events=[
+            {'name': 'warn', 'src': 'green', 'dst': 'yellow'},
+            {'name': 'clear', 'src': 'yellow', 'dst': 'green'},
+            {'name': 'panic', 'src': '*', 'dst': 'red'},
+        ],
+    )
+    obj = Light()
+    assert light.available_events(obj) == frozenset(['startup', 'panic'])
+    light.startup(obj)
+    assert light.available_events(obj) == frozenset(['warn', 'panic'])
+    assert light.can(obj, 'warn') and not light.can(obj, 'clear')
+    light.panic(obj)
+    assert light.available_events(obj) == frozenset(['panic'])
+    assert not light.can(obj, 'warn')
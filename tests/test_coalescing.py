@@ -0,0 +1,67 @@
+# coding=utf-8
+import pytest
+
+from fsm.FSM import FSM, FSMConfigError, FSMState
+from fsm.TransitionMetrics import TransitionMetrics
+
+
+class Sensors(FSMState):
+    def enter(self, prevState, eventData):
+        self.addEvent('evPrepareAttack', {'sensor': 1, 'range': 10})
+        self.addEvent('evPrepareAttack', {'sensor': 2})
+        self.addEvent('evPrepareAttack', {'sensor': 3})
+
+
+class PrepareAttack(FSMState):
+    def __init__(self, name):
+        super(PrepareAttack, self).__init__(name)
+        self.received = []
+
+    def enter(self, prevState, eventData):
+        self.received.append(eventData)
+
+    def reenter(self, eventData):
+        self.received.append(eventData)
+
+
+CONFIG = {
+    'initial': {'state': 'prepare'},
+    'transitions': [
+        {'src': 'prepare', 'dst': 'fly', 'event': 'evFly'},
+        {'src': ['fly', 'prepareAttack'], 'dst': 'prepareAttack', 'event': 'evPrepareAttack'},
+    ],
+}
+
+
+@pytest.fixture()
+def prepareAttack():
+    return PrepareAttack('prepareAttack')
+
+
+def test_without_coalescing_every_copy_is_processed(prepareAttack):
+    fsm = FSM(dict(CONFIG, states=[Sensors('fly'), prepareAttack]))
+    fsm.addEvent('evFly')
+    assert len(prepareAttack.received) == 3
+
+
+@pytest.mark.parametrize('policy, expected', [
+    ('keep-first', {'sensor': 1, 'range': 10}),
+    ('keep-latest', {'sensor': 3}),
+    ('merge', {'sensor': 3, 'range': 10}),
+])
+def test_coalescing_policies(prepareAttack, policy, expected):
+    fsm = FSM(dict(CONFIG, states=[Sensors('fly'), prepareAttack], coalesce={'evPrepareAttack': policy}))
+    metrics = fsm.metrics = TransitionMetrics()
+    fsm.addEvent('evFly')
+    assert fsm.getCurrentState() == 'prepareAttack'
+    assert prepareAttack.received == [expected]
+    assert metrics.coalesced == 2
+
+
+@pytest.mark.parametrize('coalesce', [
+    {'evPrepareAttack': 'keep-some'},
+    {'evUnknown': 'keep-first'},
+])
+def test_incorrect_coalescing_config(coalesce):
+    with pytest.raises(FSMConfigError):
+        FSM(dict(CONFIG, coalesce=coalesce))
@@ -0,0 +1,57 @@
+# coding=utf-8
+from fsm.FSM import FSM, FSMState
+
+
+CONFIG = {
+    'initial': {'state': 'patrol'},
+}
+
+
+def test_priority_orders_conditions():
+    fsm = FSM(dict(CONFIG, transitions=[
+        {'src': 'patrol', 'dst': 'chase', 'condition': 'seeEnemy'},
+        {'src': 'patrol', 'dst': 'flee', 'condition': 'lowHealth', 'priority': 10},
+    ], conditions={'seeEnemy': lambda: True, 'lowHealth': lambda: True}))
+    fsm.update(0)
+    assert fsm.getCurrentState() == 'flee'
+
+
+def test_equal_priorities_keep_config_order():
+    fsm = FSM(dict(CONFIG, transitions=[
+        {'src': 'patrol', 'dst': 'chase', 'condition': 'seeEnemy'},
+        {'src': 'patrol', 'dst': 'flee', 'condition': 'lowHealth'},
+    ], conditions={'seeEnemy': lambda: True, 'lowHealth': lambda: True}))
+    fsm.update(0)
+    assert fsm.getCurrentState() == 'chase'
+
+
+def test_guarded_event_transition_is_not_polled():
+    calls = []
+
+    def guard():
+        calls.append(1)
+        return True
+
+    fsm = FSM(dict(CONFIG, transitions=[
+        {'src': 'patrol', 'dst': 'chase', 'event': 'evNoise', 'condition': 'guard'},
+    ], conditions={'guard': guard}))
+    fsm.update(0)
+    assert fsm.getCurrentState() == 'patrol'
+    assert calls == []
+
+    fsm.addEvent('evNoise')
+    assert fsm.getCurrentState() == 'chase'
+
+
+def test_state_without_conditions_skips_can_transit():
+    class Busy(FSMState):
+        checks = 0
+
+        def canTransit(self):
+            Busy.checks += 1
+            return True
+
+    fsm = FSM(dict(CONFIG, transitions=[{'src': 'patrol', 'dst': 'chase', 'event': 'evNoise'}],
+                   states=[Busy('patrol')]))
+    fsm.update(0)
+    assert Busy.checks == 0
@@ -0,0 +1,76 @@
+# coding=utf-8
+import pytest
+
+from fsm.FSM import FSM, ConditionMemo, FSMConfigError
+
+
+class Counter(object):
+    def __init__(self, result=True):
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.result
+
+
+CONFIG = {
+    'initial': {'state': 'prepare'},
+    'transitions': [
+        {'src': 'prepare', 'dst': 'fly', 'condition': 'cond1'},
+        {'src': 'fly', 'dst': 'attack', 'condition': 'cond1'},
+        {'src': 'attack', 'dst': 'prepare', 'event': 'evReset'},
+    ],
+}
+
+
+@pytest.fixture()
+def cond1():
+    return Counter()
+
+
+def test_condition_evaluated_once_per_tick(cond1):
+    fsm = FSM(dict(CONFIG, conditions={'cond1': cond1}, tickConditions=['cond1']))
+    fsm.update(0)
+    assert fsm.getCurrentState() == 'attack'
+    assert cond1.calls == 1
+
+    fsm.addEvent('evReset')
+    fsm.update(0)
+    assert cond1.calls == 2
+
+
+def test_not_flagged_condition_is_not_memoized(cond1):
+    fsm = FSM(dict(CONFIG, conditions={'cond1': cond1}))
+    fsm.update(0)
+    assert cond1.calls == 2
+
+
+def test_memo_cleared_at_tick_boundary(cond1):
+    cond1.result = False
+    fsm = FSM(dict(CONFIG, conditions={'cond1': cond1}, tickConditions=['cond1']))
+    fsm.update(0)
+    cond1.result = True
+    fsm.update(0)
+    assert fsm.getCurrentState() == 'attack'
+
+
+def test_group_memo(cond1):
+    memo = ConditionMemo()
+    config = dict(CONFIG, conditions={'cond1': cond1}, tickConditions=['cond1'], conditionMemo=memo)
+    machines = [FSM(config) for _ in range(5)]
+    for fsm in machines:
+        fsm.update(0)
+    assert cond1.calls == 1
+    assert all(fsm.getCurrentState() == 'attack' for fsm in machines)
+
+    memo.clear()
+    for fsm in machines:
+        fsm.addEvent('evReset')
+        fsm.update(0)
+    assert cond1.calls == 2
+
+
+def test_unknown_tick_condition(cond1):
+    with pytest.raises(FSMConfigError):
+        FSM(dict(CONFIG, conditions={'cond1': cond1}, tickConditions=['cond2']))
@@ -0,0 +1,85 @@
+# coding=utf-8
+import pytest
+
+from fsm.FSM import FSM, FSMConfigError, FSMError, FSMState
+from fsm.TransitionMetrics import TransitionMetrics
+
+
+class Attack(FSMState):
+    def __init__(self, name):
+        super(Attack, self).__init__(name)
+        self.targets = []
+
+    def enter(self, prevState, eventData):
+        self.targets.append(eventData.get('target'))
+
+    def reenter(self, eventData):
+        self.targets.append(eventData.get('target'))
+
+
+CONFIG = {
+    'initial': {'state': 'reload'},
+    'transitions': [
+        {'src': 'reload', 'dst': 'ready', 'event': 'evReloaded'},
+        {'src': ['ready', 'attack'], 'dst': 'attack', 'event': 'evAttack'},
+        {'src': 'attack', 'dst': 'reload', 'event': 'evEmpty'},
+    ],
+}
+
+
+@pytest.fixture()
+def attack():
+    return Attack('attack')
+
+
+def test_deferred_event_is_recalled_on_state_change(attack):
+    fsm = FSM(dict(CONFIG, states=[attack], deferred={'reload': ['evAttack']}))
+    fsm.addEvent('evAttack', {'target': 1})
+    fsm.addEvent('evAttack', {'target': 2})
+    assert fsm.getCurrentState() == 'reload'
+    assert fsm.deferredEvents == ['evAttack', 'evAttack']
+
+    fsm.addEvent('evReloaded')
+    assert fsm.getCurrentState() == 'attack'
+    assert attack.targets == [1, 2]
+    assert fsm.deferredEvents == []
+
+
+def test_event_stays_parked_while_deferrable():
+    fsm = FSM(dict(CONFIG, deferred={'*': ['evReloaded', 'evAttack']}))
+    fsm.addEvent('evReloaded')
+    fsm.addEvent('evAttack', {'target': 1})
+    fsm.addEvent('evReloaded')  # not available in attack
+    assert fsm.deferredEvents == ['evReloaded']
+
+    fsm.addEvent('evEmpty')
+    assert fsm.getCurrentState() == 'ready'
+    assert fsm.deferredEvents == []
+
+
+def test_not_deferrable_event_is_rejected():
+    fsm = FSM(dict(CONFIG, deferred={'ready': ['evEmpty']}))
+    with pytest.raises(FSMError):
+        fsm.addEvent('evAttack')
+
+
+def test_fini_drops_deferred_events():
+    fsm = FSM(dict(CONFIG, deferred={'reload': ['evAttack']}))
+    fsm.addEvent('evAttack')
+    fsm.fini()
+    assert fsm.deferredEvents == []
+
+
+def test_deferred_metrics(monkeypatch):
+    metrics = TransitionMetrics()
+    monkeypatch.setattr(FSM, 'metrics', metrics)
+    fsm = FSM(dict(CONFIG, deferred={'reload': ['evAttack']}))
+    fsm.addEvent('evAttack')
+    assert metrics.deferred == 1
+    assert metrics.rejected == 0
+
+
+@pytest.mark.parametrize('deferred', [{'unknown': ['evAttack']}, {'reload': ['evUnknown']}])
+def test_invalid_deferred(deferred):
+    with pytest.raises(FSMConfigError):
+        FSM(dict(CONFIG, deferred=deferred))
@@ -0,0 +1,68 @@
+# coding=utf-8
+import pickle
+
+import pytest
+
+from fsm.FSM import FSM, EventHandle, FSMError, Fysom
+
+CONFIG = {
+    'initial': {'state': 'prepare'},
+    'transitions': [
+        {'src': 'prepare', 'dst': 'fly', 'event': 'evFly'},
+        {'src': 'fly', 'dst': 'attack', 'event': 'evAttack'},
+    ],
+}
+
+
+def test_handles_are_interned_ints():
+    fsm = FSM(CONFIG)
+    handle = fsm.event('evFly')
+    assert isinstance(handle, EventHandle) and isinstance(handle, int)
+    assert handle.name == 'evFly'
+    assert FSM(CONFIG).event('evFly') is handle
+
+
+def test_handles_are_per_definition():
+    fsm = FSM(CONFIG)
+    other = FSM({
+        'initial': {'state': 'prepare'},
+        'transitions': [{'src': 'prepare', 'dst': 'fly', 'event': 'evLaunch'}],
+    })
+    # ids are small indices within each definition
+    assert sorted([fsm.event('evFly'), fsm.event('evAttack')]) == [1, 2]
+    assert other.event('evLaunch') == 1
+
+
+def test_add_event_and_can_accept_handles():
+    fsm = FSM(CONFIG)
+    evFly, evAttack = fsm.event('evFly'), fsm.event('evAttack')
+    opcodes = [evFly, evAttack]  # e.g. a network decoder table
+    assert fsm.can(opcodes[0])
+    assert not fsm.can(opcodes[1])
+    fsm.addEvent(opcodes[0])
+    fsm.addEvent('evAttack')
+    assert fsm.getCurrentState() == 'attack'
+
+
+def test_unknown_event():
+    with pytest.raises(FSMError):
+        FSM(CONFIG).event('evUnknown')
+
+
+def test_fysom_trigger_accepts_handles():
+    fysom = Fysom({
+        'initial': 'green',
+        'events': [{'name': 'warn', 'src': 'green', 'dst': 'yellow'}],
+    })
+    warn = EventHandle(7, 'warn')  # an opcode table entry
+    assert fysom.can(warn)
+    fysom.trigger(warn)
+    assert fysom.current == 'yellow'
+
+
+def test_pickled_by_name():
+    handle = FSM(CONFIG).event('evAttack')
+    copy = pickle.loads(pickle.dumps(handle))
+    assert copy.__class__ is EventHandle
+    assert copy == handle and copy.name == 'evAttack'
+    assert repr(copy) == repr(handle)
@@ -0,0 +1,65 @@
+# coding=utf-8
+import importlib
+import sys
+import types
+
+import pytest
+
+
+class Event(object):
+    # stands for the game's Event: a callable list of handlers
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, *args):
+        self.calls.append(args)
+
+
+@pytest.fixture
+def module(monkeypatch):
+    logUtils = types.ModuleType('LogUtils')
+    logUtils.errors = []
+    logUtils.LOG_ERROR = lambda *args: logUtils.errors.append(args)
+    monkeypatch.setitem(sys.modules, 'LogUtils', logUtils)
+    monkeypatch.delitem(sys.modules, 'fsm.FiniteStateMachine', raising=False)
+    module = importlib.import_module('fsm.FiniteStateMachine')
+    monkeypatch.setattr(module, 'Event', Event, raising=False)
+    module.errors = logUtils.errors
+    return module
+
+
+@pytest.fixture
+def pingPong(module):
+    first, second = module.FiniteStateMachineState(), module.FiniteStateMachineState()
+    first.init(stateId=1)
+    second.init(stateId=2)
+    machine = module.FiniteStateMachineFactory.create(first, second)
+    machine.addTransition(first, lambda: True, second)
+    machine.addTransition(second, lambda: True, first)
+    return machine
+
+
+def test_stop_policy_logs_once(module, pingPong):
+    pingPong.update(0)
+    assert pingPong.currentState().stateId == 1
+    assert pingPong.lastLivelock == {'cycle': [1, 2, 1], 'state': 1, 'policy': 'stop'}
+    pingPong.update(0)
+    assert len(module.errors) == 1
+    assert len(pingPong.evStateChanged.calls) == 4
+
+
+def test_raise_policy(module, pingPong):
+    pingPong.livelockPolicy = module.LIVELOCK_RAISE
+    with pytest.raises(module.LivelockError) as info:
+        pingPong.update(0)
+    assert info.value.diagnostic['cycle'] == [1, 2, 1]
+
+
+def test_freeze_policy(module, pingPong):
+    pingPong.livelockPolicy = module.LIVELOCK_FREEZE
+    pingPong.update(0)
+    assert pingPong.isFrozen
+    pingPong.update(0)
+    assert len(pingPong.evStateChanged.calls) == 2
+    pingPong.reset()
+    assert not pingPong.isFrozen
@@ -0,0 +1,52 @@
+# coding=utf-8
+import os
+
+from fsm.FSM import FSM, FSMState, Fysom
+from fsm.FlameTracer import FlameTracer
+
+
+class Yellow(FSMState):
+    def enter(self, prevState, eventData):
+        self.addEvent('panic')
+
+
+def test_fsm_cascade_is_nested_under_posting_hook():
+    fsm = FSM({
+        'name': 'traffic',
+        'initial': {'state': 'green'},
+        'transitions': [
+            {'event': 'warn', 'src': 'green', 'dst': 'yellow'},
+            {'event': 'panic', 'src': 'yellow', 'dst': 'red'},
+        ],
+        'states': [Yellow('yellow')],
+    })
+    tracer = fsm.profiler = FlameTracer()
+    fsm.addEvent('warn')
+    assert fsm.getCurrentState() == 'red'
+    assert tracer.collapsed() == [
+        'traffic;green;warn 1',
+        'traffic;green;warn;enter 1',
+        'traffic;green;warn;enter;traffic;yellow;panic 1',
+        'traffic;green;warn;enter;traffic;yellow;panic;enter 1',
+        'traffic;green;warn;enter;traffic;yellow;panic;leave 1',
+        'traffic;green;warn;leave 1',
+    ]
+
+
+def test_fysom_nested_callbacks(tmpdir):
+    def onyellow(e):
+        e.fsm.panic()
+
+    fsm = Fysom({'name': 'light', 'initial': 'green',
+                 'events': [('warn', 'green', 'yellow'), ('panic', 'yellow', 'red')],
+                 'callbacks': {'onyellow': onyellow}})
+    tracer = fsm.profiler = FlameTracer()
+    fsm.warn()
+    assert 'light;green;warn;onyellow;light;yellow;panic 1' in tracer.collapsed()
+
+    path = os.path.join(str(tmpdir), 'fsm.folded')
+    tracer.write(path, weight='time')
+    with open(path) as fd:
+        lines = fd.read().splitlines()
+    assert len(lines) == 3
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
@@ -0,0 +1,104 @@
+# coding=utf-8
+import json
+
+import pytest
+
+from fsm.FSM import FSM, FSMConfigError
+from fsm.GuardExpression import compileGuard, compileVectorGuard, makeGuard
+
+
+class Unit(object):
+    def __init__(self, hp=100, ammo=10):
+        self.hp = hp
+        self.ammo = ammo
+        self.stats = {'armor': 2}
+
+
+CONFIG = {
+    'initial': {'state': 'attack'},
+    'transitions': [
+        {'src': 'attack', 'dst': 'flee', 'condition': 'ctx.hp < 10 and ctx.ammo > 0'},
+        {'src': 'attack', 'dst': 'reload', 'condition': 'ctx.ammo == 0'},
+        {'src': ['flee', 'reload'], 'dst': 'attack', 'event': 'evReady'},
+    ],
+}
+
+
+def test_guard_expressions():
+    unit = Unit()
+    fsm = FSM(dict(CONFIG, context=unit))
+    fsm.update(0)
+    assert fsm.getCurrentState() == 'attack'
+
+    unit.hp = 5
+    fsm.update(0)
+    assert fsm.getCurrentState() == 'flee'
+
+    fsm.addEvent('evReady')
+    unit.ammo = 0
+    fsm.update(0)
+    assert fsm.getCurrentState() == 'reload'
+
+
+def test_expression_compiled_once():
+    first, second = Unit(hp=5), Unit(hp=50)
+    guard = compileGuard('ctx.hp < 10')
+    assert compileGuard('ctx.hp < 10') is guard
+    assert makeGuard('ctx.hp < 10', first)() is True
+    assert makeGuard('ctx.hp < 10', second)() is False
+
+
+def test_items_and_arithmetic():
+    assert makeGuard("ctx.stats['armor'] * 2 + 1 >= 5", Unit())()
+    assert makeGuard('not 0 < ctx.hp <= 50', Unit())()
+
+
+def test_json_config(tmpdir):
+    path = tmpdir.join('config.json')
+    path.write(json.dumps(CONFIG))
+    fsm = FSM.makeSFMFromJSON(str(path), [], context=Unit(hp=1))
+    fsm.update(0)
+    assert fsm.getCurrentState() == 'flee'
+
+
+@pytest.mark.parametrize('expression', [
+    '__import__("os").system("true")',
+    'ctx.__class__',
+    'open("file")',
+    'ctx.hp < 10 if ctx else 0',
+    'lambda: 1',
+    'ctx.hp <',
+])
+def test_rejected_expressions(expression):
+    with pytest.raises(FSMConfigError):
+        compileGuard(expression)
+
+
+def test_context_required():
+    with pytest.raises(FSMConfigError):
+        FSM(CONFIG)
+
+
+def test_vector_guard():
+    numpy = pytest.importorskip('numpy')
+
+    class Columns(object):
+        hp = numpy.array([5, 5, 2])
+        ammo = numpy.array([0, 1, 0])
+
+    guard = compileVectorGuard('ctx.hp < 10 and ctx.ammo > 0 or 0 < ctx.hp < 3')
+    assert guard(Columns).tolist() == [False, True, True]
+
+
+@pytest.mark.parametrize('expression', ['not ctx.hp', 'ctx.ammo and ctx.hp', 'ctx.ammo or ctx.hp',
+                                        'not (ctx.ammo and ctx.hp - 1)'])
+def test_vector_guard_matches_scalar_guard(expression):
+    numpy = pytest.importorskip('numpy')
+
+    class Columns(object):
+        hp = numpy.array([0, 1, 5, 0])
+        ammo = numpy.array([2, 3, 0, 0])
+
+    units = [Unit(hp, ammo) for hp, ammo in zip(Columns.hp.tolist(), Columns.ammo.tolist())]
+    scalar = compileGuard(expression)
+    assert compileVectorGuard(expression)(Columns).tolist() == [bool(scalar(unit)) for unit in units]
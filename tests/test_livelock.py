@@ -0,0 +1,111 @@
+# coding=utf-8
+import gc
+
+import pytest
+
+import fsm.FSM as FSMModule
+
+from fsm.FSM import FSM, FSMConfigError, FSMLivelockError, FSMState
+from fsm.TransitionMetrics import TransitionMetrics
+
+
+class Counting(FSMState):
+    def __init__(self, name):
+        super(Counting, self).__init__(name)
+        self.enters = 0
+
+    def enter(self, prevState, eventData):
+        self.enters += 1
+
+
+CONFIG = {
+    'name': 'pingPong',
+    'initial': {'state': 'a'},
+    'transitions': [
+        {'src': 'a', 'dst': 'b', 'condition': 'always'},
+        {'src': 'b', 'dst': 'c', 'condition': 'always'},
+        {'src': 'c', 'dst': 'b', 'condition': 'always'},
+    ],
+    'conditions': {'always': lambda: True},
+}
+
+
+@pytest.fixture()
+def states():
+    return [Counting('a'), Counting('b'), Counting('c')]
+
+
+def test_stop_at_first_repeated_state(states):
+    a, b, c = states
+    fsm = FSM(dict(CONFIG, states=states))
+    fsm.update(0)
+    assert fsm.getCurrentState() == 'b'
+    assert b.enters == 2
+    assert c.enters == 1
+    assert fsm.lastLivelock == {'machine': 'pingPong', 'state': 'b', 'cycle': ['b', 'c', 'b'], 'policy': 'stop'}
+
+    fsm.update(0)
+    assert b.enters == 3  # b -> c -> b again
+
+
+def test_raise_policy():
+    fsm = FSM(dict(CONFIG, livelock='raise'))
+    with pytest.raises(FSMLivelockError) as info:
+        fsm.update(0)
+    assert info.value.diagnostic['cycle'] == ['b', 'c', 'b']
+
+
+def test_freeze_policy(states):
+    a, b, c = states
+    fsm = FSM(dict(CONFIG, states=states, livelock='freeze'))
+    fsm.update(0)
+    assert fsm.isFrozen()
+    fsm.update(0)
+    assert b.enters == 2
+
+    fsm.unfreeze()
+    fsm.update(0)
+    assert b.enters == 3
+
+
+def test_livelock_metrics(monkeypatch):
+    metrics = TransitionMetrics()
+    monkeypatch.setattr(FSM, 'metrics', metrics)
+    fsm = FSM(CONFIG)
+    fsm.update(0)
+    assert metrics.livelocks == 1
+    assert metrics.maxCascadeDepth == 3
+
+
+def test_long_acyclic_cascade_is_not_cut():
+    names = ['s{}'.format(i) for i in range(150)]
+    fsm = FSM(dict(CONFIG, initial={'state': names[0]},
+                   transitions=[{'src': src, 'dst': dst, 'condition': 'always'} for src, dst in zip(names, names[1:])]))
+    fsm.update(0)
+    assert fsm.getCurrentState() == names[-1]
+    assert fsm.lastLivelock is None
+
+
+def test_unknown_policy():
+    with pytest.raises(FSMConfigError):
+        FSM(dict(CONFIG, livelock='ignore'))
+
+
+def test_repeated_livelock_is_logged_once(caplog, capsys):
+    fsm = FSM(CONFIG)
+    with caplog.at_level('WARNING', logger='fsm.FSM'):
+        fsm.update(0)
+        fsm.update(0)
+    assert len(caplog.records) == 1
+    assert 'livelock' in caplog.records[0].getMessage()
+    assert capsys.readouterr().out == ''
+
+
+def test_state_bits_are_per_definition():
+    gc.collect()
+    count = len(FSMModule._definitions)
+    first, second = FSM(CONFIG), FSM(CONFIG)
+    assert len(FSMModule._definitions) == count + 1
+    del first, second
+    gc.collect()
+    assert len(FSMModule._definitions) == count
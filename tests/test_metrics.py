@@ -0,0 +1,89 @@
+# coding=utf-8
+import os
+
+import pytest
+
+from fsm.FSM import FSM, FSMError, Fysom, FysomGlobal, FysomGlobalMixin, Canceled
+from fsm.TransitionMetrics import TransitionMetrics
+
+CONFIG = {
+    'initial': {'state': 'green'},
+    'transitions': [
+        {'event': 'warn', 'src': 'green', 'dst': 'yellow'},
+        {'event': 'panic', 'src': 'yellow', 'dst': 'red'},
+        {'event': 'clear', 'src': 'yellow', 'dst': 'green'},
+    ]
+}
+
+
+def test_fsm_metrics():
+    fsm = FSM(CONFIG)
+    metrics = fsm.metrics = TransitionMetrics()
+    fsm.addEvent('warn')
+    fsm.addEvent('clear')
+    fsm.addEvent('warn')
+    with pytest.raises(FSMError):
+        fsm.addEvent('warn')
+
+    assert metrics.processed == 3
+    assert metrics.rejected == 1
+    assert metrics.transitions == {('green', 'yellow'): 2, ('yellow', 'green'): 1}
+    assert metrics.maxQueueDepth == 1
+    assert metrics.maxCascadeDepth == 1
+
+
+def test_fsm_without_metrics():
+    fsm = FSM(CONFIG)
+    fsm.addEvent('warn')
+    assert FSM.metrics is None
+
+
+def test_fysom_metrics_cascade_depth():
+    metrics = TransitionMetrics()
+
+    def onyellow(e):
+        e.fsm.panic()
+
+    fsm = Fysom(initial='green',
+                events=[('warn', 'green', 'yellow'), ('panic', 'yellow', 'red')],
+                callbacks={'onyellow': onyellow, 'onbeforepanic': lambda e: True})
+    fsm.metrics = metrics
+    fsm.warn()
+    assert fsm.current == 'red'
+    assert metrics.processed == 2
+    assert metrics.maxCascadeDepth == 2
+    assert metrics.transitions == {('green', 'yellow'): 1, ('yellow', 'red'): 1}
+
+
+def test_fysom_global_canceled():
+    class Model(FysomGlobalMixin, object):
+        GSM = FysomGlobal(events=[('warn', 'green', 'yellow')], initial='green',
+                          state_field='state', callbacks={'onbeforewarn': lambda e: False})
+
+        def __init__(self):
+            self.state = None
+            super(Model, self).__init__()
+
+    obj = Model()
+    metrics = Model.GSM.metrics = TransitionMetrics()
+    with pytest.raises(Canceled):
+        obj.warn()
+    assert metrics.canceled == 1
+    assert metrics.processed == 0
+
+
+def test_export(tmpdir):
+    metrics = TransitionMetrics()
+    metrics.transition('a', 'b"')
+    metrics.eventProcessed()
+    data = metrics.asDict()
+    assert data['events']['processed'] == 1
+    assert data['transitions'] == [{'src': 'a', 'dst': 'b"', 'count': 1}]
+
+    path = os.path.join(str(tmpdir), 'fsm.prom')
+    metrics.writeOpenMetrics(path)
+    with open(path) as fd:
+        text = fd.read()
+    assert 'fsm_events_total{result="processed"} 1\n' in text
+    assert 'fsm_transitions_total{src="a",dst="b\\""} 1\n' in text
+    assert text.endswith('# EOF\n')
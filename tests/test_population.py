@@ -0,0 +1,140 @@
+# coding=utf-8
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from fsm.FSM import FSM, FSMConfigError, FSMError  # noqa: E402
+from fsm.Population import Population  # noqa: E402
+
+CONFIG = {
+    'initial': {'state': 'patrol'},
+    'transitions': [
+        {'src': 'patrol', 'dst': 'chase', 'condition': 'ctx.distance < 10 and ctx.hp >= 30'},
+        {'src': ['patrol', 'chase'], 'dst': 'flee', 'condition': 'ctx.hp < 30', 'priority': 1},
+        {'src': 'flee', 'dst': 'patrol', 'event': 'evHealed'},
+    ],
+}
+
+
+def make_population():
+    return Population(CONFIG, {
+        'hp': numpy.array([100, 20, 100, 50]),
+        'distance': numpy.array([5.0, 5.0, 50.0, 1.0]),
+    })
+
+
+def test_update_applies_transitions_together():
+    population = make_population()
+    assert population.update() == 3
+    assert [population.getState(i) for i in range(4)] == ['chase', 'flee', 'patrol', 'chase']
+    assert sorted((src, dst, list(indices)) for src, dst, indices in population.lastTransitions()) == [
+        ('patrol', 'chase', [0, 3]),
+        ('patrol', 'flee', [1]),
+    ]
+
+
+def test_matches_per_object_fsm():
+    rng = numpy.random.RandomState(3)
+    hp = rng.randint(0, 100, 200)
+    distance = rng.uniform(0, 20, 200)
+    population = Population(CONFIG, {'hp': hp, 'distance': distance})
+
+    class Ctx(object):
+        pass
+
+    machines = []
+    contexts = []
+    for i in range(200):
+        ctx = Ctx()
+        ctx.hp, ctx.distance = int(hp[i]), float(distance[i])
+        contexts.append(ctx)
+        machines.append(FSM(dict(CONFIG, context=ctx)))
+
+    for _ in range(3):
+        population.update()
+        for fsm in machines:
+            fsm.update(0)  # one cascade step per tick as long as one guard holds
+        hp -= 10
+        for ctx, value in zip(contexts, hp):
+            ctx.hp = int(value)
+        population.ctx.hp = hp
+
+    assert [population.getState(i) for i in range(200)] == [fsm.getCurrentState() for fsm in machines]
+
+
+def test_truth_of_int_columns_matches_fsm():
+    config = {
+        'initial': {'state': 'alive'},
+        'transitions': [
+            {'src': 'alive', 'dst': 'dead', 'condition': 'not ctx.hp', 'priority': 2},
+            {'src': 'alive', 'dst': 'attack', 'condition': 'ctx.ammo and ctx.hp', 'priority': 1},
+            {'src': 'alive', 'dst': 'idle', 'condition': 'ctx.ammo or ctx.hp'},
+        ],
+    }
+    hp = numpy.array([0, 1, 5, 0, 3])
+    ammo = numpy.array([2, 3, 0, 0, 4])
+    population = Population(config, {'hp': hp, 'ammo': ammo})
+
+    class Ctx(object):
+        def __init__(self, hp, ammo):
+            self.hp, self.ammo = hp, ammo
+
+    machines = [FSM(dict(config, context=Ctx(int(h), int(a)))) for h, a in zip(hp, ammo)]
+    population.update()
+    for fsm in machines:
+        fsm.update(0)
+    assert [population.getState(i) for i in range(5)] == [fsm.getCurrentState() for fsm in machines]
+    assert [population.getState(i) for i in range(5)] == ['dead', 'attack', 'idle', 'dead', 'attack']
+
+
+def test_one_step_per_tick():
+    config = {
+        'initial': {'state': 'a'},
+        'transitions': [
+            {'src': 'a', 'dst': 'b', 'condition': 'ctx.x > 0'},
+            {'src': 'b', 'dst': 'c', 'condition': 'ctx.x > 0'},
+        ],
+    }
+    population = Population(config, {'x': numpy.array([1, 0])})
+
+    class Ctx(object):
+        x = 1
+
+    fsm = FSM(dict(config, context=Ctx()))
+    fsm.update(0)
+    assert fsm.getCurrentState() == 'c'  # FSM cascades within the tick
+
+    assert population.update() == 1
+    assert [population.getState(i) for i in range(2)] == ['b', 'a']
+    assert population.update() == 1
+    assert [population.getState(i) for i in range(2)] == ['c', 'a']
+    assert population.update() == 0
+
+
+def test_events():
+    population = make_population()
+    population.update()
+    population.ctx.hp[:] = 100
+    assert population.addEvent('evHealed') == 1
+    assert population.count('patrol') == 2
+    assert population.addEvent('evHealed', [0, 1]) == 0
+    with pytest.raises(FSMError):
+        population.addEvent('evUnknown')
+
+
+def test_batch_conditions():
+    population = Population({
+        'initial': {'state': 'idle'},
+        'transitions': [{'src': 'idle', 'dst': 'busy', 'condition': 'hasWork'}],
+        'conditions': {'hasWork': lambda ctx: ctx.jobs > 0},
+    }, {'jobs': numpy.array([0, 3, 1])})
+    population.update()
+    assert list(population.members('busy')) == [1, 2]
+
+
+def test_invalid_config():
+    with pytest.raises(FSMConfigError):
+        Population({'initial': {'state': 'a'}, 'transitions': [{'src': 'a', 'dst': 'b', 'condition': 'missing'}]},
+                   {'hp': numpy.zeros(3)})
+    with pytest.raises(FSMConfigError):
+        Population(CONFIG, {'hp': numpy.zeros(3), 'distance': numpy.zeros(4)})
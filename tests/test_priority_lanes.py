@@ -0,0 +1,110 @@
+# coding=utf-8
+import pytest
+
+from fsm.FSM import FSM, FSMConfigError, FSMState
+from fsm.TransitionMetrics import TransitionMetrics
+
+
+class Recorder(FSMState):
+    def __init__(self, name, log):
+        super(Recorder, self).__init__(name)
+        self.log = log
+
+    def enter(self, prevState, eventData):
+        self.log.append(eventData)
+
+    def reenter(self, eventData):
+        self.log.append(eventData)
+
+
+class Burst(FSMState):
+    '''
+        Queues a batch of events from a hook, so they are processed together.
+    '''
+
+    def __init__(self, name, events):
+        super(Burst, self).__init__(name)
+        self.events = events
+
+    def enter(self, prevState, eventData):
+        for eventName, data in self.events:
+            self.addEvent(eventName, data)
+
+
+CONFIG = {
+    'initial': {'state': 'idle'},
+    'transitions': [
+        {'src': 'idle', 'dst': 'burst', 'event': 'evStart'},
+        {'src': '*', 'dst': 'work', 'event': 'evWork'},
+        {'src': '*', 'dst': 'alarm', 'event': 'evAlarm'},
+        {'src': '*', 'dst': 'telemetry', 'event': 'evTelemetry'},
+    ],
+}
+
+
+@pytest.fixture()
+def log():
+    return []
+
+
+@pytest.fixture()
+def recorders(log):
+    return [Recorder('work', log), Recorder('alarm', log), Recorder('telemetry', log)]
+
+
+def test_high_lane_drained_first(log, recorders):
+    events = [('evTelemetry', 't1'), ('evWork', 'w1'), ('evAlarm', 'a1'), ('evWork', 'w2'), ('evAlarm', 'a2')]
+    fsm = FSM(dict(CONFIG, states=[Burst('burst', events)] + recorders,
+                   priorities={'evAlarm': 'high', 'evTelemetry': 'low'}))
+    fsm.addEvent('evStart')
+    assert log == ['a1', 'a2', 'w1', 'w2', 't1']
+
+
+def test_fifo_without_priorities(log, recorders):
+    events = [('evTelemetry', 't1'), ('evWork', 'w1'), ('evAlarm', 'a1')]
+    fsm = FSM(dict(CONFIG, states=[Burst('burst', events)] + recorders))
+    fsm.addEvent('evStart')
+    assert log == ['t1', 'w1', 'a1']
+
+
+def test_starvation_limit(log, recorders):
+    events = [('evTelemetry', 't1')] + [('evAlarm', 'a{}'.format(i)) for i in range(5)]
+    fsm = FSM(dict(CONFIG, states=[Burst('burst', events)] + recorders,
+                   priorities={'evAlarm': 'high', 'evTelemetry': 'low'}, starvationLimit=2))
+    fsm.addEvent('evStart')
+    assert log == ['a0', 'a1', 't1', 'a2', 'a3', 'a4']
+
+
+def test_coalescing_inside_lane(log, recorders):
+    events = [('evAlarm', 'a1'), ('evWork', 'w1'), ('evAlarm', 'a2')]
+    fsm = FSM(dict(CONFIG, states=[Burst('burst', events)] + recorders,
+                   priorities={'evAlarm': 'high'}, coalesce={'evAlarm': 'keep-latest'}))
+    fsm.addEvent('evStart')
+    assert log == ['a2', 'w1']
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    # machines count their initial event, so metrics are set before they are built
+    metrics = TransitionMetrics()
+    monkeypatch.setattr(FSM, 'metrics', metrics)
+    return metrics
+
+
+def test_lane_metrics(metrics, recorders):
+    events = [('evWork', 'w1'), ('evAlarm', 'a1'), ('evAlarm', 'a2')]
+    fsm = FSM(dict(CONFIG, states=[Burst('burst', events)] + recorders, priorities={'evAlarm': 'high'}))
+    fsm.addEvent('evStart')
+
+    lanes = metrics.asDict()['lanes']
+    assert lanes['high']['max_depth'] == 2
+    assert lanes['high']['events'] == 2
+    assert lanes['high']['depth'] == 0
+    assert lanes['normal']['events'] == 3  # initial event, evStart and evWork
+    assert 'fsm_lane_max_depth{lane="high"} 2' in metrics.toOpenMetrics()
+
+
+@pytest.mark.parametrize('priorities', [{'evAlarm': 'urgent'}, {'evUnknown': 'high'}])
+def test_invalid_priorities(priorities):
+    with pytest.raises(FSMConfigError):
+        FSM(dict(CONFIG, priorities=priorities))
@@ -0,0 +1,82 @@
+# coding=utf-8
+import time
+
+import pytest
+
+from fsm.FSM import FSM, FSMState, Fysom
+from fsm.HookProfiler import HookProfiler, LatencyHistogram
+
+
+class Slow(FSMState):
+    def enter(self, prevState, eventData):
+        time.sleep(0.002)
+
+
+CONFIG = {
+    'name': 'traffic',
+    'initial': {'state': 'green'},
+    'transitions': [
+        {'event': 'warn', 'src': 'green', 'dst': 'yellow'},
+        {'event': 'clear', 'src': 'yellow', 'dst': 'green'},
+    ],
+}
+
+
+@pytest.fixture()
+def fsm():
+    return FSM(dict(CONFIG, states=[Slow('yellow')]))
+
+
+def test_fsm_hooks_are_profiled(fsm):
+    profiler = fsm.profiler = HookProfiler()
+    fsm.addEvent('warn')
+    fsm.update(0.1)
+    fsm.addEvent('clear')
+
+    top = profiler.top(1)[0]
+    assert (top['definition'], top['state'], top['hook']) == ('traffic', 'yellow', 'enter')
+    assert top['max'] >= 2000000
+    assert profiler.histogram('traffic', 'yellow', 'update').count == 1
+    assert profiler.histogram('traffic', 'yellow', 'leave').count == 1
+    assert 'yellow' in profiler.report()
+
+
+def test_sampling(fsm):
+    profiler = fsm.profiler = HookProfiler(sampleEvery=4, seed=1)
+    for _ in range(400):
+        fsm.update(0.1)
+    assert 60 < profiler.histogram('traffic', 'green', 'update').count < 140
+
+
+def test_sampling_covers_every_hook():
+    fsm = FSM(CONFIG)
+    profiler = fsm.profiler = HookProfiler(sampleEvery=2, seed=1)
+    for _ in range(200):
+        fsm.addEvent('warn')
+        fsm.addEvent('clear')
+
+    counts = {(state, hook): profiler.histogram('traffic', state, hook).count
+              for state, hook in [('green', 'leave'), ('yellow', 'enter'), ('yellow', 'leave'), ('green', 'enter')]}
+    assert all(60 < count < 140 for count in counts.values()), counts
+    # hooks of one event are sampled together
+    assert counts[('green', 'leave')] == counts[('yellow', 'enter')]
+
+
+def test_fysom_callbacks_are_profiled():
+    profiler = HookProfiler()
+    fsm = Fysom({'name': 'light', 'initial': 'green', 'events': [('warn', 'green', 'yellow')],
+                 'callbacks': {'onyellow': lambda e: None, 'onleavegreen': lambda e: True}})
+    fsm.profiler = profiler
+    fsm.warn()
+    assert fsm.current == 'yellow'
+    assert profiler.histogram('light', 'yellow', 'onyellow').count == 1
+    assert profiler.histogram('light', 'green', 'onleavegreen').count == 1
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for value in range(1, 1001):
+        histogram.record(value * 1000)
+    assert histogram.percentile(50) == pytest.approx(500000, rel=0.07)
+    assert histogram.percentile(99) == pytest.approx(990000, rel=0.07)
+    assert histogram.percentile(100) == 1000000
@@ -0,0 +1,69 @@
+# coding=utf-8
+import pytest
+
+from fsm.FSM import FSM, FSMError, FSMState, STATE_EVENT_ONLY, STATE_FINAL, STATE_POLLING
+
+
+class Ticking(FSMState):
+    def update(self, dt):
+        pass
+
+
+class Guard(object):
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return False
+
+
+CONFIG = {
+    'initial': {'state': 'idle'},
+    'transitions': [
+        {'src': 'idle', 'dst': 'watch', 'event': 'evWatch'},
+        {'src': 'watch', 'dst': 'alarm', 'condition': 'intruder'},
+        {'src': ['watch', 'alarm'], 'dst': 'off', 'event': 'evOff'},
+    ],
+    'final': 'off',
+}
+
+
+@pytest.fixture()
+def guard():
+    return Guard()
+
+
+def test_state_kinds(guard):
+    fsm = FSM(dict(CONFIG, conditions={'intruder': guard}))
+    assert fsm.getStateKind() == STATE_EVENT_ONLY
+    assert fsm.getStateKind('watch') == STATE_POLLING
+    assert fsm.getStateKind('off') == STATE_FINAL
+    with pytest.raises(FSMError):
+        fsm.getStateKind('unknown')
+
+
+def test_quiescent_machine(guard):
+    fsm = FSM(dict(CONFIG, conditions={'intruder': guard}))
+    assert fsm.isQuiescent()
+    fsm.update(0)
+    assert guard.calls == 0
+
+    fsm.addEvent('evWatch')
+    assert not fsm.isQuiescent()
+    fsm.update(0)
+    assert guard.calls == 1
+
+    fsm.addEvent('evOff')
+    assert fsm.isQuiescent()
+
+
+def test_update_hook_and_timers_prevent_quiescence(guard):
+    fsm = FSM(dict(CONFIG, conditions={'intruder': guard}, states=[Ticking('idle')]))
+    assert not fsm.isQuiescent()
+
+    fsm = FSM(dict(CONFIG, conditions={'intruder': guard}))
+    handle = fsm.addEventAfter(1.0, 'evWatch')
+    assert not fsm.isQuiescent()
+    handle.cancel()
+    assert fsm.isQuiescent()
@@ -0,0 +1,124 @@
+# coding=utf-8
+import pytest
+
+from fsm.EventScheduler import EventScheduler
+from fsm.FSM import FSM, FSMError
+from fsm.TransitionMetrics import TransitionMetrics
+
+
+CONFIG = {
+    'initial': {'state': 'reload'},
+    'transitions': [
+        {'src': 'reload', 'dst': 'ready', 'event': 'evReloaded'},
+        {'src': 'ready', 'dst': 'reload', 'event': 'evFire'},
+        {'src': 'ready', 'dst': 'dead', 'event': 'evDie'},
+    ],
+    'final': 'dead',
+}
+
+
+def test_add_event_after():
+    fsm = FSM(CONFIG)
+    fsm.addEventAfter(1.0, 'evReloaded')
+    fsm.update(0.5)
+    assert fsm.getCurrentState() == 'reload'
+    fsm.update(0.5)
+    assert fsm.getCurrentState() == 'ready'
+
+
+def test_cancel_handle():
+    fsm = FSM(CONFIG)
+    handle = fsm.addEventAfter(1.0, 'evReloaded')
+    handle.cancel()
+    fsm.update(2.0)
+    assert fsm.getCurrentState() == 'reload'
+
+
+def test_events_fire_in_due_order():
+    fsm = FSM(CONFIG)
+    fsm.addEventAt(2.0, 'evFire')
+    fsm.addEventAt(1.0, 'evReloaded')
+    fsm.update(3.0)
+    assert fsm.getCurrentState() == 'reload'
+
+
+def test_shared_scheduler():
+    scheduler = EventScheduler()
+    machines = [FSM(dict(CONFIG, scheduler=scheduler)) for _ in range(3)]
+    for delay, fsm in enumerate(machines):
+        fsm.addEventAfter(delay, 'evReloaded')
+    for fsm in machines:
+        fsm.update(10.0)  # doesn't advance a shared scheduler
+    assert len(scheduler) == 3
+
+    assert scheduler.advance(1.0) == 2
+    assert [fsm.getCurrentState() for fsm in machines] == ['ready', 'ready', 'reload']
+    assert scheduler.nextDue == 2.0
+
+
+def test_timers_cancelled_on_finish():
+    scheduler = EventScheduler()
+    fsm = FSM(dict(CONFIG, scheduler=scheduler))
+    fsm.addEvent('evReloaded')
+    fsm.addEventAfter(1.0, 'evFire')
+    fsm.addEvent('evDie')
+    assert fsm.isFinished()
+    assert len(scheduler) == 0
+
+
+def test_timers_cancelled_on_fini():
+    scheduler = EventScheduler()
+    fsm = FSM(dict(CONFIG, scheduler=scheduler))
+    fsm.addEventAfter(1.0, 'evReloaded')
+    fsm.fini()
+    assert len(scheduler) == 0
+    assert scheduler.advance(1.0) == 0
+
+
+def test_unknown_event():
+    fsm = FSM(CONFIG)
+    with pytest.raises(FSMError):
+        fsm.addEventAfter(1.0, 'evUnknown')
+
+
+def test_callbacks_scheduled_while_firing_wait():
+    scheduler = EventScheduler()
+    calls = []
+
+    def tick():
+        calls.append(scheduler.now)
+        scheduler.callLater(0, tick)
+
+    scheduler.callLater(0, tick)
+    scheduler.advance(1.0)
+    scheduler.advance(1.0)
+    assert calls == [1.0, 2.0]
+
+
+def test_cancel_many_timers_from_callback():
+    # e.g. machines on a shared scheduler finishing inside a timer callback
+    scheduler = EventScheduler()
+    fired = []
+    scheduler.callAt(1.0, lambda: [handle.cancel() for handle in others])
+    others = [scheduler.callAt(1.0, fired.append, i) for i in range(100)]
+    scheduler.callAt(1.0, fired.append, 'due')
+    scheduler.callAt(2.0, fired.append, 'later')
+    assert scheduler.advance(1.0) == 2
+    assert fired == ['due']
+    assert len(scheduler) == 1
+    assert scheduler.advance(1.0) == 1
+    assert fired == ['due', 'later']
+    assert len(scheduler) == 0
+
+
+def test_rejected_event_doesnt_stop_shared_scheduler(monkeypatch):
+    metrics = TransitionMetrics()
+    monkeypatch.setattr(FSM, 'metrics', metrics)
+    scheduler = EventScheduler()
+    first, second = FSM(dict(CONFIG, scheduler=scheduler)), FSM(dict(CONFIG, scheduler=scheduler))
+    first.addEventAfter(1.0, 'evFire')  # only accepted in 'ready'
+    second.addEventAfter(1.0, 'evReloaded')
+    assert scheduler.advance(1.0) == 2
+    assert first.getCurrentState() == 'reload'
+    assert second.getCurrentState() == 'ready'
+    assert metrics.rejected == 1
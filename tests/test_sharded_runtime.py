@@ -0,0 +1,183 @@
+# coding=utf-8
+import pickle
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from fsm.FSM import FSM, FSMError, FSMState
+from fsm.ShardedRuntime import HashRing, ShardedRuntime
+
+
+def make_fsm(key):
+    return FSM({
+        'initial': {'state': 'green'},
+        'transitions': [
+            {'event': 'warn', 'src': 'green', 'dst': 'yellow'},
+            {'event': 'panic', 'src': 'yellow', 'dst': 'red'},
+        ]
+    })
+
+
+class Broken(FSMState):
+    def enter(self, prevState, eventData):
+        raise RuntimeError('broken hook')
+
+
+def make_broken_fsm(key):
+    return FSM({
+        'initial': {'state': 'green'},
+        'transitions': [
+            {'event': 'warn', 'src': 'green', 'dst': 'yellow'},
+            {'event': 'break', 'src': 'green', 'dst': 'broken'},
+        ],
+        'states': [Broken('broken')],
+    })
+
+
+def wait_changes(runtime, count, timeout=10.0):
+    changes = []
+    deadline = time.time() + timeout
+    while len(changes) < count and time.time() < deadline:
+        changes.extend(runtime.poll())
+        time.sleep(0.01)
+    return changes
+
+
+def test_hash_ring_moves_few_keys():
+    ring = HashRing(['a', 'b', 'c'])
+    before = {key: ring.nodeFor(key) for key in range(1000)}
+    ring.add('d')
+    moved = [key for key in before if ring.nodeFor(key) != before[key]]
+    assert all(ring.nodeFor(key) == 'd' for key in moved)
+    assert 100 < len(moved) < 450
+
+
+def test_events_are_routed_and_changes_streamed():
+    with ShardedRuntime(make_fsm, workers=2, batchSize=4) as runtime:
+        keys = list(range(10))
+        runtime.spawn(keys)
+        for key in keys:
+            runtime.addEvent(key, 'warn')
+        runtime.addEvent(3, 'panic')
+        runtime.addEvent(4, 'warn')
+        runtime.flush()
+        changes = wait_changes(runtime, 11)
+        assert sorted(changes) == sorted([(key, 'green', 'yellow') for key in keys] + [(3, 'yellow', 'red')])
+        assert [(key, event) for key, event, _ in runtime.errors()] == [(4, 'warn')]
+
+
+def test_many_events_without_polling():
+    # the replies overflow the pipe buffer long before poll() is called
+    with ShardedRuntime(make_fsm, workers=1) as runtime:
+        keys = list(range(5000))
+        runtime.spawn(keys)
+        for _ in range(6):
+            for key in keys:
+                runtime.addEvent(key, 'warn')
+        runtime.flush()
+        assert len(wait_changes(runtime, 5000)) == 5000
+        deadline = time.time() + 10.0
+        errors = []
+        while len(errors) < 25000 and time.time() < deadline:
+            errors.extend(runtime.errors())
+            time.sleep(0.01)
+        assert len(errors) == 25000
+
+
+def test_add_worker_moves_machines_with_state():
+    with ShardedRuntime(make_fsm, workers=2) as runtime:
+        keys = list(range(50))
+        runtime.spawn(keys)
+        for key in keys:
+            runtime.addEvent(key, 'warn')
+        runtime.flush()
+        assert len(wait_changes(runtime, 50)) == 50
+
+        moved = runtime.addWorker()
+        assert 0 < moved < 50
+        assert len(runtime.workers) == 3
+        newWorker = runtime.workers[-1]
+        movedKeys = [key for key in keys if runtime.ownerOf(key) == newWorker]
+        assert len(movedKeys) == moved
+
+        for key in movedKeys:
+            runtime.addEvent(key, 'panic')
+        runtime.flush()
+        changes = wait_changes(runtime, moved)
+        assert sorted(changes) == [(key, 'yellow', 'red') for key in movedKeys]
+
+
+def test_hook_exceptions_are_reported():
+    with ShardedRuntime(make_broken_fsm, workers=1) as runtime:
+        runtime.spawn([1, 2])
+        runtime.addEvent(1, 'break')
+        runtime.addEvent(2, 'warn')
+        runtime.flush()
+        assert wait_changes(runtime, 2) == [(1, 'green', 'broken'), (2, 'green', 'yellow')]
+        assert runtime.errors() == [(1, 'break', 'RuntimeError: broken hook')]
+
+
+def make_deferring_fsm():
+    return FSM({
+        'initial': {'state': 'green'},
+        'transitions': [
+            {'event': 'warn', 'src': 'green', 'dst': 'yellow'},
+            {'event': 'panic', 'src': 'yellow', 'dst': 'red'},
+        ],
+        'deferred': {'green': ['panic']},
+    })
+
+
+def test_snapshot_keeps_pending_events():
+    fsm = make_deferring_fsm()
+    fsm.addEvent('panic')
+    fsm.addEventAfter(2.0, 'warn')
+    fsm.update(0.5)
+    snapshot = pickle.loads(pickle.dumps(fsm.getSnapshot()))
+    fsm.fini()
+
+    restored = make_deferring_fsm()
+    restored.restoreSnapshot(snapshot)
+    assert restored.deferredEvents == ['panic']
+    restored.update(1.0)
+    assert restored.getCurrentState() == 'green'
+    restored.update(0.5)
+    assert restored.getCurrentState() == 'red'
+
+
+def test_snapshot_refuses_running_actions():
+    class Loading(FSMState):
+        def runAction(self, eventData):
+            return 1
+
+    class Never(object):
+        def submit(self, fn, *args):
+            return Future()
+
+    fsm = FSM({
+        'initial': {'state': 'loading'},
+        'transitions': [],
+        'states': [Loading('loading')],
+        'executor': Never(),
+    })
+    with pytest.raises(FSMError):
+        fsm.getSnapshot()
+
+
+def test_snapshot_skips_fired_timers():
+    fsm = make_deferring_fsm()
+    fired = fsm.addEventAfter(1.0, 'warn')  # the caller keeps the handle
+    fsm.update(1.0)
+    assert fsm.getCurrentState() == 'yellow'
+    assert fired.args is None
+    assert fsm.getSnapshot() == ('yellow', {})
+
+
+def test_snapshot_timers_with_same_due_time():
+    fsm = make_deferring_fsm()
+    fsm.addEventAfter(1.0, 'warn', {'first': 1})
+    fsm.addEventAfter(1.0, 'panic', {'second': 2})
+    _, _, pending = fsm.getSnapshot()
+    assert sorted(pending['timers'], key=lambda timer: timer[1]) == [
+        (1.0, 'panic', {'second': 2}), (1.0, 'warn', {'first': 1})]
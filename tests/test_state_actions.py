@@ -0,0 +1,94 @@
+# coding=utf-8
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from fsm.FSM import FSM, FSMConfigError, FSMState
+
+
+class Loading(FSMState):
+    actionDoneEvent = 'evLoaded'
+    actionFailedEvent = 'evFailed'
+
+    def __init__(self, name, release, fail=False):
+        super(Loading, self).__init__(name)
+        self.release = release
+        self.fail = fail
+
+    def runAction(self, eventData):
+        self.release.wait(5)
+        if self.fail:
+            raise ValueError('broken')
+        return eventData.get('what')
+
+
+class Ready(FSMState):
+    def enter(self, prevState, eventData):
+        self.eventData = eventData
+
+
+CONFIG = {
+    'initial': {'state': 'idle'},
+    'transitions': [
+        {'event': 'evLoad', 'src': 'idle', 'dst': 'loading'},
+        {'event': 'evLoaded', 'src': 'loading', 'dst': 'ready'},
+        {'event': 'evFailed', 'src': 'loading', 'dst': 'idle'},
+        {'event': 'evAbort', 'src': 'loading', 'dst': 'idle'},
+    ],
+}
+
+
+def wait_state(fsm, state, timeout=5.0):
+    deadline = time.time() + timeout
+    while fsm.getCurrentState() != state and time.time() < deadline:
+        fsm.update(0.0)
+        time.sleep(0.005)
+    return fsm.getCurrentState()
+
+
+@pytest.fixture()
+def executor():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        yield executor
+
+
+@pytest.fixture()
+def release():
+    return threading.Event()
+
+
+def test_action_does_not_block_and_posts_completion(executor, release):
+    ready = Ready('ready')
+    fsm = FSM(dict(CONFIG, states=[Loading('loading', release), ready], executor=executor))
+    fsm.addEvent('evLoad', {'what': 'map'})
+    assert fsm.getCurrentState() == 'loading'
+    fsm.update(0.0)
+    assert fsm.getCurrentState() == 'loading'
+
+    release.set()
+    assert wait_state(fsm, 'ready') == 'ready'
+    assert ready.eventData == {'result': 'map'}
+
+
+def test_action_failure_posts_failure_event(executor, release):
+    release.set()
+    fsm = FSM(dict(CONFIG, states=[Loading('loading', release, fail=True)], executor=executor))
+    fsm.addEvent('evLoad')
+    assert wait_state(fsm, 'idle') == 'idle'
+
+
+def test_stale_completion_is_dropped(executor, release):
+    fsm = FSM(dict(CONFIG, states=[Loading('loading', release)], executor=executor))
+    fsm.addEvent('evLoad')
+    fsm.addEvent('evAbort')
+    release.set()
+    time.sleep(0.05)
+    fsm.update(0.0)
+    assert fsm.getCurrentState() == 'idle'
+
+
+def test_executor_required(release):
+    with pytest.raises(FSMConfigError):
+        FSM(dict(CONFIG, states=[Loading('loading', release)], executor=None))
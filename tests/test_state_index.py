@@ -0,0 +1,46 @@
+# coding=utf-8
+import gc
+
+from fsm.FSM import FSM, StateIndex
+
+CONFIG = {
+    'initial': {'state': 'green'},
+    'transitions': [
+        {'event': 'warn', 'src': 'green', 'dst': 'yellow'},
+        {'event': 'panic', 'src': 'yellow', 'dst': 'red'},
+        {'event': 'clear', 'src': 'yellow', 'dst': 'green'},
+    ]
+}
+
+
+def test_index_follows_transitions():
+    index = StateIndex()
+    machines = [FSM(CONFIG) for _ in range(3)]
+    for fsm in machines:
+        fsm.setIndex(index)
+    assert index.count('green') == 3
+
+    machines[0].addEvent('warn')
+    machines[1].addEvent('warn')
+    machines[1].addEvent('panic')
+    assert index.members('green') == frozenset([machines[2]])
+    assert index.members('yellow') == frozenset([machines[0]])
+    assert index.count('red') == 1
+    assert index.count('unknown') == 0
+
+
+def test_fini_removes_machine_from_index():
+    index = StateIndex()
+    fsm = FSM(CONFIG)
+    fsm.setIndex(index)
+    fsm.fini()
+    assert index.count('green') == 0
+
+
+def test_index_does_not_keep_machines_alive():
+    index = StateIndex()
+    fsm = FSM(CONFIG)
+    fsm.setIndex(index)
+    del fsm
+    gc.collect()
+    assert index.count('green') == 0
@@ -0,0 +1,80 @@
+# coding=utf-8
+import pytest
+
+from fsm.FSM import FSM, FSMError, FSMState
+
+CONFIG = {
+    'initial': {'state': 'prepare'},
+    'transitions': [
+        {'src': 'prepare', 'dst': 'fly', 'event': 'evFly'},
+        {'src': 'fly', 'dst': 'attack', 'event': 'evAttack'},
+        {'src': 'attack', 'dst': 'fly', 'condition': 'done'},
+    ],
+}
+
+
+def make(done=False):
+    flags = {'done': done}
+    fsm = FSM(dict(CONFIG, conditions={'done': lambda: flags['done']}))
+    fsm.addEvent('evFly')  # leaves the init state
+    return fsm, flags
+
+
+def test_edge_listener_gets_state_names():
+    fsm, flags = make()
+    calls = []
+    fsm.addCallback('fly', 'attack', lambda src, dst: calls.append((src, dst)))
+    fsm.addEvent('evAttack')
+    flags['done'] = True
+    fsm.update(0)
+    assert fsm.getCurrentState() == 'fly'
+    assert calls == [('fly', 'attack')]
+
+
+def test_wildcard_listeners_and_order():
+    fsm, flags = make()
+    calls = []
+    fsm.addCallback('*', '*', lambda src, dst: calls.append(('any', src, dst)))
+    fsm.addCallback('attack', '*', lambda src, dst: calls.append(('from', src, dst)))
+    fsm.addCallback('*', 'fly', lambda src, dst: calls.append(('to', src, dst)))
+    fsm.addCallback('attack', 'fly', lambda src, dst: calls.append(('edge', src, dst)))
+    fsm.addEvent('evAttack')
+    assert calls == [('any', 'fly', 'attack')]
+    del calls[:]
+    flags['done'] = True
+    fsm.update(0)
+    assert calls == [('edge', 'attack', 'fly'), ('to', 'attack', 'fly'),
+                     ('from', 'attack', 'fly'), ('any', 'attack', 'fly')]
+
+
+def test_remove_listener():
+    fsm, _ = make()
+    calls = []
+    listener = lambda src, dst: calls.append(dst)  # noqa: E731
+    fsm.addCallback('*', 'attack', listener)
+    fsm.addCallback('*', 'attack', listener)
+    fsm.removeCallback('*', 'attack', listener)
+    fsm.addEvent('evAttack')
+    assert calls == []
+
+
+def test_unknown_state():
+    fsm, _ = make()
+    with pytest.raises(FSMError):
+        fsm.addCallback('fly', 'land', lambda src, dst: None)
+
+
+def test_shared_state_objects_keep_listeners_apart():
+    prepare, fly = FSMState('prepare'), FSMState('fly')
+    config = {
+        'initial': {'state': 'prepare'},
+        'states': [prepare, fly],
+        'transitions': [{'src': 'prepare', 'dst': 'fly', 'event': 'evFly'}],
+    }
+    first, second = FSM(config), FSM(config)
+    calls = []
+    first.addCallback('prepare', 'fly', lambda src, dst: calls.append('first'))
+    second.addEvent('evFly')
+    assert calls == []
+    first.addEvent('evFly')
+    assert calls == ['first']
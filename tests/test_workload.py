@@ -0,0 +1,40 @@
+# coding=utf-8
+import pytest
+
+from benchmarks.workload import generateConfig, generateEvents, makeConditions
+from fsm.FSM import FSM
+from fsm.TransitionMetrics import TransitionMetrics
+
+
+@pytest.mark.parametrize('distribution, probability', [('uniform', 0), ('zipf', 0), ('cascade', 1)])
+def test_stream_replays_without_rejections(distribution, probability):
+    config = generateConfig(200, 12, wildcardFraction=0.2, conditionFraction=0.3, fanOut=4, seed=7)
+    fsm = FSM(dict(config, conditions=makeConditions(config, probability)))
+    for event in generateEvents(config, 2000, distribution, seed=3):
+        fsm.addEvent(event)
+        fsm.update(0.1)
+
+
+def test_cascade_stream_fires_condition_chains(monkeypatch):
+    config = generateConfig(200, 12, conditionFraction=0.5, fanOut=4, seed=7)
+    metrics = TransitionMetrics()
+    monkeypatch.setattr(FSM, 'metrics', metrics)
+    fsm = FSM(dict(config, conditions=makeConditions(config, probability=1)))
+    for event in generateEvents(config, 200, 'cascade', seed=3):
+        fsm.addEvent(event)
+        fsm.update(0.1)
+    assert metrics.maxCascadeDepth >= 3
+
+
+def test_generation_is_deterministic():
+    assert generateConfig(50, 5, 0.2, 0.5, 3, seed=1) == generateConfig(50, 5, 0.2, 0.5, 3, seed=1)
+    config = generateConfig(50, 5, seed=1)
+    assert generateEvents(config, 100, 'zipf', seed=2) == generateEvents(config, 100, 'zipf', seed=2)
+
+
+def test_config_shape():
+    config = generateConfig(100, 10, wildcardFraction=0.2, conditionFraction=0.5, fanOut=3, seed=0)
+    transitions = config['transitions']
+    assert len([t for t in transitions if t['src'] == '*']) == 2
+    assert any('condition' in t for t in transitions)
+    assert len({t['src'] for t in transitions if t['src'] != '*'}) == 100
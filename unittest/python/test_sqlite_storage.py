@@ -0,0 +1,117 @@
+# coding=utf-8
+#
+# fysom - pYthOn Finite State Machine - this is a port of Jake
+#         Gordon's javascript-state-machine to python
+#         https://github.com/jakesgordon/javascript-state-machine
+#
+# Copyright (C) 2011 Mansour Behabadi <mansour@oxplot.com>, Jake Gordon
+#                                        and other contributors
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from fsm.FSM import FysomError, FysomGlobal, FysomGlobalMixin
+from fsm.SQLiteStateStorage import SQLiteStateStorage
+
+
+class SQLiteStateStorageTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'states.db')
+        self.storage = SQLiteStateStorage(self.path, flush_interval=60000, flush_every=3)
+        self.GSM = FysomGlobal(
+            events=[('warn', 'green', 'yellow'),
+                    ('panic', 'yellow', 'red'),
+                    ('clear', 'yellow', 'green')],
+            initial='green',
+            state_field='state',
+            storage=self.storage
+        )
+
+        class Model(FysomGlobalMixin, object):
+            GSM = self.GSM
+
+            def __init__(self, id):
+                self.id = id
+                self.state = None
+                super(Model, self).__init__()
+
+        self.Model = Model
+
+    def tearDown(self):
+        self.storage.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_changes_are_buffered_until_threshold(self):
+        obj = self.Model(1)
+        self.assertEqual(self.storage.pending, 1)
+        obj.warn()
+        self.assertEqual(self.storage.pending, 1)
+        self.Model(2)
+        self.assertEqual(self.storage.pending, 2)
+        self.Model(3)
+        self.assertEqual(self.storage.pending, 0)
+        self.assertEqual(self.storage.get(1), 'yellow')
+
+    def test_flush_by_interval(self):
+        self.storage.flush_interval = 0
+        self.Model(1)
+        self.assertEqual(self.storage.pending, 0)
+
+    def test_rehydrate(self):
+        first = self.Model(1)
+        second = self.Model(2)
+        second.warn()
+        second.panic()
+        self.storage.close()
+
+        self.storage = SQLiteStateStorage(self.path)
+        self.GSM._storage = self.storage
+        restored = {}
+        for key in (1, 2, 3):
+            obj = self.Model.__new__(self.Model)
+            obj.id, obj.state = key, None
+            restored[key] = obj
+        self.assertEqual(self.GSM.rehydrate(restored), 2)
+        self.assertEqual(restored[1].current, first.current)
+        self.assertEqual(restored[2].current, 'red')
+        self.assertEqual(restored[3].current, 'none')
+
+    def test_rehydrate_without_storage(self):
+        gsm = FysomGlobal(events=[('warn', 'green', 'yellow')], state_field='state')
+        self.assertRaises(FysomError, gsm.rehydrate, {})
+
+    def test_incorrect_table_name(self):
+        self.assertRaises(ValueError, SQLiteStateStorage, self.path, table='states; DROP')
+
+    def test_closed_storage(self):
+        self.storage.close()
+        obj = self.Model.__new__(self.Model)
+        obj.id = 1
+        self.assertRaises(ValueError, self.storage.write, obj, 'green')
+        self.assertRaises(ValueError, self.storage.get, 1)
+        self.storage.close()
@@ -0,0 +1,83 @@
+# coding=utf-8
+#
+# fysom - pYthOn Finite State Machine - this is a port of Jake
+#         Gordon's javascript-state-machine to python
+#         https://github.com/jakesgordon/javascript-state-machine
+#
+# Copyright (C) 2011 Mansour Behabadi <mansour@oxplot.com>, Jake Gordon
+#                                        and other contributors
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+import unittest
+
+from fsm.FSM import FysomError, FysomGlobal, FysomGlobalMixin, StateIndex
+
+
+class FysomGlobalStateIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        class Model(FysomGlobalMixin, object):
+            GSM = FysomGlobal(
+                events=[('warn', 'green', 'yellow'),
+                        ('panic', 'yellow', 'red')],
+                initial='green',
+                state_field='state',
+                index=True
+            )
+
+            def __init__(self):
+                self.state = None
+                super(Model, self).__init__()
+
+        self.Model = Model
+
+    def test_members_and_count(self):
+        models = [self.Model() for _ in range(4)]
+        models[0].warn()
+        models[1].warn()
+        models[1].panic()
+        GSM = self.Model.GSM
+        self.assertEqual(GSM.count('green'), 2)
+        self.assertEqual(GSM.members('yellow'), frozenset([models[0]]))
+        self.assertEqual(GSM.members('red'), frozenset([models[1]]))
+
+    def test_forget(self):
+        obj = self.Model()
+        self.Model.GSM.forget(obj)
+        self.assertEqual(self.Model.GSM.count('green'), 0)
+
+    def test_current_setter_updates_index(self):
+        obj = self.Model()
+        obj.current = 'red'
+        self.assertEqual(self.Model.GSM.count('green'), 0)
+        self.assertEqual(self.Model.GSM.count('red'), 1)
+
+    def test_shared_index(self):
+        index = StateIndex()
+        gsm = FysomGlobal(events=[('warn', 'green', 'yellow')], initial='green',
+                          state_field='state', index=index)
+        self.assertTrue(gsm._index is index)
+
+    def test_queries_without_index(self):
+        gsm = FysomGlobal(events=[('warn', 'green', 'yellow')], state_field='state')
+        self.assertRaises(FysomError, gsm.count, 'green')